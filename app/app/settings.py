@@ -39,13 +39,19 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework.authtoken',
-    'core',
+    'core.apps.CoreConfig',
     'user',
-    'drug'
+    'drug.apps.DrugConfig',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.AdmissionControlMiddleware',
+    'core.middleware.StatementTimeoutMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
+    'core.middleware.ShardRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -87,14 +93,217 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.backends.postgresql_pool',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # Connections are returned to the pool at the end of each
+        # request, so CONN_MAX_AGE stays at 0.
+        'POOL': {
+            'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            'CHECK_AFTER': float(os.environ.get('DB_POOL_CHECK_AFTER', 10)),
+        },
     }
 }
 
+# Read replicas, e.g. DB_REPLICA_HOSTS=db-replica-1,db-replica-2
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    alias = 'replica_%d' % (index + 1)
+    DATABASES[alias] = dict(
+        DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'}
+    )
+    DATABASE_REPLICAS.append(alias)
+
+# Catalog shards, e.g. DB_SHARD_HOSTS=db-shard-1,db-shard-2. The default
+# database always stays a shard and keeps users, tokens and the shard map.
+DATABASE_SHARDS = ['default']
+for index, host in enumerate(
+        filter(None, os.environ.get('DB_SHARD_HOSTS', '').split(','))):
+    alias = 'shard_%d' % (index + 1)
+    DATABASES[alias] = dict(
+        DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'}
+    )
+    DATABASE_SHARDS.append(alias)
+
+# Catalog ids of the n-th shard are allocated from n * span + 1 up to
+# (n + 1) * span, so moved rows never collide (see core.sharding)
+SHARD_ID_SPAN = 100000000
+
+DATABASE_ROUTERS = [
+    'core.routers.ShardRouter',
+    'core.routers.PrimaryReplicaRouter',
+]
+
+# Replica pins, shard assignments, throttle buckets and cached drug
+# lists must be seen by every web and worker process, so deployments
+# set CACHE_HOSTS to a shared memcached. Without it (tests, a single
+# local process) the cache is per process.
+CACHE_HOSTS = list(filter(None, os.environ.get('CACHE_HOSTS', '').split(',')))
+if CACHE_HOSTS:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': CACHE_HOSTS,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Clients read from the primary for this long after a write
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_COOKIE = 'primary_pin'
+
+# Requests slower than this are sampled into the log with their SQL
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_SAMPLE_RATE = float(
+    os.environ.get('SLOW_REQUEST_SAMPLE_RATE', 0.1)
+)
+
+# Per-process metric snapshots are merged from this directory so every
+# worker serves fleet-wide numbers; point it at a tmpfs wiped on start.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+
+# Scrapers read /internal/metrics/ with "Authorization: Bearer <token>";
+# unset, the endpoint is off. Behind the reverse proxy every client
+# comes from 127.0.0.1, so addresses cannot tell scrapers apart.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Background jobs (see core.jobs and the run_worker command)
+JOB_QUEUE_CONCURRENCY = {
+    'images': int(os.environ.get('JOB_IMAGES_CONCURRENCY', 2)),
+}
+JOB_RETRY_BASE_SECONDS = 5
+JOB_RETRY_MAX_SECONDS = 3600
+JOB_LOCK_TIMEOUT_SECONDS = 600
+# How often each worker puts back jobs whose worker died mid-run
+JOB_REQUEUE_INTERVAL_SECONDS = 60
+
+# Unreferenced drug images are deleted by gc_media once older than the
+# minimum age, which covers uploads whose drug is not committed yet
+GC_MEDIA_MIN_AGE_SECONDS = 86400
+GC_MEDIA_INTERVAL_SECONDS = 86400
+GC_MEDIA_RATE = 100
+
+# Responses of creates sent with an Idempotency-Key are replayed for
+# retries within the TTL (see core.idempotency)
+IDEMPOTENCY_KEY_TTL_SECONDS = int(
+    os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', 86400)
+)
+
+# Admission control (see core.middleware.AdmissionControlMiddleware):
+# concurrent requests per URL name and worker process. Others queue up
+# to the timeout, and beyond the queue size are refused with a 503.
+ADMISSION_LIMITS = {
+    'drug:drug-upload-image': int(
+        os.environ.get('ADMISSION_UPLOAD_IMAGE_LIMIT', 2)
+    ),
+    'drug:uploadsession-detail': int(
+        os.environ.get('ADMISSION_UPLOAD_CHUNK_LIMIT', 4)
+    ),
+    'drug:drug-list': int(os.environ.get('ADMISSION_DRUG_LIST_LIMIT', 8)),
+}
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 16))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(
+    os.environ.get('ADMISSION_QUEUE_TIMEOUT_SECONDS', 2)
+)
+ADMISSION_RETRY_AFTER_SECONDS = 5
+
+# PostgreSQL statement_timeout of request queries in ms, by URL name or
+# URL name and DRF action (see core.middleware.StatementTimeoutMiddleware)
+STATEMENT_TIMEOUT_MS = int(os.environ.get('STATEMENT_TIMEOUT_MS', 30000))
+STATEMENT_TIMEOUTS = {
+    'drug:drug-list.list': 5000,
+    'drug:drug-similar': 5000,
+    'drug:tag-autocomplete': 2000,
+    'drug:ingredient-autocomplete': 2000,
+}
+
+# Longest ID list accepted by the drug list filters
+FILTER_MAX_IDS = int(os.environ.get('FILTER_MAX_IDS', 100))
+
+# Per-user token bucket shared through the cache (see core.throttling);
+# a rate of 0 disables throttling
+THROTTLE_BURST = int(os.environ.get('THROTTLE_BURST', 200))
+THROTTLE_RATE = float(os.environ.get('THROTTLE_RATE', 50))
+
+# Drug lists are cached per user and query until the catalog changes.
+# Identical concurrent reads share one computation; a fill lock makes
+# other processes wait for the result instead of recomputing it.
+DRUG_LIST_CACHE_SECONDS = int(os.environ.get('DRUG_LIST_CACHE_SECONDS', 60))
+DRUG_LIST_CACHE_LOCK_SECONDS = 10
+DRUG_LIST_CACHE_WAIT_SECONDS = 5
+
+# Drug images are validated from their header only; the limits apply
+# before anything is decoded (see drug.images)
+IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 20 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 40000000))
+IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF')
+
+# Re-encode uploaded images on the images queue to strip their metadata
+IMAGE_REENCODE = os.environ.get('IMAGE_REENCODE', '1') == '1'
+
+# Resumable image uploads (see drug.uploads); idle sessions expire with
+# the media collection
+UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+UPLOAD_CHUNK_MAX_BYTES = 5 * 1024 * 1024
+UPLOAD_SESSION_TTL_SECONDS = 86400
+
+# Tag and ingredient autocomplete indexes kept per process; writes in
+# other processes show up once an index expires.
+AUTOCOMPLETE_INDEX_USERS = int(
+    os.environ.get('AUTOCOMPLETE_INDEX_USERS', 1000)
+)
+AUTOCOMPLETE_INDEX_MAX_ROWS = 50000
+AUTOCOMPLETE_INDEX_TTL = int(os.environ.get('AUTOCOMPLETE_INDEX_TTL', 60))
+
+# Change feed for syncing clients. Rows are withheld for the lag so
+# transactions still in flight cannot commit behind a handed out cursor;
+# tombstones older than the retention are pruned and such cursors
+# expire.
+SYNC_SAFETY_LAG_SECONDS = int(os.environ.get('SYNC_SAFETY_LAG_SECONDS', 5))
+SYNC_TOMBSTONE_RETENTION_DAYS = 30
+
+# Server-sent change streams end after SSE_MAX_SECONDS and clients
+# reconnect from their last event
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = int(os.environ.get('SSE_MAX_SECONDS', 300))
+SSE_RETRY_MS = 3000
+SSE_BATCH_SIZE = 500
+# Each open stream holds a request thread, so a process serves at most
+# this many at once and refuses more with a 503. Keep it well below the
+# threads of a worker; sync (single threaded) workers cannot serve
+# streams without giving up all other requests.
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 4))
+
+# Warm URL resolvers, serializers and connections when the WSGI app
+# loads. Leave out connections if the app is loaded before forking.
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', '1') == '1'
+WARMUP_CONNECTIONS = os.environ.get('WARMUP_CONNECTIONS', '1') == '1'
+
+# Admin changelists show planner estimates above this many rows
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+# Batch endpoint limits
+BATCH_MAX_REQUESTS = 25
+BATCH_MAX_WORKERS = 4
+
+# Normalized ingredient names mapped to canonical ids, per process
+CANONICAL_INGREDIENT_CACHE_SIZE = 100000
+
+# Per-process ingredient indexes behind the similar drugs action
+SIMILARITY_INDEX_USERS = int(os.environ.get('SIMILARITY_INDEX_USERS', 200))
+SIMILARITY_INDEX_TTL = int(os.environ.get('SIMILARITY_INDEX_TTL', 300))
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -137,4 +346,15 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
-AUTH_USER_MODEL = 'core.user'
\ No newline at end of file
+AUTH_USER_MODEL = 'core.user'
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.JSONRenderer',
+        'core.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'core.throttling.TokenBucketThrottle',
+    ),
+    'EXCEPTION_HANDLER': 'core.exceptions.exception_handler',
+}
\ No newline at end of file
@@ -18,8 +18,12 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from core import views as core_views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('internal/metrics/', core_views.metrics, name='metrics'),
+    path('api/batch/', core_views.BatchView.as_view(), name='batch'),
     path('api/user/', include('user.urls')),
     path('api/drug/', include('drug.urls')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -3,11 +3,13 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext as _
 
 from core import models
+from core.pagination import EstimatedCountPaginator
 
 
 class UserAdmin(BaseUserAdmin):
     ordering = ['id']
     list_display = ['email', 'name']
+    search_fields = ['email', 'name']
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         (_('Personal Info'), {'fields': ('name',)}),
@@ -24,7 +26,33 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+
+class CatalogAdmin(admin.ModelAdmin):
+    """Admin for large per-user catalog tables"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
+
+
+class TagAdmin(CatalogAdmin):
+    list_display = ['name', 'user']
+    search_fields = ['^name']
+
+
+class IngredientAdmin(CatalogAdmin):
+    list_display = ['name', 'user']
+    search_fields = ['^name']
+    raw_id_fields = ['canonical']
+
+
+class DrugAdmin(CatalogAdmin):
+    list_display = ['title', 'user', 'price', 'updated_at']
+    search_fields = ['^title']
+    autocomplete_fields = ['user', 'tags', 'ingredients']
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Tag)
-admin.site.register(models.Drug)
-admin.site.register(models.Ingredient)
\ No newline at end of file
+admin.site.register(models.Tag, TagAdmin)
+admin.site.register(models.Drug, DrugAdmin)
+admin.site.register(models.Ingredient, IngredientAdmin)
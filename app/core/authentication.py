@@ -0,0 +1,32 @@
+from rest_framework import authentication
+
+from core import sharding
+from core.instrumentation import span
+
+
+class TokenAuthentication(authentication.TokenAuthentication):
+    """Token authentication that routes the user's catalog to its shard"""
+
+    def authenticate(self, request):
+        with span('auth'):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        user, token = super().authenticate_credentials(key)
+        sharding.activate(user.pk)
+        return user, token
+
+
+class QueryTokenAuthentication(TokenAuthentication):
+    """Token authentication also accepting a `token` query parameter
+
+    For clients that cannot set headers, like the browser EventSource.
+    Tokens in URLs end up in access logs, so only use it where needed.
+    """
+
+    def authenticate(self, request):
+        key = request.query_params.get('token')
+        if key is None:
+            return super().authenticate(request)
+        with span('auth'):
+            return self.authenticate_credentials(key)
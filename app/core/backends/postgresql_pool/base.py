@@ -0,0 +1,125 @@
+import functools
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation \
+    as BaseDatabaseCreation
+
+from core.backends.postgresql_pool.pool import ConnectionPool, \
+    PoolTimeout, get_pool, all_pools
+
+Database = base.Database
+
+POOL_DEFAULTS = {
+    'MIN_SIZE': 0,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 5.0,
+    'CHECK_AFTER': 10.0,
+    'MAX_IDLE': 300.0,
+}
+
+
+def _check(conn):
+    """Return True if the connection answers a trivial query"""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except Database.Error:
+        return False
+
+
+def _reset(conn):
+    """Roll back leftover transaction state; False if unusable"""
+    if conn.closed:
+        return False
+    status = conn.get_transaction_status()
+    if status == Database.extensions.TRANSACTION_STATUS_IDLE:
+        return True
+    if status == Database.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        conn.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+def _close(conn):
+    if not conn.closed:
+        conn.close()
+
+
+class DatabaseCreation(BaseDatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Pooled sessions would keep the test database in use.
+        for _, pool in all_pools():
+            pool.close_all()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL backend that checks connections out of a process pool
+
+    Django opens a connection per request and closes it at the end
+    when CONN_MAX_AGE is 0; here "open" borrows from the pool and
+    "close" hands the connection back, so only the first request on
+    each worker pays for connection setup.
+    """
+    creation_class = DatabaseCreation
+
+    def get_pool(self, conn_params=None):
+        """Return the pool shared by every thread using this alias"""
+        if conn_params is None:
+            conn_params = self.get_connection_params()
+        options = dict(POOL_DEFAULTS, **self.settings_dict.get('POOL', {}))
+        key = (self.alias, tuple(sorted(
+            (k, str(v)) for k, v in conn_params.items()
+        )))
+
+        def factory():
+            return ConnectionPool(
+                connect=functools.partial(Database.connect, **conn_params),
+                check=_check,
+                reset=_reset,
+                close=_close,
+                min_size=options['MIN_SIZE'],
+                max_size=options['MAX_SIZE'],
+                timeout=options['TIMEOUT'],
+                check_after=options['CHECK_AFTER'],
+                max_idle=options['MAX_IDLE'],
+            )
+
+        return get_pool(key, factory)
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        try:
+            # Keep MIN_SIZE connections open, so later requests skip the
+            # setup. This runs outside get_pool's lock, so a slow database
+            # only holds up the threads using it.
+            pool.prefill()
+            connection = pool.acquire()
+        except PoolTimeout as exc:
+            raise Database.OperationalError(str(exc)) from exc
+        self._pool = pool
+        # Same isolation level handling as the stock backend, done on
+        # every checkout since pooled sessions outlive this wrapper.
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get(
+            'isolation_level', connection.isolation_level
+        )
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = getattr(self, '_pool', None)
+        if pool is None:
+            return super()._close()
+        # A connection closed inside an atomic block stays referenced by
+        # this wrapper until rollback, so it must not be handed out again.
+        with self.wrap_database_errors:
+            pool.release(self.connection, discard=self.in_atomic_block)
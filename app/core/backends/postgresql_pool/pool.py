@@ -0,0 +1,200 @@
+import collections
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out in time"""
+
+
+class ConnectionPool:
+    """Thread safe pool of DB-API connections
+
+    The pool knows nothing about the database driver; the callables
+    passed in open, test, reset and close connections.
+    """
+
+    def __init__(self, connect, check, reset, close, min_size=0,
+                 max_size=10, timeout=5.0, check_after=10.0,
+                 max_idle=300.0):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError(
+                'Invalid pool size %s..%s' % (min_size, max_size)
+            )
+        self._connect = connect
+        self._check = check
+        self._reset = reset
+        self._close = close
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_idle = max_idle
+
+        self._idle = collections.deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = collections.Counter()
+
+    def prefill(self):
+        """Open connections until the pool holds at least min_size"""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            self._put_idle(self._open())
+
+    def acquire(self):
+        """Check out a live connection, waiting up to `timeout` seconds"""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            conn = None
+            with self._cond:
+                expired = self._expire()
+                while True:
+                    if self._idle:
+                        conn, released_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            'No connection available within %ss '
+                            '(max_size=%s)' % (self.timeout, self.max_size)
+                        )
+                    if not waited:
+                        waited = True
+                        self._stats['waits'] += 1
+                    wait_started = time.monotonic()
+                    self._cond.wait(remaining)
+                    self._stats['wait_ms'] += int(
+                        (time.monotonic() - wait_started) * 1000
+                    )
+
+            for old in expired:
+                self._close_quietly(old)
+            if conn is None:
+                conn = self._open()
+            elif not self._usable(conn, released_at):
+                self._discard(conn)
+                continue
+
+            self._count('checkouts')
+            return conn
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, or drop it if unusable"""
+        if discard or not self._reset(conn):
+            self._discard(conn)
+            return
+        self._put_idle(conn)
+
+    def close_all(self):
+        """Close every idle connection, e.g. before dropping a database"""
+        with self._cond:
+            idle, self._idle = list(self._idle), collections.deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Return a snapshot of pool counters and gauges"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                max_size=self.max_size,
+            )
+        return stats
+
+    def _open(self):
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._count('created')
+        return conn
+
+    def _expire(self):
+        """Take out connections idle past max_idle, oldest first
+
+        Checkouts reuse the most recently released connection, so the
+        least recently used ones collect at the left. Call with the
+        lock held and close the returned connections after releasing it.
+        """
+        expired = []
+        cutoff = time.monotonic() - self.max_idle
+        while (self._idle and self._size > self.min_size and
+               self._idle[0][1] < cutoff):
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+            self._stats['expired'] += 1
+        return expired
+
+    def _usable(self, conn, released_at):
+        idle_for = time.monotonic() - released_at
+        if idle_for > self.check_after:
+            self._count('checks')
+            return self._check(conn)
+        return True
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def _put_idle(self, conn):
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _close_quietly(self, conn):
+        try:
+            self._close(conn)
+        except Exception:
+            pass
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self._stats['discarded'] += 1
+            self._cond.notify()
+
+
+_pools = {}
+_inherited = []
+_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    """Return the pool for `key` in this process, creating it if needed"""
+    pid = os.getpid()
+    with _lock:
+        pool = _pools.get((pid, key))
+        if pool is None:
+            # Pools copied into a forked child share sockets with the
+            # parent. Keep them referenced so they are never closed
+            # (which would terminate the parent's sessions) and start over.
+            for stale in [k for k in _pools if k[0] != pid]:
+                _inherited.append(_pools.pop(stale))
+            pool = _pools[(pid, key)] = factory()
+    return pool
+
+
+def all_pools():
+    """Return (key, pool) pairs for the pools owned by this process"""
+    pid = os.getpid()
+    with _lock:
+        return [(k[1], p) for k, p in _pools.items() if k[0] == pid]
@@ -0,0 +1,141 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from core import metrics, middleware, sharding
+
+logger = logging.getLogger(__name__)
+
+# Parent request headers that do not describe the sub-request
+DROPPED_META = (
+    'CONTENT_LENGTH', 'CONTENT_TYPE', 'QUERY_STRING', 'HTTP_CONTENT_LENGTH',
+    'HTTP_CONTENT_TYPE', 'HTTP_IDEMPOTENCY_KEY', 'wsgi.input',
+)
+
+
+def build_request(parent, item):
+    """Return a WSGI request for a sub-request of the batch `parent`"""
+    path, _, query = item['path'].partition('?')
+    body = b''
+    if item.get('body') is not None:
+        body = json.dumps(item['body']).encode()
+    environ = {
+        key: value for key, value in parent.META.items()
+        if key not in DROPPED_META
+    }
+    environ.update({
+        'REQUEST_METHOD': item['method'],
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': BytesIO(body),
+    })
+    request = WSGIRequest(environ)
+    # The batch is authenticated once, sub-requests reuse its user.
+    request._force_auth_user = parent.user
+    request._force_auth_token = parent.auth
+    return request
+
+
+def dispatch(parent, item):
+    """Run one sub-request through its view and return its outcome
+
+    Like a request of its own, the sub-request takes a slot of its
+    route's admission limit, and is shed if it cannot get one, and runs
+    under its route's statement_timeout.
+    """
+    request = build_request(parent, item)
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return {'status': 404, 'body': {'detail': 'Not found.'}}
+    if match.url_name == 'batch':
+        return {'status': 400, 'body': {'detail': 'Batches cannot nest.'}}
+
+    route = match.view_name
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower())
+    admission = getattr(parent, '_admission_control', None)
+    limiter = admission.limiters.get(route) if admission else None
+    if limiter is not None and not limiter.acquire(
+            settings.ADMISSION_QUEUE_TIMEOUT_SECONDS):
+        metrics.REQUESTS_SHED.inc(route=route)
+        return {'status': 503, 'body': {'detail': middleware.BUSY_DETAIL}}
+
+    sharding.activate(parent.user.pk)
+    try:
+        with middleware.statement_timeout(
+                middleware.route_statement_timeout(route, action)):
+            response = match.func(request, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception('Batch sub-request %s %s failed',
+                         item['method'], item['path'])
+        return {'status': 500, 'body': {'detail': 'Server error.'}}
+    finally:
+        if limiter is not None:
+            limiter.release()
+
+    if response.streaming:
+        return {
+            'status': 400,
+            'body': {'detail': 'Streaming responses cannot be batched.'},
+        }
+    if hasattr(response, 'data'):
+        body = response.data
+    elif response.content:
+        try:
+            body = json.loads(response.content)
+        except ValueError:
+            body = response.content.decode(response.charset, 'replace')
+    else:
+        body = None
+    return {'status': response.status_code, 'body': body}
+
+
+def _threaded(func, parent):
+    def run(item):
+        try:
+            return func(parent, item)
+        finally:
+            sharding.deactivate()
+            connections.close_all()
+    return run
+
+
+def execute(parent, items, parallel=False, func=dispatch):
+    """Run the sub-requests in order and return their outcomes
+
+    With `parallel`, consecutive GETs run concurrently on a thread
+    pool; other methods wait for everything before them and block
+    everything after. Threads use their own connections, so requests
+    inside a transaction, which they could not see, never go parallel.
+    """
+    if parallel and any(
+            conn.in_atomic_block for conn in connections.all()):
+        parallel = False
+    if not parallel:
+        return [func(parent, item) for item in items]
+
+    results = [None] * len(items)
+    run = _threaded(func, parent)
+    with ThreadPoolExecutor(settings.BATCH_MAX_WORKERS) as pool:
+        start = 0
+        while start < len(items):
+            if items[start]['method'] != 'GET':
+                results[start] = func(parent, items[start])
+                start += 1
+                continue
+            end = start
+            while end < len(items) and items[end]['method'] == 'GET':
+                end += 1
+            results[start:end] = pool.map(run, items[start:end])
+            start = end
+    return results
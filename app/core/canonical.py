@@ -0,0 +1,66 @@
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+
+from core.models import CanonicalIngredient
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def normalize(name):
+    """Return the canonical spelling of an ingredient name"""
+    name = unicodedata.normalize('NFKC', name).casefold()
+    return sys.intern(' '.join(name.split()))
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+
+def _cached(key):
+    with _lock:
+        pk = _cache.get(key)
+        if pk is not None:
+            _cache.move_to_end(key)
+        return pk
+
+
+def _remember(key, pk):
+    with _lock:
+        _cache[key] = pk
+        _cache.move_to_end(key)
+        while len(_cache) > settings.CANONICAL_INGREDIENT_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def lookup(name):
+    """Return the id of the canonical ingredient for `name`
+
+    The canonical row is created on first use. Only ids read back from
+    existing rows are cached, so a row created by a transaction that
+    later rolls back is never handed out again.
+    """
+    key = normalize(name)
+    pk = _cached(key)
+    if pk is not None:
+        return pk
+
+    pk = CanonicalIngredient.objects.filter(name=key) \
+        .values_list('pk', flat=True).first()
+    if pk is not None:
+        _remember(key, pk)
+        return pk
+
+    db = router.db_for_write(CanonicalIngredient)
+    try:
+        with transaction.atomic(using=db):
+            return CanonicalIngredient.objects.using(db).create(name=key).pk
+    except IntegrityError:
+        # Another request created it first.
+        return CanonicalIngredient.objects.using(db).get(name=key).pk
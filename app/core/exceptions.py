@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db import OperationalError
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler as drf_exception_handler
+from rest_framework.views import set_rollback
+
+from core import metrics
+
+# SQLSTATE of a query cancelled by statement_timeout
+QUERY_CANCELED = '57014'
+
+
+def is_statement_timeout(exc):
+    """Return True if `exc` is a query cancelled by statement_timeout"""
+    return isinstance(exc, OperationalError) and getattr(
+        exc.__cause__, 'pgcode', None
+    ) == QUERY_CANCELED
+
+
+def exception_handler(exc, context):
+    """DRF exception handler answering timed out queries with a 503"""
+    if not is_statement_timeout(exc):
+        return drf_exception_handler(exc, context)
+
+    request = context['request']
+    match = request.resolver_match
+    metrics.STATEMENT_TIMEOUTS.inc(
+        route=match.view_name if match else 'unmatched',
+        action=getattr(context['view'], 'action', None) or '',
+    )
+    set_rollback()
+    response = Response(
+        {'detail': 'The request took too long, narrow it or retry later.'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER_SECONDS)
+    return response
@@ -0,0 +1,100 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+
+class KeyReused(exceptions.APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'Idempotency-Key was already used for another request.'
+    default_code = 'idempotency_key_reused'
+
+
+def fingerprint(request):
+    """Return a digest of what `request` asks for, to spot reused keys"""
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.get_full_path().encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _claim(user, key, digest, using):
+    """Return the key's record, inserting it if missing or expired
+
+    On Postgres, inserting a key another transaction has inserted but
+    not committed waits for that transaction, so concurrent duplicates
+    queue up here and find the finished response.
+    """
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS
+    )
+    keys = IdempotencyKey.objects.using(using)
+    try:
+        with transaction.atomic(using=using):
+            return keys.create(user=user, key=key, fingerprint=digest)
+    except IntegrityError:
+        record = keys.select_for_update().get(user=user, key=key)
+    if record.created_at >= cutoff:
+        return record
+    record.delete()
+    return keys.create(user=user, key=key, fingerprint=digest)
+
+
+def execute(request, func):
+    """Run the create `func` once per user and Idempotency-Key
+
+    Returns the response of `func`, or the stored response when the key
+    was used before. Failed requests store nothing and may be retried.
+    """
+    key = request.META[HEADER]
+    if not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise exceptions.ValidationError({
+            'detail': 'Idempotency-Key must be 1 to %d characters.'
+            % MAX_KEY_LENGTH
+        })
+    digest = fingerprint(request)
+    using = router.db_for_write(IdempotencyKey)
+    with transaction.atomic(using=using):
+        record = _claim(request.user, key, digest, using)
+        if record.status_code:
+            if record.fingerprint != digest:
+                raise KeyReused()
+            response = Response(
+                json.loads(record.body), status=record.status_code
+            )
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        response = func()
+        if response.status_code < 300:
+            record.status_code = response.status_code
+            record.body = json.dumps(response.data, cls=JSONEncoder)
+            record.save(update_fields=['status_code', 'body'])
+        else:
+            record.delete()
+    return response
+
+
+class IdempotentCreateMixin:
+    """Let clients retry creates safely by sending an Idempotency-Key"""
+
+    def create(self, request, *args, **kwargs):
+        if HEADER not in request.META:
+            return super().create(request, *args, **kwargs)
+        return execute(
+            request, lambda: super(IdempotentCreateMixin, self).create(
+                request, *args, **kwargs
+            )
+        )
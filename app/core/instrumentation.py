@@ -0,0 +1,101 @@
+import collections
+import threading
+import time
+from contextlib import contextmanager
+
+# Keep memory bounded on requests issuing thousands of queries.
+MAX_RECORDED_QUERIES = 200
+
+_state = threading.local()
+
+
+class RequestProfile:
+    """Timings collected while handling a single request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = collections.defaultdict(float)
+        self.query_count = 0
+        self.query_time = 0.0
+        self.queries = []
+        self._open = collections.Counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def record_query(self, sql, duration, alias):
+        self.query_count += 1
+        self.query_time += duration
+        if len(self.queries) < MAX_RECORDED_QUERIES:
+            self.queries.append((alias, duration, sql))
+
+    def server_timing(self):
+        """Return the value of a Server-Timing header, durations in ms"""
+        parts = [
+            'db;dur=%.1f;desc="%d queries"'
+            % (self.query_time * 1000, self.query_count)
+        ]
+        for name, seconds in sorted(self.spans.items()):
+            parts.append('%s;dur=%.1f' % (name, seconds * 1000))
+        parts.append('app;dur=%.1f' % (self.elapsed() * 1000))
+        return ', '.join(parts)
+
+
+def start():
+    """Begin profiling the current thread's request"""
+    _state.profile = RequestProfile()
+    return _state.profile
+
+
+def stop():
+    _state.profile = None
+
+
+def current():
+    """Return the profile of the current request, if one is running"""
+    return getattr(_state, 'profile', None)
+
+
+@contextmanager
+def span(name):
+    """Add the time spent in the block to the named span
+
+    Nested spans with the same name only count once, so recursive
+    serializers are not double counted.
+    """
+    profile = current()
+    if profile is None or profile._open[name]:
+        yield
+        return
+    profile._open[name] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.spans[name] += time.perf_counter() - started
+        profile._open[name] -= 1
+
+
+class QueryRecorder:
+    """Database execute wrapper timing every query into a profile"""
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.profile.record_query(
+                sql, time.perf_counter() - started,
+                context['connection'].alias
+            )
+
+
+class ProfiledSerializerMixin:
+    """Serializer mixin adding representation time to the `ser` span"""
+
+    def to_representation(self, instance):
+        with span('ser'):
+            return super().to_representation(instance)
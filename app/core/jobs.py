@@ -0,0 +1,149 @@
+import json
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from core import sharding
+from core.models import Job
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+
+
+class Task:
+    """A function registered to run in the background"""
+
+    def __init__(self, func, name, queue, max_attempts):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.max_attempts = max_attempts
+
+    def __call__(self, **payload):
+        return self.func(**payload)
+
+    def delay(self, user=None, run_in=0, **payload):
+        """Queue the task with keyword arguments `payload`"""
+        return enqueue(self.name, payload, user=user, run_in=run_in)
+
+
+def task(name=None, queue='default', max_attempts=5):
+    """Register a function as a background task
+
+    Tasks are called with the job payload as keyword arguments; their
+    return value must be JSON serializable. Tasks of jobs belonging to
+    a user run with that user's shard activated.
+    """
+    def decorator(func):
+        task_name = name or '%s.%s' % (func.__module__, func.__name__)
+        _tasks[task_name] = Task(func, task_name, queue, max_attempts)
+        return _tasks[task_name]
+    return decorator
+
+
+def get_task(name):
+    return _tasks[name]
+
+
+def enqueue(name, payload=None, user=None, run_in=0):
+    """Create a queued job for the registered task `name`"""
+    registered = get_task(name)
+    return Job.objects.create(
+        queue=registered.queue,
+        name=name,
+        payload=json.dumps(payload or {}),
+        user=user,
+        max_attempts=registered.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=run_in),
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt, with jitter"""
+    delay = min(
+        settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+        settings.JOB_RETRY_MAX_SECONDS,
+    )
+    return random.uniform(delay / 2, delay)
+
+
+def requeue_stale(queue):
+    """Put back jobs whose worker died while running them"""
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.JOB_LOCK_TIMEOUT_SECONDS
+    )
+    return Job.objects.filter(
+        queue=queue, status=Job.RUNNING, locked_at__lt=cutoff
+    ).update(status=Job.QUEUED, locked_by='', locked_at=None)
+
+
+def claim(queue, worker):
+    """Lock and mark running the next due job of `queue`, if any"""
+    alias = router.db_for_write(Job)
+    limit = settings.JOB_QUEUE_CONCURRENCY.get(queue)
+    with transaction.atomic(using=alias):
+        if limit is not None:
+            _lock_queue(alias, queue)
+            running = Job.objects.using(alias) \
+                .filter(queue=queue, status=Job.RUNNING).count()
+            if running >= limit:
+                return None
+        job = Job.objects.using(alias).select_for_update(skip_locked=True) \
+            .filter(queue=queue, status=Job.QUEUED,
+                    run_at__lte=timezone.now()) \
+            .order_by('run_at', 'pk').first()
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.locked_by = worker
+        job.locked_at = timezone.now()
+        job.save(update_fields=[
+            'status', 'attempts', 'locked_by', 'locked_at', 'updated_at'
+        ])
+    return job
+
+
+def _lock_queue(alias, queue):
+    """Serialize claims on a queue so its concurrency limit holds"""
+    conn = connections[alias]
+    if conn.vendor != 'postgresql':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [queue])
+
+
+def run(job):
+    """Run a claimed job and record its outcome"""
+    try:
+        if job.user_id is not None:
+            sharding.activate(job.user_id)
+        result = get_task(job.name)(**json.loads(job.payload))
+    except Exception as exc:
+        logger.exception('Job %s (%s) failed', job.pk, job.name)
+        job.last_error = '%s: %s' % (type(exc).__name__, exc)
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(
+                seconds=retry_delay(job.attempts)
+            )
+        else:
+            job.status = Job.FAILED
+    else:
+        job.status = Job.SUCCEEDED
+        job.result = json.dumps(result)
+        job.last_error = ''
+    finally:
+        sharding.deactivate()
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=[
+        'status', 'run_at', 'result', 'last_error', 'locked_by',
+        'locked_at', 'updated_at',
+    ])
+    return job
@@ -0,0 +1,313 @@
+import io
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from binascii import hexlify
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import sharding
+from core.models import Tag, Ingredient, Drug
+
+SCENARIOS = ('list', 'filter', 'detail', 'create', 'upload_image')
+QUERIES_RE = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def percentile(values, pct):
+    """Return the nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    rank = max(0, math.ceil(pct / 100 * len(values)) - 1)
+    return values[rank]
+
+
+class InProcessTransport:
+    """Send requests through the full WSGI stack without a socket"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, method, path, token, data=None, multipart=False):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        res = getattr(client, method.lower())(
+            path, data, format='multipart' if multipart else 'json'
+        )
+        return res.status_code, res.get('Server-Timing', '')
+
+
+class HttpTransport:
+    """Send requests to a running server"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, token, data=None, multipart=False):
+        headers = {'Authorization': 'Token ' + token}
+        body = None
+        if multipart:
+            boundary = uuid.uuid4().hex
+            headers['Content-Type'] = \
+                'multipart/form-data; boundary=%s' % boundary
+            body = b''.join([
+                b'--%s\r\n' % boundary.encode(),
+                b'Content-Disposition: form-data; name="image"; '
+                b'filename="bench.jpg"\r\nContent-Type: image/jpeg\r\n\r\n',
+                data['image'].getvalue(),
+                b'\r\n--%s--\r\n' % boundary.encode(),
+            ])
+        elif data is not None:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(data).encode()
+        req = urllib.request.Request(
+            self.base_url + path, data=body, headers=headers, method=method
+        )
+        try:
+            with urllib.request.urlopen(req) as res:
+                res.read()
+                return res.status, res.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.headers.get('Server-Timing', '')
+
+
+class Command(BaseCommand):
+    """Django command to seed synthetic data and benchmark the drug API"""
+    help = 'Seed synthetic users, tags, ingredients and drugs, drive the ' \
+           'API with concurrent clients and report latency as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument('--tags', type=int, default=20,
+                            help='Tags per user')
+        parser.add_argument('--ingredients', type=int, default=50,
+                            help='Ingredients per user')
+        parser.add_argument('--drugs', type=int, default=500,
+                            help='Drugs per user')
+        parser.add_argument('--links', type=int, default=3,
+                            help='Tags and ingredients per drug')
+        parser.add_argument('--clients', type=int, default=8,
+                            help='Concurrent clients')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per scenario')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+        parser.add_argument('--base-url',
+                            help='Benchmark a running server instead of '
+                                 'dispatching in process')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded data afterwards')
+        parser.add_argument('--output', help='Write the report to a file')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in options['scenarios'].split(',') if s]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError('Unknown scenarios: %s' % ', '.join(unknown))
+        self.random = random.Random(options['seed'])
+        self.run_id = uuid.uuid4().hex[:8]
+
+        started = time.perf_counter()
+        self.fixtures = self._seed(options)
+        seed_seconds = time.perf_counter() - started
+
+        if options['base_url']:
+            transport = HttpTransport(options['base_url'])
+        else:
+            transport = InProcessTransport()
+        image = self._image()
+
+        report = {
+            'run': self.run_id,
+            'scale': {k: options[k] for k in
+                      ('users', 'tags', 'ingredients', 'drugs', 'links')},
+            'clients': options['clients'],
+            'seed_seconds': round(seed_seconds, 3),
+            'scenarios': {},
+        }
+        try:
+            for name in scenarios:
+                report['scenarios'][name] = self._run(
+                    transport, name, options, image
+                )
+        finally:
+            if not options['keep']:
+                self._cleanup()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        self.stdout.write(output)
+
+    def _seed(self, options):
+        """Bulk insert the synthetic catalog and return ids per user"""
+        password = make_password(None)
+        get_user_model().objects.bulk_create([
+            get_user_model()(
+                email='bench-%s-%d@example.com' % (self.run_id, n),
+                name='Bench user %d' % n,
+                password=password,
+            )
+            for n in range(options['users'])
+        ])
+        users = list(get_user_model().objects.filter(
+            email__startswith='bench-%s-' % self.run_id
+        ))
+        tokens = Token.objects.bulk_create([
+            Token(user=user, key=hexlify(os.urandom(20)).decode())
+            for user in users
+        ])
+
+        fixtures = []
+        for user, token in zip(users, tokens):
+            alias = sharding.shard_for_user(user.pk)
+            tag_ids = self._bulk(alias, Tag, [
+                Tag(user=user, name='tag %d' % n)
+                for n in range(options['tags'])
+            ], user)
+            ingredient_ids = self._bulk(alias, Ingredient, [
+                Ingredient(user=user, name='ingredient %d' % n)
+                for n in range(options['ingredients'])
+            ], user)
+            drug_ids = self._bulk(alias, Drug, [
+                Drug(
+                    user=user,
+                    title='drug %d' % n,
+                    daily_frequency=self.random.randint(1, 6),
+                    price=self.random.randint(100, 10000) / 100,
+                )
+                for n in range(options['drugs'])
+            ], user)
+            for field, ids in (('tags', tag_ids),
+                               ('ingredients', ingredient_ids)):
+                through = getattr(Drug, field).through
+                column = through._meta.get_field(field[:-1]).attname
+                links = []
+                for drug_id in drug_ids:
+                    picked = self.random.sample(
+                        ids, min(options['links'], len(ids))
+                    )
+                    links.extend(
+                        through(drug_id=drug_id, **{column: pk})
+                        for pk in picked
+                    )
+                through.objects.using(alias).bulk_create(
+                    links, batch_size=1000
+                )
+            fixtures.append({
+                'token': token.key,
+                'tags': tag_ids,
+                'ingredients': ingredient_ids,
+                'drugs': drug_ids,
+            })
+        return fixtures
+
+    def _bulk(self, alias, model, objs, user):
+        model.objects.using(alias).bulk_create(objs, batch_size=1000)
+        # Not every backend returns primary keys from bulk inserts.
+        return list(model.objects.using(alias).filter(user=user)
+                    .order_by('pk').values_list('pk', flat=True))
+
+    def _image(self):
+        buf = io.BytesIO()
+        Image.new('RGB', (640, 480), (120, 30, 200)).save(buf, 'JPEG')
+        return buf.getvalue()
+
+    def _request_for(self, name, image):
+        """Build one randomized request for the scenario"""
+        fixture = self.random.choice(self.fixtures)
+        token = fixture['token']
+        if name == 'list':
+            return 'GET', reverse('drug:drug-list'), token, None, False
+        if name == 'filter':
+            tags = self.random.sample(fixture['tags'],
+                                      min(2, len(fixture['tags'])))
+            path = '%s?tags=%s' % (
+                reverse('drug:drug-list'), ','.join(map(str, tags))
+            )
+            return 'GET', path, token, None, False
+        if name == 'detail':
+            drug_id = self.random.choice(fixture['drugs'])
+            return 'GET', reverse('drug:drug-detail', args=[drug_id]), \
+                token, None, False
+        if name == 'create':
+            payload = {
+                'title': 'bench drug',
+                'daily_frequency': 2,
+                'price': '9.99',
+                'tags': self.random.sample(
+                    fixture['tags'], min(2, len(fixture['tags']))),
+                'ingredients': self.random.sample(
+                    fixture['ingredients'],
+                    min(3, len(fixture['ingredients']))),
+            }
+            return 'POST', reverse('drug:drug-list'), token, payload, False
+        drug_id = self.random.choice(fixture['drugs'])
+        upload = io.BytesIO(image)
+        upload.name = 'bench.jpg'
+        return 'POST', reverse('drug:drug-upload-image', args=[drug_id]), \
+            token, {'image': upload}, True
+
+    def _run(self, transport, name, options, image):
+        """Fire the scenario's requests and summarize the results"""
+        requests = [self._request_for(name, image)
+                    for _ in range(options['requests'])]
+
+        def send(req):
+            started = time.perf_counter()
+            status, timing = transport.request(*req)
+            elapsed = time.perf_counter() - started
+            match = QUERIES_RE.search(timing)
+            return status, elapsed, int(match.group(1)) if match else None
+
+        started = time.perf_counter()
+        if options['clients'] > 1:
+            with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+                results = list(pool.map(send, requests))
+        else:
+            results = [send(req) for req in requests]
+        wall = time.perf_counter() - started
+
+        latencies = sorted(elapsed * 1000 for _, elapsed, _ in results)
+        queries = [q for _, _, q in results if q is not None]
+        return {
+            'requests': len(results),
+            'errors': sum(1 for status, _, _ in results if status >= 400),
+            'throughput_rps': round(len(results) / wall, 1) if wall else None,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'max': round(latencies[-1], 2),
+            },
+            'queries_per_request': (
+                round(sum(queries) / len(queries), 2) if queries else None
+            ),
+        }
+
+    def _cleanup(self):
+        users = get_user_model().objects.filter(
+            email__startswith='bench-%s-' % self.run_id
+        )
+        for user in users:
+            alias = sharding.shard_for_user(user.pk)
+            for drug in Drug.objects.using(alias).filter(user=user) \
+                    .exclude(image='').exclude(image=None):
+                drug.image.delete(save=False)
+        users.delete()
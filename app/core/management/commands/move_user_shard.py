@@ -0,0 +1,104 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import sharding
+from core.models import Tag, Ingredient, Drug, DrugDocument, \
+    IdempotencyKey, Tombstone
+
+
+class Command(BaseCommand):
+    """Django command to move a user's catalog to another shard"""
+    help = 'Copy a user\'s tags, ingredients and drugs to another shard, ' \
+           'switch the shard map and delete the old rows. Writes by the ' \
+           'user during the move are lost, so quiesce the user first.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_id', type=int)
+        parser.add_argument('alias', help='Target shard alias')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be moved'
+        )
+
+    def handle(self, *args, **options):
+        user_id = options['user_id']
+        target = options['alias']
+        if target not in sharding.shards():
+            raise CommandError('Unknown shard %r' % target)
+        if not get_user_model().objects.filter(pk=user_id).exists():
+            raise CommandError('User %s does not exist' % user_id)
+
+        source = sharding.shard_for_user(user_id)
+        if source == target:
+            self.stdout.write('User %s already on %s' % (user_id, target))
+            return
+
+        rows = self._collect(source, user_id)
+        summary = ', '.join(
+            '%d %s' % (len(objs), model._meta.db_table)
+            for model, objs in rows
+        )
+        self.stdout.write(
+            'Moving %s from %s to %s' % (summary, source, target)
+        )
+        self._check_collisions(target, rows)
+        if options['dry_run']:
+            return
+
+        with transaction.atomic(using=target):
+            for model, objs in rows:
+                model.objects.using(target).bulk_create(objs)
+            sharding.reset_sequences(target, [
+                model for model, objs in rows
+                if not model._meta.auto_created and
+                model._meta.pk.get_internal_type() == 'AutoField'
+            ])
+        sharding.assign(user_id, target)
+        with transaction.atomic(using=source):
+            # Deleting records tombstones, which the copy makes moot.
+            for model in (Drug, Tag, Ingredient, Tombstone,
+                          IdempotencyKey):
+                model.objects.using(source).filter(user_id=user_id).delete()
+
+        self.stdout.write(self.style.SUCCESS('Moved user %s' % user_id))
+
+    def _collect(self, source, user_id):
+        """Load every catalog row of the user, parents before children"""
+        rows = []
+        drug_ids = None
+        for model in (Tag, Ingredient, Drug, DrugDocument, Tombstone,
+                      IdempotencyKey):
+            objs = list(model.objects.using(source).filter(user_id=user_id))
+            rows.append((model, objs))
+            if model is Drug:
+                drug_ids = [obj.pk for obj in objs]
+        for field in ('tags', 'ingredients'):
+            through = getattr(Drug, field).through
+            links = list(
+                through.objects.using(source).filter(drug_id__in=drug_ids)
+            )
+            # Link rows are never referenced by id, let the target
+            # allocate fresh ones.
+            for link in links:
+                link.pk = None
+            rows.append((through, links))
+        return rows
+
+    def _check_collisions(self, target, rows):
+        """Refuse to move rows whose primary keys are taken on the target
+
+        Primary keys are kept so clients holding IDs are unaffected;
+        shards allocate ids from disjoint ranges (sharding.id_range), so
+        this only trips on ids allocated outside their shard's range.
+        """
+        for model, objs in rows:
+            if model._meta.auto_created:
+                continue
+            taken = model.objects.using(target) \
+                .filter(pk__in=[obj.pk for obj in objs]).count()
+            if taken:
+                raise CommandError(
+                    '%d %s ids already exist on %s'
+                    % (taken, model._meta.db_table, target)
+                )
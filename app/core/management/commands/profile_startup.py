@@ -0,0 +1,102 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter so nothing is imported yet
+STARTUP_SCRIPT = '''
+import json, time
+started = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter() - started
+from core import warmup
+timings = warmup.warm(connect=%(connect)r)
+timings['setup'] = setup
+print(json.dumps(timings))
+'''
+
+IMPORTTIME_RE = re.compile(
+    r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$'
+)
+
+
+def parse_importtime(output):
+    """Return (module, self us, cumulative us, depth) from -X importtime"""
+    modules = []
+    for line in output.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            modules.append(
+                (module, int(own), int(cumulative), len(indent) // 2)
+            )
+    return modules
+
+
+class Command(BaseCommand):
+    """Django command to report where worker startup time goes"""
+    help = 'Start the app in a fresh interpreter with -X importtime and ' \
+           'report the slowest imports and warmup phases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Number of modules to report')
+        parser.add_argument('--sort', choices=('self', 'cumulative'),
+                            default='cumulative')
+        parser.add_argument('--connect', action='store_true',
+                            help='Include opening database connections')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            path for path in (os.getcwd(), env.get('PYTHONPATH')) if path
+        )
+        script = STARTUP_SCRIPT % {'connect': options['connect']}
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if proc.returncode:
+            raise CommandError('Startup failed:\n%s' % proc.stderr[-2000:])
+
+        phases = json.loads(proc.stdout.strip().splitlines()[-1])
+        modules = parse_importtime(proc.stderr)
+        column = 1 if options['sort'] == 'self' else 2
+        slowest = sorted(modules, key=lambda m: m[column], reverse=True)
+        report = {
+            'phases_ms': {
+                name: round(seconds * 1000, 1)
+                for name, seconds in phases.items()
+            },
+            'imports': len(modules),
+            'import_ms': round(
+                sum(m[2] for m in modules if m[3] == 0) / 1000, 1
+            ),
+            'slowest': [
+                {'module': module, 'self_ms': own / 1000,
+                 'cumulative_ms': cumulative / 1000}
+                for module, own, cumulative, depth
+                in slowest[:options['limit']]
+            ],
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, ms in report['phases_ms'].items():
+            self.stdout.write('%-12s %8.1f ms' % (name, ms))
+        self.stdout.write('%d modules imported in %.1f ms' % (
+            report['imports'], report['import_ms']
+        ))
+        self.stdout.write('%10s %10s  module' % ('self ms', 'cumul ms'))
+        for item in report['slowest']:
+            self.stdout.write('%10.1f %10.1f  %s' % (
+                item['self_ms'], item['cumulative_ms'], item['module']
+            ))
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import sharding
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    """Django command to delete expired idempotency keys"""
+    help = 'Delete idempotency keys older than IDEMPOTENCY_KEY_TTL_SECONDS ' \
+           'on every shard'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(
+            seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS
+        )
+        for alias in sharding.shards():
+            deleted, _ = IdempotencyKey.objects.using(alias) \
+                .filter(created_at__lt=cutoff).delete()
+            self.stdout.write(
+                'Pruned %d idempotency keys on %s' % (deleted, alias)
+            )
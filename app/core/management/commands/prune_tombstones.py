@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import sharding
+from core.models import Tombstone
+
+
+class Command(BaseCommand):
+    """Django command to delete expired deletion tombstones"""
+    help = 'Delete tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS ' \
+           'on every shard'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(
+            days=settings.SYNC_TOMBSTONE_RETENTION_DAYS
+        )
+        for alias in sharding.shards():
+            deleted, _ = Tombstone.objects.using(alias) \
+                .filter(deleted_at__lt=cutoff).delete()
+            self.stdout.write('Pruned %d tombstones on %s' % (deleted, alias))
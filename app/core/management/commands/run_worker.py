@@ -0,0 +1,103 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.utils.module_loading import autodiscover_modules
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    """Django command to run background jobs from the database queue"""
+    help = 'Claim and run queued jobs until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue', action='append', dest='queues',
+            help='Queue to work on, may be repeated (default: default)'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Jobs run at the same time by this worker'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to sleep when no job is due'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once no job is due instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        autodiscover_modules('tasks')
+        queues = options['queues'] or ['default']
+        self.stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._stop)
+            signal.signal(signal.SIGINT, self._stop)
+
+        self.requeue_lock = threading.Lock()
+        self.requeue_at = 0
+
+        self.stdout.write('Working on %s' % ', '.join(queues))
+
+        name = '%s:%d' % (socket.gethostname(), os.getpid())
+        if options['concurrency'] == 1:
+            self._loop(queues, name, options)
+            return
+        threads = [
+            threading.Thread(
+                target=self._thread,
+                args=(queues, '%s:%d' % (name, n), options),
+            )
+            for n in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _stop(self, signum, frame):
+        self.stdout.write('Finishing running jobs...')
+        self.stopping.set()
+
+    def _thread(self, queues, worker, options):
+        try:
+            self._loop(queues, worker, options)
+        finally:
+            connections.close_all()
+
+    def _requeue_stale(self, queues):
+        """Put back stale jobs, at most once per requeue interval"""
+        with self.requeue_lock:
+            now = time.monotonic()
+            if now < self.requeue_at:
+                return
+            self.requeue_at = now + settings.JOB_REQUEUE_INTERVAL_SECONDS
+        for queue in queues:
+            jobs.requeue_stale(queue)
+
+    def _loop(self, queues, worker, options):
+        while not self.stopping.is_set():
+            # Workers that died mid-job are noticed while this one runs,
+            # not only when it starts.
+            self._requeue_stale(queues)
+            ran = False
+            for queue in queues:
+                close_old_connections()
+                job = jobs.claim(queue, worker)
+                if job is None:
+                    continue
+                ran = True
+                job = jobs.run(job)
+                self.stdout.write('%s %s: %s' % (worker, job, job.status))
+            if not ran:
+                if options['burst']:
+                    return
+                self.stopping.wait(options['poll_interval'])
@@ -1,21 +1,64 @@
+import random
 import time
 
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
     """Django command to pause execution until database is available"""
+    help = 'Wait until the database accepts queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias to probe'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=60.0,
+            help='Give up after this many seconds'
+        )
+        parser.add_argument(
+            '--initial-delay', type=float, default=0.1,
+            help='Delay before the first retry, in seconds'
+        )
+        parser.add_argument(
+            '--max-delay', type=float, default=5.0,
+            help='Upper bound for the delay between retries, in seconds'
+        )
 
     def handle(self, *args, **options):
         self.stdout.write('Waiting for database...')
-        db_conn = None
-        while not db_conn:
+        alias = options['database']
+        deadline = time.monotonic() + options['timeout']
+        delay = options['initial_delay']
+        while True:
             try:
-                db_conn = connections['default']
+                self._probe(connections[alias])
+                break
             except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        'Database unavailable after %s seconds'
+                        % options['timeout']
+                    )
+                # Full jitter keeps a fleet of containers from
+                # retrying in lockstep against a database that is
+                # still starting up.
+                sleep_for = min(random.uniform(0, delay), remaining)
+                self.stdout.write(
+                    'Database unavailable, waiting %.2f seconds...'
+                    % sleep_for
+                )
+                time.sleep(sleep_for)
+                delay = min(delay * 2, options['max_delay'])
+
+        self.stdout.write(self.style.SUCCESS('Database available!'))
 
-        self.stdout.write(self.style.SUCCESS('Database available!'))
\ No newline at end of file
+    def _probe(self, conn):
+        """Run a trivial query so a real socket round trip happens"""
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
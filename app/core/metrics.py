@@ -0,0 +1,361 @@
+"""In-process metrics registry exported in Prometheus text format
+
+Every worker process keeps its own counters, gauges and histograms in
+memory. When METRICS_DIR is set, each process writes a snapshot to
+its own file there every METRICS_FLUSH_SECONDS, busy or idle, and at
+exit. The exporter merges the snapshots of all processes, so a scrape
+hitting any pre-forked worker sees the whole fleet. Counters and
+histograms of exited workers keep counting towards the totals; gauges
+only come from live processes. Wipe METRICS_DIR when the server starts.
+"""
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0,
+    7.5, 10.0,
+)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                '%s expects labels %s' % (self.name, self.labelnames)
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [[list(k), v] for k, v in self._values.items()]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        REGISTRY.changed()
+
+    def set(self, value, **labels):
+        """Copy a total this process counts elsewhere, e.g. in a pool"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {
+                    'buckets': [0] * (len(self.buckets) + 1),
+                    'sum': 0.0,
+                    'count': 0,
+                }
+            entry['buckets'][index] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+        REGISTRY.changed()
+
+    def samples(self):
+        with self._lock:
+            return [
+                [list(k), dict(v, buckets=list(v['buckets']))]
+                for k, v in self._values.items()
+            ]
+
+
+class Registry:
+    """Holds the metrics of this process and merges other processes'"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector):
+        """Call `collector()` to refresh gauges before each snapshot"""
+        self._collectors.append(collector)
+
+    def collect(self):
+        for collector in self._collectors:
+            collector()
+        return {
+            name: {'type': metric.type, 'samples': metric.samples()}
+            for name, metric in self._metrics.items()
+        }
+
+    def changed(self):
+        """Make sure this process flushes to METRICS_DIR periodically"""
+        pid = os.getpid()
+        # A forked worker does not inherit its parent's flusher thread.
+        if self._flusher_pid == pid or \
+                not getattr(settings, 'METRICS_DIR', None):
+            return
+        with self._lock:
+            if self._flusher_pid == pid:
+                return
+            self._flusher_pid = pid
+        threading.Thread(
+            target=self._flush_periodically, name='metrics-flusher',
+            daemon=True,
+        ).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_SECONDS)
+            if not getattr(settings, 'METRICS_DIR', None):
+                break
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Cannot flush metrics')
+        with self._lock:
+            self._flusher_pid = None
+
+    def flush(self):
+        """Write this process's snapshot to METRICS_DIR"""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'metrics-%d.json' % os.getpid())
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump({'pid': os.getpid(), 'metrics': self.collect()}, fh)
+        os.replace(tmp, path)
+
+    def snapshots(self):
+        """Return the snapshots of every process, this one included"""
+        own = {'pid': os.getpid(), 'metrics': self.collect()}
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return [own]
+        snapshots = [own]
+        pattern = os.path.join(directory, 'metrics-*.json')
+        for path in glob.glob(pattern):
+            try:
+                with open(path) as fh:
+                    snapshot = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            if snapshot['pid'] != own['pid']:
+                snapshots.append(snapshot)
+        return snapshots
+
+    def merged(self):
+        """Combine every process's samples into one value per label set"""
+        merged = {}
+        for snapshot in self.snapshots():
+            alive = _is_alive(snapshot['pid'])
+            for name, data in snapshot['metrics'].items():
+                metric = self._metrics.get(name)
+                if metric is None or (metric.type == 'gauge' and not alive):
+                    continue
+                values = merged.setdefault(name, {})
+                for labels, value in data['samples']:
+                    key = tuple(labels)
+                    values[key] = _add(metric, values.get(key), value)
+        return merged
+
+    def exposition(self):
+        """Render all metrics in the Prometheus text format"""
+        lines = []
+        merged = self.merged()
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            lines.append('# HELP %s %s' % (name, metric.documentation))
+            lines.append('# TYPE %s %s' % (name, metric.type))
+            for key, value in sorted(merged.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, key))
+                if metric.type == 'histogram':
+                    lines.extend(_histogram_lines(metric, labels, value))
+                else:
+                    lines.append(
+                        '%s%s %s' % (name, _labels(labels), _num(value))
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+def _is_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _add(metric, current, value):
+    if current is None:
+        return value
+    if metric.type == 'histogram':
+        return {
+            'buckets': [a + b for a, b in
+                        zip(current['buckets'], value['buckets'])],
+            'sum': current['sum'] + value['sum'],
+            'count': current['count'] + value['count'],
+        }
+    return current + value
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, _escape(value)) for name, value in pairs
+    )
+
+
+def _num(value):
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+def _histogram_lines(metric, labels, value):
+    cumulative = 0
+    bounds = [_num(float(b)) for b in metric.buckets] + ['+Inf']
+    for bound, count in zip(bounds, value['buckets']):
+        cumulative += count
+        yield '%s_bucket%s %d' % (
+            metric.name, _labels(labels + [('le', bound)]), cumulative
+        )
+    yield '%s_sum%s %s' % (metric.name, _labels(labels), _num(value['sum']))
+    yield '%s_count%s %d' % (metric.name, _labels(labels), value['count'])
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'http_request_duration_seconds',
+    'Time spent handling requests, by URL name and DRF action',
+    ('route', 'action', 'method'),
+))
+REQUESTS = REGISTRY.register(Counter(
+    'http_requests_total',
+    'Requests handled, by URL name, DRF action and status code',
+    ('route', 'action', 'method', 'status'),
+))
+REQUEST_QUERIES = REGISTRY.register(Histogram(
+    'http_request_queries',
+    'SQL queries issued per request, by URL name and DRF action',
+    ('route', 'action'),
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100),
+))
+REQUESTS_SHED = REGISTRY.register(Counter(
+    'http_requests_shed_total',
+    'Requests refused by admission control, by URL name',
+    ('route',),
+))
+STATEMENT_TIMEOUTS = REGISTRY.register(Counter(
+    'db_statement_timeouts_total',
+    'Requests whose query hit statement_timeout, by URL name and action',
+    ('route', 'action'),
+))
+READ_CACHE = REGISTRY.register(Counter(
+    'read_cache_total',
+    'Cached reads, by cache and hit, miss, waited or coalesced',
+    ('cache', 'outcome'),
+))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'http_requests_in_flight',
+    'Requests currently being handled',
+))
+DB_POOL = REGISTRY.register(Gauge(
+    'db_pool_connections',
+    'Pooled connections by database alias and size, idle, in_use or '
+    'max_size',
+    ('alias', 'stat'),
+))
+DB_POOL_EVENTS = REGISTRY.register(Counter(
+    'db_pool_events_total',
+    'Connection pool events by database alias and event',
+    ('alias', 'event'),
+))
+DB_POOL_WAIT = REGISTRY.register(Counter(
+    'db_pool_wait_seconds_total',
+    'Time spent waiting for a pooled connection, by database alias',
+    ('alias',),
+))
+
+POOL_GAUGES = ('size', 'idle', 'in_use', 'max_size')
+
+
+def _collect_pools():
+    from core.backends.postgresql_pool.pool import all_pools
+    for key, pool in all_pools():
+        alias = key[0]
+        for stat, value in pool.stats().items():
+            if stat in POOL_GAUGES:
+                DB_POOL.set(value, alias=alias, stat=stat)
+            elif stat == 'wait_ms':
+                DB_POOL_WAIT.set(value / 1000, alias=alias)
+            else:
+                DB_POOL_EVENTS.set(value, alias=alias, event=stat)
+
+
+REGISTRY.add_collector(_collect_pools)
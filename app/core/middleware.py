@@ -0,0 +1,350 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.http import JsonResponse
+
+from core import instrumentation, metrics, routers, sharding
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+BUSY_DETAIL = 'Server is busy, retry later.'
+
+
+class ServerTimingMiddleware:
+    """Report per-request SQL, auth, serializer and render timings
+
+    Timings are returned in a Server-Timing header. A sample of the
+    requests slower than SLOW_REQUEST_MS is logged with their SQL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = instrumentation.start()
+        recorder = instrumentation.QueryRecorder(profile)
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            instrumentation.stop()
+
+        response['Server-Timing'] = profile.server_timing()
+        self._log_if_slow(request, response, profile)
+        return response
+
+    def _log_if_slow(self, request, response, profile):
+        elapsed_ms = profile.elapsed() * 1000
+        if elapsed_ms < settings.SLOW_REQUEST_MS:
+            return
+        if random.random() >= settings.SLOW_REQUEST_SAMPLE_RATE:
+            return
+        queries = '\n'.join(
+            '  [%s %.1fms] %s' % (alias, duration * 1000, sql)
+            for alias, duration, sql in profile.queries
+        )
+        logger.warning(
+            'Slow request %s %s -> %s in %.1fms (%s)\n%s',
+            request.method, request.get_full_path(), response.status_code,
+            elapsed_ms, profile.server_timing(), queries
+        )
+
+
+class MetricsMiddleware:
+    """Record latency and query histograms per URL name and DRF action"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.IN_FLIGHT.dec()
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        action = getattr(request, '_metrics_action', '')
+        metrics.REQUEST_LATENCY.observe(
+            elapsed, route=route, action=action, method=request.method
+        )
+        metrics.REQUESTS.inc(
+            route=route, action=action, method=request.method,
+            status=response.status_code
+        )
+        profile = instrumentation.current()
+        if profile is not None:
+            metrics.REQUEST_QUERIES.observe(
+                profile.query_count, route=route, action=action
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        actions = getattr(view_func, 'actions', None) or {}
+        request._metrics_action = actions.get(request.method.lower(), '')
+
+
+class Limiter:
+    """Concurrency limit with a bounded queue of waiting callers"""
+
+    def __init__(self, limit, queue_size):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout):
+        """Take a slot, waiting up to `timeout`; return False if shed"""
+        with self._cond:
+            if self.active >= self.limit:
+                if self.waiting >= self.queue_size:
+                    return False
+                self.waiting += 1
+                try:
+                    if not self._cond.wait_for(
+                            lambda: self.active < self.limit, timeout):
+                        return False
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+class AdmissionControlMiddleware:
+    """Shed load before slow routes tie up every worker thread
+
+    Routes listed in ADMISSION_LIMITS by URL name may run that many
+    requests at once per process. Further requests wait in a queue of
+    ADMISSION_QUEUE_SIZE for up to ADMISSION_QUEUE_TIMEOUT_SECONDS;
+    the rest are answered 503 with Retry-After straight away. Requests
+    keep a reference to the middleware, so batches can hold the limits
+    of their sub-requests' routes too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limiters = {
+            route: Limiter(limit, settings.ADMISSION_QUEUE_SIZE)
+            for route, limit in settings.ADMISSION_LIMITS.items()
+        }
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            limiter = getattr(request, '_admission_limiter', None)
+            if limiter is not None:
+                limiter.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._admission_control = self
+        route = request.resolver_match.view_name
+        limiter = self.limiters.get(route)
+        if limiter is None:
+            return None
+        if limiter.acquire(settings.ADMISSION_QUEUE_TIMEOUT_SECONDS):
+            request._admission_limiter = limiter
+            return None
+
+        metrics.REQUESTS_SHED.inc(route=route)
+        response = JsonResponse({'detail': BUSY_DETAIL}, status=503)
+        response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER_SECONDS)
+        return response
+
+
+def _configure(conn, sql):
+    # A raw cursor: session settings are not queries of the request, so
+    # they stay out of the query log and the execute wrappers.
+    with conn.wrap_database_errors:
+        with conn.connection.cursor() as cursor:
+            cursor.execute(sql)
+
+
+class StatementTimeout:
+    """statement_timeout of the PostgreSQL sessions used by a request
+
+    The timeout is set on the session, outside of any transaction, on
+    the connections already open when it is chosen and on those opened
+    later in the request. reset() puts the server default back before
+    the connections return to the pool. Queries are never rewritten,
+    so savepoints and their rollbacks run exactly as Django issues them.
+    """
+
+    def __init__(self, milliseconds=None):
+        self.milliseconds = milliseconds
+        self.applied = []
+
+    def set(self, milliseconds):
+        """Use `milliseconds` from now on, on every open connection"""
+        self.milliseconds = milliseconds
+        for conn in connections.all():
+            self.apply(conn)
+
+    def apply(self, conn):
+        """Set the timeout on the session of `conn` if it is open"""
+        if (not self.milliseconds or conn.vendor != 'postgresql' or
+                conn.connection is None):
+            return
+        _configure(conn, 'SET statement_timeout = %d' % self.milliseconds)
+        if conn not in self.applied:
+            self.applied.append(conn)
+
+    def reset(self):
+        """Restore the default timeout on the sessions it was set on"""
+        applied, self.applied = self.applied, []
+        for conn in applied:
+            if conn.connection is None or conn.needs_rollback:
+                continue
+            try:
+                _configure(conn, 'RESET statement_timeout')
+            except DatabaseError:
+                # Only a broken session fails here; let it be dropped.
+                logger.warning('Cannot reset statement_timeout on %s',
+                               conn.alias, exc_info=True)
+                conn.close()
+
+
+_active = threading.local()
+
+
+def route_statement_timeout(route, action):
+    """Return the statement_timeout in ms of a URL name and DRF action"""
+    timeouts = settings.STATEMENT_TIMEOUTS
+    return timeouts.get('%s.%s' % (route, action), timeouts.get(
+        route, settings.STATEMENT_TIMEOUT_MS
+    ))
+
+
+@contextmanager
+def statement_timeout(milliseconds):
+    """Run the block's queries, on this thread, under `milliseconds`
+
+    The timeout active before, if any, is restored afterwards.
+    """
+    outer = getattr(_active, 'timeout', None)
+    timeout = _active.timeout = StatementTimeout()
+    try:
+        timeout.set(milliseconds)
+        yield timeout
+    finally:
+        _active.timeout = outer
+        timeout.reset()
+        if outer is not None:
+            outer.set(outer.milliseconds)
+
+
+def apply_statement_timeout(sender, connection, **kwargs):
+    """Set the active request's timeout on a newly opened connection"""
+    timeout = getattr(_active, 'timeout', None)
+    if timeout is not None:
+        timeout.apply(connection)
+
+
+class StatementTimeoutMiddleware:
+    """Cancel queries of a request running past its route's timeout
+
+    STATEMENT_TIMEOUTS maps URL names, optionally suffixed with a DRF
+    action as in 'drug:drug-list.list', to milliseconds; other routes
+    get STATEMENT_TIMEOUT_MS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timeout = request._statement_timeout = StatementTimeout()
+        _active.timeout = timeout
+        try:
+            return self.get_response(request)
+        finally:
+            _active.timeout = None
+            timeout.reset()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = request.resolver_match.view_name
+        actions = getattr(view_func, 'actions', None) or {}
+        action = actions.get(request.method.lower())
+        request._statement_timeout.set(
+            route_statement_timeout(route, action)
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """Route safe requests to replicas unless the client wrote recently
+
+    Clients are pinned to the primary for REPLICA_PIN_SECONDS after a
+    write, keyed by their Authorization header (token clients) and by
+    a cookie (browser sessions), so they always read their own writes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pin_key = self._pin_key(request)
+        pinned = (
+            settings.REPLICA_PIN_COOKIE in request.COOKIES or
+            (pin_key is not None and cache.get(pin_key) is not None)
+        )
+        routers.reset_writes()
+        routers.use_replicas(request.method in SAFE_METHODS and not pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.has_written()
+            routers.use_replicas(False)
+
+        if wrote or request.method not in SAFE_METHODS:
+            seconds = settings.REPLICA_PIN_SECONDS
+            if pin_key is not None:
+                cache.set(pin_key, 1, seconds)
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=seconds, httponly=True
+            )
+
+        return response
+
+    def _pin_key(self, request):
+        auth = request.META.get('HTTP_AUTHORIZATION')
+        if not auth:
+            return None
+        digest = hashlib.sha256(auth.encode()).hexdigest()
+        return 'replica-pin:%s' % digest
+
+
+class ShardRoutingMiddleware:
+    """Make sure no shard activation leaks between requests
+
+    The shard itself is activated by core.authentication once the
+    user is known.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sharding.deactivate()
+        try:
+            return self.get_response(request)
+        finally:
+            sharding.deactivate()
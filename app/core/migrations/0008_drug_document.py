@@ -0,0 +1,22 @@
+# Generated by Django 2.2.10 on 2026-10-18 20:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_shard_assignment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrugDocument',
+            fields=[
+                ('drug', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='core.Drug')),
+                ('body', models.TextField()),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='core.User')),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+TABLES = ('core_tag', 'core_ingredient')
+
+
+def create_indexes(apps, schema_editor):
+    """Index names for the case-insensitive prefix queries of autocomplete"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS %s_user_name_prefix '
+            'ON %s (user_id, UPPER(name::text) text_pattern_ops)'
+            % (table, table)
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS %s_user_name_prefix' % table
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
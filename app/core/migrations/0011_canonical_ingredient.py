@@ -0,0 +1,71 @@
+# Generated by Django 2.2.10 on 2026-10-18 20:53
+
+import unicodedata
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def normalize(name):
+    # Frozen copy of core.canonical.normalize
+    name = unicodedata.normalize('NFKC', name).casefold()
+    return ' '.join(name.split())
+
+
+def link_canonical(apps, schema_editor):
+    """Create canonical names and link this database's ingredients
+
+    Canonical rows live on the default database, so on a sharded setup
+    the default database has to be migrated before the shards.
+    """
+    CanonicalIngredient = apps.get_model('core', 'CanonicalIngredient')
+    Ingredient = apps.get_model('core', 'Ingredient')
+    alias = schema_editor.connection.alias
+
+    names = Ingredient.objects.using(alias) \
+        .order_by().values_list('name', flat=True).distinct()
+    by_canonical = defaultdict(list)
+    for name in names.iterator():
+        by_canonical[normalize(name)].append(name)
+
+    canonicals = CanonicalIngredient.objects.using(DEFAULT_DB_ALIAS)
+    wanted = list(by_canonical)
+    for start in range(0, len(wanted), BATCH_SIZE):
+        batch = wanted[start:start + BATCH_SIZE]
+        canonicals.bulk_create(
+            [CanonicalIngredient(name=name) for name in batch],
+            ignore_conflicts=True,
+        )
+        ids = dict(
+            canonicals.filter(name__in=batch).values_list('name', 'pk')
+        )
+        for name in batch:
+            Ingredient.objects.using(alias) \
+                .filter(name__in=by_canonical[name]) \
+                .update(canonical_id=ids[name])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_name_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CanonicalIngredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='canonical',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ingredients', to='core.CanonicalIngredient'),
+        ),
+        migrations.RunPython(link_canonical, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+COLUMNS = (
+    ('core_tag', 'name'),
+    ('core_ingredient', 'name'),
+    ('core_drug', 'title'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    """Index names for the case-insensitive prefix search of the admin"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in COLUMNS:
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS %s_%s_prefix '
+            'ON %s (UPPER(%s::text) text_pattern_ops)'
+            % (table, column, table, column)
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in COLUMNS:
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS %s_%s_prefix' % (table, column)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_sync_timestamps'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from core import sharding
+
+MODELS = ('Tag', 'Ingredient', 'Drug', 'Tombstone', 'IdempotencyKey')
+
+
+def set_id_ranges(apps, schema_editor):
+    """Make each shard allocate catalog ids from its own range"""
+    alias = schema_editor.connection.alias
+    if alias not in sharding.shards():
+        return
+    sharding.reset_sequences(
+        alias, [apps.get_model('core', name) for name in MODELS]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_id_ranges, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,26 @@
 import uuid
 import os
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
 from django.conf import settings
+from django.dispatch import Signal
+from django.utils import timezone
+
+# Sent once per delete of catalog rows, before they are deleted, so
+# receivers work a query per model instead of per row. Cascades from
+# deleting a user are not announced.
+catalog_deleting = Signal(providing_args=['queryset', 'using'])
 
 
 def drug_image_file_path(instance, filename):
     """Generate file path for new drug image"""
     ext = filename.split('.')[-1]
-    filename = f'{uuid.uuid4()}.{ext}'
+    name = str(uuid.uuid4())
+    filename = f'{name}.{ext}'
 
-    return os.path.join('uploads/drug/', filename)
+    # Fan out so no directory grows too large to list.
+    return os.path.join('uploads/drug/', name[:2], name[2:4], filename)
 
 
 class UserManager(BaseUserManager):
@@ -46,33 +55,124 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'email'
 
-class Tag(models.Model):
+class ShardAssignment(models.Model):
+    """Database alias holding a user's catalog
+
+    Users without one predate sharding and stay on the default shard.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    alias = models.CharField(max_length=64)
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.alias}'
+
+class CatalogQuerySet(models.QuerySet):
+
+    def delete(self):
+        """Delete the rows after announcing them with catalog_deleting"""
+        rows = self._chain()
+        rows._for_write = True
+        with transaction.atomic(using=rows.db, savepoint=False):
+            catalog_deleting.send(
+                sender=self.model, queryset=rows, using=rows.db
+            )
+            return super(CatalogQuerySet, rows).delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class CatalogModel(models.Model):
+    """Row of a user's catalog, deleted through CatalogQuerySet"""
+    objects = CatalogQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(type(self), instance=self)
+        return type(self).objects.using(using).filter(pk=self.pk).delete()
+
+
+class NamedCatalogModel(CatalogModel):
+    """Catalog row remembering the name it was loaded with"""
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+
+    def name_changed(self):
+        """Return whether the name differs from the one in the database"""
+        return self._state.adding or \
+            self.name != getattr(self, '_loaded_name', None)
+
+
+class Tag(NamedCatalogModel):
     """Tag to be used for a drug"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class CanonicalIngredient(models.Model):
+    """Normalized ingredient name shared by all users' ingredients"""
+    name = models.CharField(max_length=255, unique=True)
 
     def __str__(self):
         return self.name
 
-class Ingredient(models.Model):
+class Ingredient(NamedCatalogModel):
     """Ingredient to be used for a drug"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    canonical = models.ForeignKey(
+        'CanonicalIngredient',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        db_constraint=False,
+        related_name='ingredients',
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+        ]
 
     def __str__(self):
         return self.name
 
-class Drug(models.Model):
+class Drug(CatalogModel):
     """Drug object"""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False,
     )
     title = models.CharField(max_length=255)
     daily_frequency = models.IntegerField()
@@ -81,6 +181,136 @@ class Drug(models.Model):
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=drug_image_file_path)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return self.title
+
+class DrugDocument(models.Model):
+    """Precomputed detail representation of a drug, as JSON"""
+    drug = models.OneToOneField(
+        'Drug',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='document',
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    body = models.TextField()
+
+    def __str__(self):
+        return str(self.drug_id)
+
+class UploadSession(models.Model):
+    """Resumable upload of a drug image, received in chunks"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    drug = models.ForeignKey(
+        'Drug',
+        on_delete=models.CASCADE,
+        related_name='upload_sessions',
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+
+class Tombstone(models.Model):
+    """Record of a deleted catalog row, for clients syncing changes"""
+    model = models.CharField(max_length=32)
+    object_id = models.IntegerField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.model} #{self.object_id}'
+
+
+class IdempotencyKey(models.Model):
+    """Stored response of a create request, replayed when retried"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(default=0)
+    body = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return self.key
+
+
+class Job(models.Model):
+    """Background job claimed and run by the run_worker command"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    queue = models.CharField(max_length=64, default='default')
+    name = models.CharField(max_length=255)
+    payload = models.TextField(default='{}')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=QUEUED
+    )
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    result = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['queue', 'status', 'run_at']),
+        ]
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return f'{self.name} #{self.pk}'
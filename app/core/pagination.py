@@ -0,0 +1,47 @@
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimate_count(queryset):
+    """Return the PostgreSQL planner's row estimate for `queryset`
+
+    Unfiltered tables use the statistics in pg_class, anything else
+    the estimate of EXPLAIN. Returns None on other databases.
+    """
+    conn = connections[queryset.db]
+    if conn.vendor != 'postgresql':
+        return None
+    with conn.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+            return int(row[0]) if row else None
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator using planner estimates instead of COUNT(*) on big tables
+
+    Below ESTIMATED_COUNT_THRESHOLD rows the exact count is cheap and
+    used instead, so small tables and narrow searches stay exact.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and \
+                estimate >= settings.ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return super().count
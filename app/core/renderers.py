@@ -0,0 +1,34 @@
+import json
+
+from rest_framework import renderers
+
+from core.instrumentation import span
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """JSON renderer reporting its time in the `render` span"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with span('render'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class BrowsableAPIRenderer(renderers.BrowsableAPIRenderer):
+    """Browsable API renderer reporting its time in the `render` span"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with span('render'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    """Renderer for server-sent event streams
+
+    Streams write their events themselves; this only lets clients ask
+    for text/event-stream and renders errors as a single event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ('event: error\ndata: %s\n\n' % json.dumps(data)).encode()
@@ -0,0 +1,103 @@
+import random
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import sharding
+
+_state = threading.local()
+
+
+def use_replicas(enabled):
+    """Allow or forbid reads from replicas on the current thread"""
+    _state.replicas = enabled
+
+
+def replicas_enabled():
+    """Return True if reads on this thread may go to a replica"""
+    return getattr(_state, 'replicas', False)
+
+
+def reset_writes():
+    """Forget writes recorded on the current thread"""
+    _state.wrote = False
+
+
+def has_written():
+    """Return True if the current thread wrote since reset_writes()"""
+    return getattr(_state, 'wrote', False)
+
+
+class ShardRouter:
+    """Send catalog queries to the shard owning the user's rows
+
+    The shard comes from the instance the query starts from when there
+    is one, otherwise from the shard activated for the current request.
+    Everything else falls through to the next router.
+    """
+
+    def _shard(self, model, hints):
+        if not sharding.is_sharded() or not sharding.is_catalog_model(model):
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, get_user_model()):
+            return sharding.shard_for_user(instance.pk)
+        if instance is not None and sharding.is_catalog_model(type(instance)):
+            if instance._state.db is not None:
+                return instance._state.db
+            if instance.user_id is not None:
+                return sharding.shard_for_user(instance.user_id)
+        return sharding.active_shard()
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Catalog rows reference users across databases.
+        if sharding.is_sharded() and (
+                sharding.is_catalog_model(type(obj1)) or
+                sharding.is_catalog_model(type(obj2))):
+            return True
+        return None
+
+
+class PrimaryReplicaRouter:
+    """Send reads to a random replica and writes to the primary
+
+    Reads only go to replicas while ReplicaRoutingMiddleware allows
+    it for the current request; management commands, tests and
+    anything inside a transaction keep reading from the primary.
+    """
+
+    def _replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', [])
+
+    def db_for_read(self, model, **hints):
+        replicas = self._replicas()
+        if not replicas or not replicas_enabled():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Once a request writes, its own later reads must see the write.
+        use_replicas(False)
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *self._replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in self._replicas():
+            return False
+        return None
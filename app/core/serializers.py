@@ -0,0 +1,21 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """Serializer for one API call inside a batch"""
+    method = serializers.ChoiceField(
+        choices=('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+    )
+    path = serializers.RegexField(r'^/api/', max_length=2000)
+    body = serializers.JSONField(required=False)
+
+
+class BatchSerializer(serializers.Serializer):
+    """Serializer for a batch of API calls"""
+    requests = serializers.ListField(
+        child=SubRequestSerializer(),
+        min_length=1,
+        max_length=settings.BATCH_MAX_REQUESTS,
+    )
+    parallel = serializers.BooleanField(default=False)
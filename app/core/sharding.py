@@ -0,0 +1,131 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Models whose rows belong to exactly one user and live on that user's
+# shard. Auto-created M2M through tables follow their owning model.
+CATALOG_MODELS = {
+    'core.tag', 'core.ingredient', 'core.drug', 'core.drugdocument',
+    'core.tombstone', 'core.uploadsession', 'core.idempotencykey',
+}
+
+ASSIGNMENT_CACHE_SECONDS = 300
+
+_state = threading.local()
+
+
+def shards():
+    """Return the database aliases catalog data is spread over"""
+    return getattr(settings, 'DATABASE_SHARDS', [DEFAULT_DB_ALIAS])
+
+
+def is_sharded():
+    return len(shards()) > 1
+
+
+def is_catalog_model(model):
+    """Return True if rows of `model` live on their owner's shard"""
+    opts = model._meta
+    if opts.auto_created:
+        opts = opts.auto_created._meta
+    return opts.label_lower in CATALOG_MODELS
+
+
+def _cache_key(user_id):
+    return 'user-shard:%s' % user_id
+
+
+def shard_for_user(user_id):
+    """Return the database alias holding the catalog of `user_id`
+
+    Users created before sharding have no assignment and their catalog
+    is still on the default database.
+    """
+    aliases = shards()
+    if len(aliases) == 1:
+        return aliases[0]
+    key = _cache_key(user_id)
+    alias = cache.get(key)
+    if alias is None:
+        from core.models import ShardAssignment
+        alias = ShardAssignment.objects.using(DEFAULT_DB_ALIAS) \
+            .filter(user_id=user_id) \
+            .values_list('alias', flat=True).first()
+        if alias is None:
+            alias = DEFAULT_DB_ALIAS
+        cache.set(key, alias, ASSIGNMENT_CACHE_SECONDS)
+    return alias
+
+
+def place(user_id):
+    """Assign a new user to a shard, spreading users by id"""
+    aliases = shards()
+    assign(user_id, aliases[user_id % len(aliases)])
+
+
+def assign(user_id, alias):
+    """Record that the catalog of `user_id` now lives on `alias`"""
+    from core.models import ShardAssignment
+    ShardAssignment.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=user_id, defaults={'alias': alias}
+    )
+    cache.delete(_cache_key(user_id))
+
+
+def id_range(alias):
+    """Return the first and last primary key allocated on shard `alias`
+
+    Each shard allocates ids from its own range, so catalog rows keep
+    their ids when moved between shards.
+    """
+    index = shards().index(alias)
+    span = settings.SHARD_ID_SPAN
+    return index * span + 1, (index + 1) * span
+
+
+def reset_sequences(alias, models):
+    """Point the id sequences of `models` on `alias` into its id range
+
+    The next id is past every id of the range already in use; rows
+    copied from other shards carry ids outside it and are ignored.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return
+    first, last = id_range(alias)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model in models:
+            table = model._meta.db_table
+            column = model._meta.pk.column
+            cursor.execute(
+                'SELECT pg_get_serial_sequence(%s, %s)', [table, column]
+            )
+            sequence = cursor.fetchone()[0]
+            cursor.execute(
+                'SELECT setval(%%s::regclass, GREATEST(%%s, ('
+                'SELECT MAX(%(column)s) + 1 FROM %(table)s '
+                'WHERE %(column)s BETWEEN %%s AND %%s)), false)'
+                % {'column': quote(column), 'table': quote(table)},
+                [sequence, first, first, last]
+            )
+            # Running out of the range fails instead of colliding.
+            cursor.execute(
+                'ALTER SEQUENCE %s MAXVALUE %d' % (sequence, last)
+            )
+
+
+def activate(user_id):
+    """Route catalog queries on this thread to the shard of `user_id`"""
+    _state.alias = shard_for_user(user_id) if is_sharded() else None
+
+
+def deactivate():
+    _state.alias = None
+
+
+def active_shard():
+    """Return the shard activated for this thread, if any"""
+    return getattr(_state, 'alias', None)
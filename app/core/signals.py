@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, pre_delete, pre_save
+
+from core import canonical, middleware, sharding
+from core.models import Tag, Ingredient, Drug, IdempotencyKey, Tombstone
+
+
+def delete_sharded_catalog(sender, instance, using, **kwargs):
+    """Delete a user's catalog rows that live on another shard"""
+    alias = sharding.shard_for_user(instance.pk)
+    if alias == using:
+        return
+    # Like the cascade on the user's own database, skip catalog_deleting:
+    # tombstones for a user who no longer exists would never be read.
+    for model in (Drug, Tag, Ingredient, Tombstone, IdempotencyKey):
+        model._base_manager.using(alias).filter(user_id=instance.pk) \
+            .delete()
+
+
+def place_new_user(sender, instance, created, raw=False, **kwargs):
+    """Record the shard of a new user's catalog"""
+    if created and not raw and sharding.is_sharded():
+        sharding.place(instance.pk)
+
+
+def link_canonical_ingredient(sender, instance, raw=False, **kwargs):
+    """Point an ingredient at the canonical entry for its name"""
+    if not raw:
+        instance.canonical_id = canonical.lookup(instance.name)
+
+
+def connect():
+    pre_delete.connect(
+        delete_sharded_catalog,
+        sender=get_user_model(),
+        dispatch_uid='core.delete_sharded_catalog',
+    )
+    post_save.connect(
+        place_new_user,
+        sender=get_user_model(),
+        dispatch_uid='core.place_new_user',
+    )
+    connection_created.connect(
+        middleware.apply_statement_timeout,
+        dispatch_uid='core.apply_statement_timeout',
+    )
+    pre_save.connect(
+        link_canonical_ingredient,
+        sender=Ingredient,
+        dispatch_uid='core.link_canonical_ingredient',
+    )
@@ -0,0 +1,84 @@
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+POLL_SECONDS = 0.01
+MAX_POLL_SECONDS = 0.2
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group:
+    """Run a function once per key for every caller arriving meanwhile
+
+    Threads asking for a key that is already being computed in this
+    process wait for that computation and share its result or error.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """Return the result of `func` and whether it was shared"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+def get_or_fill(key, func, timeout, lock_timeout, wait):
+    """Return the cached value of `key`, filling it with `func` on a miss
+
+    Only the process holding the fill lock calls `func`; others poll
+    the cache for its result for up to `wait` seconds before computing
+    it themselves. Returns the value and 'hit', 'waited' or 'miss'.
+    """
+    lock_key = '%s:lock' % key
+    deadline = time.monotonic() + wait
+    delay = POLL_SECONDS
+    outcome = 'hit'
+    while True:
+        value = cache.get(key)
+        if value is not None:
+            return value, outcome
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, lock_timeout):
+            try:
+                value = func()
+                cache.set(key, value, timeout)
+            finally:
+                # The lock may have expired and been taken by another.
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+            return value, 'miss'
+        if time.monotonic() >= deadline:
+            return func(), 'miss'
+        outcome = 'waited'
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_POLL_SECONDS)
@@ -1,7 +1,12 @@
+from unittest.mock import patch
+
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from core.models import Drug, Ingredient, Tag
+from core.pagination import EstimatedCountPaginator
+
 
 class AdminSiteTests(TestCase):
 
@@ -38,4 +43,43 @@ class AdminSiteTests(TestCase):
         url = reverse('admin:core_user_add')
         res = self.client.get(url)
 
-        self.assertEqual(res.status_code, 200)
\ No newline at end of file
+        self.assertEqual(res.status_code, 200)
+
+    def test_catalog_changelists(self):
+        """Test the catalog changelists load and search by prefix"""
+        tag = Tag.objects.create(user=self.user, name='Morning')
+        Tag.objects.create(user=self.user, name='Evening')
+        drug = Drug.objects.create(
+            user=self.user, title='Vitamin', daily_frequency=1, price=2
+        )
+        drug.tags.add(tag)
+
+        res = self.client.get(
+            reverse('admin:core_tag_changelist'), {'q': 'morn'}
+        )
+        self.assertContains(res, 'Morning')
+        self.assertNotContains(res, 'Evening')
+
+        res = self.client.get(reverse('admin:core_drug_changelist'))
+        self.assertContains(res, drug.title)
+
+        url = reverse('admin:core_drug_change', args=[drug.id])
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+
+    def test_user_autocomplete(self):
+        """Test users can be searched for catalog autocomplete widgets"""
+        url = reverse('admin:core_user_autocomplete')
+        res = self.client.get(url, {'term': 'test@'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, self.user.email)
+
+    def test_paginator_exact_count_without_estimates(self):
+        """Test the paginator counts exactly where no estimate exists"""
+        Ingredient.objects.create(user=self.user, name='Zinc')
+
+        paginator = EstimatedCountPaginator(Ingredient.objects.all(), 10)
+
+        with patch('core.pagination.estimate_count', return_value=None):
+            self.assertEqual(paginator.count, 1)
@@ -0,0 +1,91 @@
+import threading
+
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from django.urls import resolve
+
+from core.middleware import AdmissionControlMiddleware, Limiter
+
+
+class LimiterTests(SimpleTestCase):
+
+    def test_sheds_when_queue_is_full(self):
+        """Test callers beyond the limit and queue are refused"""
+        limiter = Limiter(limit=1, queue_size=0)
+
+        self.assertTrue(limiter.acquire(timeout=0))
+        self.assertFalse(limiter.acquire(timeout=1))
+        limiter.release()
+        self.assertTrue(limiter.acquire(timeout=0))
+
+    def test_queued_caller_gets_released_slot(self):
+        """Test a waiting caller takes the slot once it is released"""
+        limiter = Limiter(limit=1, queue_size=1)
+        limiter.acquire(timeout=0)
+        results = []
+        waiter = threading.Thread(
+            target=lambda: results.append(limiter.acquire(timeout=5))
+        )
+        waiter.start()
+
+        limiter.release()
+        waiter.join(5)
+
+        self.assertEqual(results, [True])
+        self.assertEqual(limiter.active, 1)
+
+    def test_queued_caller_gives_up_at_deadline(self):
+        """Test a waiting caller is refused once its wait times out"""
+        limiter = Limiter(limit=1, queue_size=1)
+        limiter.acquire(timeout=0)
+
+        self.assertFalse(limiter.acquire(timeout=0.01))
+        self.assertEqual(limiter.waiting, 0)
+
+
+@override_settings(
+    ADMISSION_LIMITS={'drug:drug-list': 1},
+    ADMISSION_QUEUE_SIZE=0,
+    ADMISSION_RETRY_AFTER_SECONDS=3,
+)
+class AdmissionControlMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = AdmissionControlMiddleware(self._view)
+
+    def _view(self, request):
+        # The handler runs process_view between the middleware and view
+        self.middleware.process_view(request, None, (), {})
+        return HttpResponse()
+
+    def request(self, path):
+        request = self.factory.get(path)
+        request.resolver_match = resolve(path)
+        return request
+
+    def test_busy_route_is_shed(self):
+        """Test a route at its limit answers 503 with Retry-After"""
+        busy = self.request('/api/drug/drugs/')
+        self.assertIsNone(self.middleware.process_view(busy, None, (), {}))
+
+        res = self.middleware.process_view(
+            self.request('/api/drug/drugs/'), None, (), {}
+        )
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], '3')
+
+    def test_slot_released_after_response(self):
+        """Test a finished request frees its slot"""
+        self.middleware(self.request('/api/drug/drugs/'))
+
+        limiter = self.middleware.limiters['drug:drug-list']
+        self.assertEqual(limiter.active, 0)
+
+    def test_unlisted_routes_not_limited(self):
+        """Test routes without a limit always pass"""
+        for _ in range(3):
+            self.assertIsNone(self.middleware.process_view(
+                self.request('/api/drug/tags/'), None, (), {}
+            ))
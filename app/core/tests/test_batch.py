@@ -0,0 +1,168 @@
+import threading
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import batch
+from core.middleware import StatementTimeout
+from core.models import Tag
+
+BATCH_URL = reverse('batch')
+
+
+def sample_user(email='test@dummy.com', password='testpass'):
+    return get_user_model().objects.create_user(email, password)
+
+
+class BatchApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = sample_user()
+        self.client.force_authenticate(self.user)
+
+    def post(self, *requests, **params):
+        return self.client.post(
+            BATCH_URL, dict(requests=list(requests), **params), format='json'
+        )
+
+    def test_login_required(self):
+        """Test that login is required for batches"""
+        res = APIClient().post(BATCH_URL, {}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_batch_dispatches_in_order(self):
+        """Test sub-requests see each other's writes and keep their order"""
+        res = self.post(
+            {'method': 'GET', 'path': '/api/user/me/'},
+            {'method': 'POST', 'path': '/api/drug/tags/',
+             'body': {'name': 'Morning'}},
+            {'method': 'GET', 'path': '/api/drug/tags/?assigned_only=0'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        me, created, tags = res.data['responses']
+        self.assertEqual(me['status'], 200)
+        self.assertEqual(me['body']['email'], self.user.email)
+        self.assertEqual(created['status'], 201)
+        self.assertEqual(tags['body'], [created['body']])
+        self.assertTrue(
+            Tag.objects.filter(user=self.user, name='Morning').exists()
+        )
+
+    def test_sub_request_errors(self):
+        """Test failing sub-requests report their own status"""
+        res = self.post(
+            {'method': 'GET', 'path': '/api/drug/drugs/999/'},
+            {'method': 'GET', 'path': '/api/nothing/'},
+            {'method': 'POST', 'path': '/api/drug/tags/', 'body': {}},
+            {'method': 'POST', 'path': '/api/batch/', 'body': {}},
+        )
+
+        statuses = [item['status'] for item in res.data['responses']]
+        self.assertEqual(statuses, [404, 404, 400, 400])
+
+    def test_sub_requests_limited_to_user(self):
+        """Test sub-requests run as the batch's user"""
+        other = sample_user('other@dummy.com')
+        Tag.objects.create(user=other, name='Other')
+
+        res = self.post({'method': 'GET', 'path': '/api/drug/tags/'})
+
+        self.assertEqual(res.data['responses'][0]['body'], [])
+
+    def test_sub_requests_hold_admission_limits(self):
+        """Test sub-requests take and free slots of their route's limit"""
+        with self.settings(ADMISSION_LIMITS={'drug:drug-list': 1}):
+            res = self.post(
+                {'method': 'GET', 'path': '/api/drug/drugs/'},
+                {'method': 'GET', 'path': '/api/drug/drugs/'},
+            )
+
+        statuses = [item['status'] for item in res.data['responses']]
+        self.assertEqual(statuses, [200, 200])
+
+    def test_busy_sub_route_is_shed(self):
+        """Test sub-requests to a route at its limit answer 503"""
+        with self.settings(ADMISSION_LIMITS={'drug:drug-list': 0},
+                           ADMISSION_QUEUE_SIZE=0):
+            res = self.post(
+                {'method': 'GET', 'path': '/api/drug/drugs/'},
+                {'method': 'GET', 'path': '/api/drug/tags/'},
+            )
+
+        statuses = [item['status'] for item in res.data['responses']]
+        self.assertEqual(statuses, [503, 200])
+
+    def test_sub_requests_use_route_statement_timeout(self):
+        """Test each sub-request runs under its own route's timeout"""
+        timeouts = {'drug:tag-list.list': 1234}
+        with self.settings(STATEMENT_TIMEOUTS=timeouts,
+                           STATEMENT_TIMEOUT_MS=30000), \
+                patch.object(StatementTimeout, 'set', autospec=True,
+                             side_effect=StatementTimeout.set) as set_timeout:
+            self.post({'method': 'GET', 'path': '/api/drug/tags/'})
+
+        values = [call[0][1] for call in set_timeout.call_args_list]
+        # The batch's own timeout is restored after the sub-request.
+        self.assertEqual(values, [30000, 1234, 30000])
+
+    def test_invalid_batch(self):
+        """Test paths outside the API and oversized batches are rejected"""
+        res = self.post({'method': 'GET', 'path': '/admin/'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.post(*[{'method': 'GET', 'path': '/api/user/me/'}] * 100)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExecuteTests(TestCase):
+
+    @patch('core.batch.connections')
+    def test_parallel_reads_between_writes(self, conns):
+        """Test consecutive GETs run on threads and writes stay in order"""
+        calls = []
+        lock = threading.Lock()
+
+        def func(parent, item):
+            with lock:
+                calls.append((item['method'], threading.get_ident()))
+            return item['path']
+
+        items = [
+            {'method': 'GET', 'path': 'a'},
+            {'method': 'GET', 'path': 'b'},
+            {'method': 'POST', 'path': 'c'},
+            {'method': 'GET', 'path': 'd'},
+        ]
+        # TestCase wraps tests in a transaction, which keeps execute()
+        # sequential; pretend there is none.
+        conns.all.return_value = []
+        with self.settings(BATCH_MAX_WORKERS=2):
+            results = batch.execute(None, items, True, func=func)
+
+        self.assertEqual(results, ['a', 'b', 'c', 'd'])
+        main = threading.get_ident()
+        self.assertEqual(
+            [ident == main for method, ident in calls if method == 'POST'],
+            [True]
+        )
+        self.assertNotIn(
+            main, [ident for method, ident in calls if method == 'GET']
+        )
+
+    def test_transaction_keeps_batch_sequential(self):
+        """Test sub-requests inside a transaction are not parallelized"""
+        idents = []
+
+        def func(parent, item):
+            idents.append(threading.get_ident())
+
+        batch.execute(None, [{'method': 'GET', 'path': 'a'}], True, func=func)
+
+        self.assertEqual(idents, [threading.get_ident()])
@@ -0,0 +1,79 @@
+from importlib import import_module
+from unittest.mock import MagicMock
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core import canonical
+from core.models import CanonicalIngredient, Ingredient
+
+migration = import_module('core.migrations.0011_canonical_ingredient')
+
+
+def sample_user(email='test@dummy.com', password='testpass'):
+    return get_user_model().objects.create_user(email, password)
+
+
+class CanonicalIngredientTests(TestCase):
+
+    def setUp(self):
+        canonical.clear_cache()
+
+    def test_normalize(self):
+        """Test names differing in case, spacing and width normalize"""
+        self.assertEqual(canonical.normalize('  Vitamin   C '), 'vitamin c')
+        self.assertEqual(canonical.normalize('ＺＩＮＣ'), 'zinc')
+        self.assertEqual(canonical.normalize('Straße'), 'strasse')
+
+    def test_ingredients_share_canonical(self):
+        """Test equivalent ingredients of different users share a row"""
+        first = Ingredient.objects.create(
+            user=sample_user(), name='Paracetamol'
+        )
+        second = Ingredient.objects.create(
+            user=sample_user('other@dummy.com'), name='paracetamol '
+        )
+
+        self.assertEqual(first.canonical_id, second.canonical_id)
+        self.assertEqual(first.canonical.name, 'paracetamol')
+        self.assertEqual(CanonicalIngredient.objects.count(), 1)
+
+    def test_rename_relinks(self):
+        """Test renaming an ingredient points it at the new name"""
+        ingredient = Ingredient.objects.create(
+            user=sample_user(), name='Zinc'
+        )
+
+        ingredient.name = 'Iron'
+        ingredient.save()
+
+        self.assertEqual(ingredient.canonical.name, 'iron')
+
+    def test_lookup_cached(self):
+        """Test known names are resolved without a query"""
+        CanonicalIngredient.objects.create(name='zinc')
+        canonical.lookup('Zinc')
+
+        with self.assertNumQueries(0):
+            canonical.lookup('ZINC')
+
+    def test_migration_backfill(self):
+        """Test the migration links existing ingredients"""
+        user = sample_user()
+        Ingredient.objects.bulk_create([
+            Ingredient(user=user, name='Zinc'),
+            Ingredient(user=user, name='zinc'),
+            Ingredient(user=user, name='Iron'),
+        ])
+        CanonicalIngredient.objects.create(name='iron')
+
+        migration.link_canonical(apps, MagicMock(connection=MagicMock(
+            alias='default'
+        )))
+
+        links = dict(Ingredient.objects.values_list('name', 'canonical__name'))
+        self.assertEqual(
+            links, {'Zinc': 'zinc', 'zinc': 'zinc', 'Iron': 'iron'}
+        )
+        self.assertEqual(CanonicalIngredient.objects.count(), 2)
@@ -1,8 +1,17 @@
-from unittest.mock import patch
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch, MagicMock
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import IdempotencyKey, Tombstone
 
 
 class CommandTests(TestCase):
@@ -10,14 +19,94 @@ class CommandTests(TestCase):
     def test_wait_for_db_ready(self):
         """Test waiting for db when db is available"""
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
+            gi.return_value = MagicMock()
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 1)
+            cursor = gi.return_value.cursor.return_value.__enter__()
+            cursor.execute.assert_called_once_with('SELECT 1')
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
         """Test waiting for db"""
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
+            gi.side_effect = [OperationalError] * 5 + [MagicMock()]
             call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
\ No newline at end of file
+            self.assertEqual(gi.call_count, 6)
+            self.assertEqual(ts.call_count, 5)
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_backoff_is_capped(self, ts):
+        """Test retry delays grow but never exceed the maximum"""
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi, \
+                patch('random.uniform', side_effect=lambda a, b: b):
+            gi.side_effect = [OperationalError] * 6 + [MagicMock()]
+            call_command('wait_for_db', initial_delay=1, max_delay=4)
+
+        delays = [c[0][0] for c in ts.call_args_list]
+        self.assertEqual(delays, [1, 2, 4, 4, 4, 4])
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_timeout(self, ts):
+        """Test the command fails once the timeout has elapsed"""
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.side_effect = OperationalError
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=0)
+
+    def test_bench_report(self):
+        """Test the benchmark seeds data and reports every scenario"""
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media):
+            call_command(
+                'bench', users=2, tags=3, ingredients=4, drugs=5,
+                clients=1, requests=4, stdout=out
+            )
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(
+            set(report['scenarios']),
+            {'list', 'filter', 'detail', 'create', 'upload_image'}
+        )
+        for result in report['scenarios'].values():
+            self.assertEqual(result['requests'], 4)
+            self.assertEqual(result['errors'], 0)
+            self.assertGreater(result['queries_per_request'], 0)
+        self.assertFalse(
+            get_user_model().objects.filter(email__startswith='bench-')
+            .exists()
+        )
+
+    def test_prune_tombstones(self):
+        """Test only tombstones past the retention are deleted"""
+        user = get_user_model().objects.create_user(
+            'prune@dummy.com', 'testpass'
+        )
+        Tombstone.objects.create(
+            model='drug', object_id=1, user=user,
+            deleted_at=timezone.now() - timedelta(days=365),
+        )
+        recent = Tombstone.objects.create(model='drug', object_id=2, user=user)
+
+        call_command('prune_tombstones', stdout=StringIO())
+
+        remaining = Tombstone.objects.values_list('pk', flat=True)
+        self.assertEqual(list(remaining), [recent.pk])
+
+    def test_prune_idempotency_keys(self):
+        """Test only idempotency keys past their TTL are deleted"""
+        user = get_user_model().objects.create_user(
+            'prune@dummy.com', 'testpass'
+        )
+        IdempotencyKey.objects.create(
+            user=user, key='old', fingerprint='x',
+            created_at=timezone.now() - timedelta(days=2),
+        )
+        recent = IdempotencyKey.objects.create(
+            user=user, key='new', fingerprint='x'
+        )
+
+        call_command('prune_idempotency_keys', stdout=StringIO())
+
+        remaining = IdempotencyKey.objects.values_list('pk', flat=True)
+        self.assertEqual(list(remaining), [recent.pk])
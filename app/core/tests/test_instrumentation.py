@@ -0,0 +1,76 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import instrumentation
+from core.models import Tag
+
+TAGS_URL = reverse('drug:tag-list')
+
+
+class InstrumentationTests(TestCase):
+
+    def test_nested_spans_count_once(self):
+        """Test a span nested in itself is only timed by the outer one"""
+        profile = instrumentation.start()
+        try:
+            with instrumentation.span('ser'):
+                with instrumentation.span('ser'):
+                    pass
+        finally:
+            instrumentation.stop()
+
+        self.assertEqual(list(profile.spans), ['ser'])
+
+    def test_span_without_profile(self):
+        """Test spans are no-ops outside of a request"""
+        with instrumentation.span('ser'):
+            pass
+
+        self.assertIsNone(instrumentation.current())
+
+
+class ServerTimingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'password123'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_server_timing_header(self):
+        """Test API responses report their timings"""
+        res = self.client.get(TAGS_URL)
+
+        timing = res['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        for name in ('auth', 'ser', 'render', 'app'):
+            self.assertIn('%s;dur=' % name, timing)
+
+    @override_settings(SLOW_REQUEST_MS=0, SLOW_REQUEST_SAMPLE_RATE=1)
+    def test_slow_request_logged_with_sql(self):
+        """Test sampled slow requests are logged with their queries"""
+        with patch('core.middleware.logger') as logger:
+            self.client.get(TAGS_URL)
+
+        message = logger.warning.call_args[0][0] % \
+            logger.warning.call_args[0][1:]
+        self.assertIn(TAGS_URL, message)
+        self.assertIn('core_tag', message)
+
+    @override_settings(SLOW_REQUEST_SAMPLE_RATE=0)
+    def test_fast_request_not_logged(self):
+        """Test requests are not logged when not sampled"""
+        with patch('core.middleware.logger') as logger:
+            self.client.get(TAGS_URL)
+
+        logger.warning.assert_not_called()
@@ -0,0 +1,119 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+calls = []
+
+
+@jobs.task(name='tests.record')
+def record(value):
+    calls.append(value)
+    return {'value': value}
+
+
+@jobs.task(name='tests.explode', max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+@jobs.task(name='tests.limited', queue='limited')
+def limited():
+    return None
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_run_job(self):
+        """Test a claimed job runs its task and stores the result"""
+        job = record.delay(value=3)
+
+        claimed = jobs.claim('default', 'worker-1')
+        jobs.run(claimed)
+
+        job.refresh_from_db()
+        self.assertEqual(calls, [3])
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, '{"value": 3}')
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(jobs.claim('default', 'worker-1'))
+
+    def test_future_job_not_claimed(self):
+        """Test jobs are only claimed once they are due"""
+        record.delay(value=1, run_in=60)
+
+        self.assertIsNone(jobs.claim('default', 'worker-1'))
+
+    def test_failed_job_retried_with_backoff(self):
+        """Test a failing job is requeued for later, then given up"""
+        job = explode.delay()
+
+        jobs.run(jobs.claim('default', 'worker-1'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('RuntimeError: boom', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.run(jobs.claim('default', 'worker-1'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    @override_settings(JOB_QUEUE_CONCURRENCY={'limited': 1})
+    def test_queue_concurrency_limit(self):
+        """Test no more jobs than the queue limit run at once"""
+        limited.delay()
+        limited.delay()
+
+        first = jobs.claim('limited', 'worker-1')
+
+        self.assertIsNotNone(first)
+        self.assertIsNone(jobs.claim('limited', 'worker-2'))
+        jobs.run(first)
+        self.assertIsNotNone(jobs.claim('limited', 'worker-2'))
+
+    def test_stale_jobs_requeued(self):
+        """Test jobs left running by a dead worker are requeued"""
+        job = record.delay(value=1)
+        jobs.claim('default', 'worker-1')
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(days=1)
+        )
+
+        self.assertEqual(jobs.requeue_stale('default'), 1)
+        self.assertEqual(jobs.claim('default', 'worker-2').pk, job.pk)
+
+    @override_settings(JOB_REQUEUE_INTERVAL_SECONDS=0)
+    def test_worker_requeues_while_running(self):
+        """Test the worker keeps putting back stale jobs as it runs"""
+        record.delay(value=1)
+        record.delay(value=2)
+
+        # Closing connections would end the test case's transaction.
+        with patch('core.jobs.requeue_stale') as requeue_stale, \
+                patch('signal.signal'), patch(
+                    'core.management.commands.run_worker'
+                    '.close_old_connections'):
+            call_command('run_worker', burst=True, stdout=StringIO())
+
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(requeue_stale.call_count, 3)
+
+    def test_job_owner_recorded(self):
+        """Test jobs can be attached to a user"""
+        user = get_user_model().objects.create_user('a@dummy.com', 'pass')
+
+        job = record.delay(user=user, value=1)
+
+        self.assertEqual(job.user, user)
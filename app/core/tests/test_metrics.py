@@ -0,0 +1,157 @@
+import json
+import os
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import metrics
+
+METRICS_URL = reverse('metrics')
+TAGS_URL = reverse('drug:tag-list')
+DEAD_PID = 2 ** 22 + 1
+
+
+def sample_registry():
+    """Create a registry with one metric of each kind"""
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter('jobs', 'Jobs', ('queue',)))
+    gauge = registry.register(metrics.Gauge('busy', 'Busy workers'))
+    histogram = registry.register(metrics.Histogram(
+        'latency', 'Latency', ('route',), buckets=(0.1, 1)
+    ))
+    return registry, counter, gauge, histogram
+
+
+class RegistryTests(TestCase):
+
+    def test_histogram_exposition(self):
+        """Test histograms render cumulative buckets, sum and count"""
+        registry, _, _, histogram = sample_registry()
+        histogram.observe(0.05, route='drug:drug-list')
+        histogram.observe(0.5, route='drug:drug-list')
+        histogram.observe(3, route='drug:drug-list')
+
+        text = registry.exposition()
+
+        self.assertIn('# TYPE latency histogram', text)
+        self.assertIn('latency_bucket{route="drug:drug-list",le="0.1"} 1', text)
+        self.assertIn('latency_bucket{route="drug:drug-list",le="1.0"} 2', text)
+        self.assertIn('latency_bucket{route="drug:drug-list",le="+Inf"} 3',
+                      text)
+        self.assertIn('latency_count{route="drug:drug-list"} 3', text)
+
+    def test_labels_must_match(self):
+        """Test observing with the wrong label names fails"""
+        _, counter, _, _ = sample_registry()
+
+        with self.assertRaises(ValueError):
+            counter.inc(route='x')
+
+    def test_merges_other_processes(self):
+        """Test snapshots of other workers are merged into the output"""
+        registry, counter, gauge, histogram = sample_registry()
+        counter.inc(2, queue='images')
+        gauge.set(1)
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot = {
+                'pid': DEAD_PID,
+                'metrics': {
+                    'jobs': {'type': 'counter', 'samples': [[['images'], 3]]},
+                    'busy': {'type': 'gauge', 'samples': [[[], 4]]},
+                },
+            }
+            path = os.path.join(directory, 'metrics-%d.json' % DEAD_PID)
+            with open(path, 'w') as fh:
+                json.dump(snapshot, fh)
+
+            with override_settings(METRICS_DIR=directory):
+                text = registry.exposition()
+
+        self.assertIn('jobs{queue="images"} 5', text)
+        # Gauges of exited workers are dropped.
+        self.assertIn('busy 1', text)
+
+    def test_flush_writes_snapshot(self):
+        """Test a process writes its snapshot to METRICS_DIR"""
+        registry, counter, _, _ = sample_registry()
+        counter.inc(queue='default')
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(METRICS_DIR=directory):
+                registry.flush()
+            path = os.path.join(directory, 'metrics-%d.json' % os.getpid())
+            with open(path) as fh:
+                snapshot = json.load(fh)
+
+        self.assertEqual(
+            snapshot['metrics']['jobs']['samples'], [[['default'], 1]]
+        )
+
+
+class FlushTests(TestCase):
+
+    def test_flushed_without_further_observations(self):
+        """Test snapshots are written on a timer, not on the next change"""
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory,
+                                  METRICS_FLUSH_SECONDS=0.01):
+            path = os.path.join(directory, 'metrics-%d.json' % os.getpid())
+            metrics.READ_CACHE.inc(cache='tests', outcome='hit')
+            deadline = time.monotonic() + 5
+            while not os.path.exists(path) and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            self.assertTrue(os.path.exists(path))
+
+    def test_pool_totals_are_counters(self):
+        """Test pool event totals export as counters, sizes as gauges"""
+        text = metrics.REGISTRY.exposition()
+
+        self.assertIn('# TYPE db_pool_events_total counter', text)
+        self.assertIn('# TYPE db_pool_wait_seconds_total counter', text)
+        self.assertIn('# TYPE db_pool_connections gauge', text)
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsEndpointTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'password123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_request_latency_recorded(self):
+        """Test requests are recorded by URL name and DRF action"""
+        self.client.get(TAGS_URL)
+
+        res = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer secret'
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(
+            res,
+            'http_request_duration_seconds_count{route="drug:tag-list",'
+            'action="list",method="GET"}'
+        )
+        self.assertContains(
+            res,
+            'http_requests_total{route="drug:tag-list",action="list",'
+            'method="GET",status="200"}'
+        )
+
+    def test_metrics_require_token(self):
+        """Test the metrics endpoint is hidden without the token"""
+        wrong = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer x')
+        with override_settings(METRICS_TOKEN=None):
+            unset = self.client.get(METRICS_URL)
+
+        self.assertEqual(wrong.status_code, 404)
+        self.assertEqual(unset.status_code, 404)
@@ -76,5 +76,5 @@ class ModelTests(TestCase):
         mock_uuid.return_value = uuid
         file_path = models.drug_image_file_path(None, 'myimage.jpg')
 
-        exp_path = f'uploads/drug/{uuid}.jpg'
+        exp_path = f'uploads/drug/te/st/{uuid}.jpg'
         self.assertEqual(file_path, exp_path)
\ No newline at end of file
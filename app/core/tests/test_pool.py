@@ -0,0 +1,150 @@
+import time
+from unittest import skipUnless
+from unittest.mock import MagicMock
+
+from django.db import connections
+from django.test import SimpleTestCase
+
+from core.backends.postgresql_pool.pool import ConnectionPool, PoolTimeout
+
+POOLED = connections['default'].settings_dict['ENGINE'] == \
+    'core.backends.postgresql_pool'
+
+
+def sample_pool(**params):
+    """Create a pool of mock connections"""
+    defaults = {
+        'connect': MagicMock(side_effect=lambda: MagicMock()),
+        'check': MagicMock(return_value=True),
+        'reset': MagicMock(return_value=True),
+        'close': MagicMock(),
+        'max_size': 2,
+        'timeout': 0.01,
+    }
+    defaults.update(params)
+
+    return ConnectionPool(**defaults)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def test_released_connection_is_reused(self):
+        """Test a released connection is handed out again"""
+        pool = sample_pool()
+        conn = pool.acquire()
+        pool.release(conn)
+
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+    def test_exhausted_pool_times_out(self):
+        """Test checkout fails once max_size connections are in use"""
+        pool = sample_pool()
+        pool.acquire()
+        pool.acquire()
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        stats = pool.stats()
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['waits'], 1)
+        self.assertEqual(stats['in_use'], 2)
+
+    def test_dead_connection_replaced_on_borrow(self):
+        """Test connections failing the liveness check are discarded"""
+        check = MagicMock(return_value=False)
+        pool = sample_pool(check=check, check_after=0)
+        conn = pool.acquire()
+        pool.release(conn)
+
+        new_conn = pool.acquire()
+
+        self.assertIsNot(new_conn, conn)
+        check.assert_called_once_with(conn)
+        self.assertEqual(pool.stats()['discarded'], 1)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_connection_failing_reset_is_discarded(self):
+        """Test a connection that cannot be reset is not pooled"""
+        close = MagicMock()
+        pool = sample_pool(reset=MagicMock(return_value=False), close=close)
+        conn = pool.acquire()
+        pool.release(conn)
+
+        close.assert_called_once_with(conn)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_prefill_opens_min_size(self):
+        """Test prefill opens min_size idle connections"""
+        pool = sample_pool(min_size=2)
+        pool.prefill()
+
+        stats = pool.stats()
+        self.assertEqual(stats['idle'], 2)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_failed_connect_frees_slot(self):
+        """Test a failed connect does not leak pool capacity"""
+        connect = MagicMock(side_effect=[OSError, MagicMock(), MagicMock()])
+        pool = sample_pool(connect=connect)
+
+        with self.assertRaises(OSError):
+            pool.acquire()
+        pool.acquire()
+        pool.acquire()
+        self.assertEqual(pool.stats()['size'], 2)
+
+    def test_oldest_idle_connection_expires(self):
+        """Test connections idle past max_idle are closed, oldest first"""
+        close = MagicMock()
+        pool = sample_pool(close=close, max_idle=0.05)
+        old, recent = pool.acquire(), pool.acquire()
+        pool.release(old)
+        time.sleep(0.1)
+        pool.release(recent)
+
+        self.assertIs(pool.acquire(), recent)
+        close.assert_called_once_with(old)
+        self.assertEqual(pool.stats()['expired'], 1)
+        self.assertEqual(pool.stats()['size'], 1)
+
+
+@skipUnless(POOLED, 'pooled PostgreSQL backend only')
+class PooledBackendTests(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        # A wrapper of its own, so checkouts do not disturb the test case.
+        default = connections['default']
+        self.conn = type(default)(
+            dict(default.settings_dict, POOL={'MIN_SIZE': 1}),
+            alias='pool_tests',
+        )
+        self.addCleanup(lambda: self.conn.get_pool().close_all())
+        self.addCleanup(self.conn.close)
+
+    def test_close_returns_connection_to_pool(self):
+        """Test closing hands the session back for the next checkout"""
+        self.conn.ensure_connection()
+        session = self.conn.connection
+        self.conn.close()
+        self.conn.ensure_connection()
+
+        self.assertIs(self.conn.connection, session)
+        stats = self.conn.get_pool().stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+
+    def test_leftover_transaction_rolled_back(self):
+        """Test a session is returned to the pool without its transaction"""
+        self.conn.ensure_connection()
+        self.conn.set_autocommit(False)
+        with self.conn.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE leftover (id int)')
+        self.conn.close()
+
+        self.conn.ensure_connection()
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pg_temp.leftover')")
+            self.assertIsNone(cursor.fetchone()[0])
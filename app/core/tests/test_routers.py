@@ -0,0 +1,73 @@
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+
+from core import routers
+from core.middleware import ReplicaRoutingMiddleware
+from core.models import Drug
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+
+    def tearDown(self):
+        routers.use_replicas(False)
+
+    def test_reads_use_primary_by_default(self):
+        """Test reads outside a routed request use the primary"""
+        self.assertEqual(self.router.db_for_read(Drug), 'default')
+
+    def test_reads_use_replica_when_enabled(self):
+        """Test reads go to a replica when the request allows it"""
+        routers.use_replicas(True)
+
+        self.assertEqual(self.router.db_for_read(Drug), 'replica_1')
+
+    def test_write_pins_following_reads(self):
+        """Test reads after a write in the same request use the primary"""
+        routers.use_replicas(True)
+        routers.reset_writes()
+
+        self.assertEqual(self.router.db_for_write(Drug), 'default')
+        self.assertEqual(self.router.db_for_read(Drug), 'default')
+        self.assertTrue(routers.has_written())
+
+    def test_replicas_never_migrated(self):
+        """Test migrations are not run against replicas"""
+        self.assertFalse(self.router.allow_migrate('replica_1', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.seen = []
+        self.middleware = ReplicaRoutingMiddleware(self._view)
+        cache.clear()
+
+    def _view(self, request):
+        self.seen.append(routers.replicas_enabled())
+        return HttpResponse()
+
+    def test_safe_request_reads_from_replica(self):
+        """Test GET requests may read from replicas"""
+        self.middleware(self.factory.get('/', HTTP_AUTHORIZATION='Token a'))
+
+        self.assertEqual(self.seen, [True])
+        self.assertFalse(routers.replicas_enabled())
+
+    def test_write_pins_client_to_primary(self):
+        """Test a client reads from the primary right after writing"""
+        res = self.middleware(
+            self.factory.post('/', HTTP_AUTHORIZATION='Token a')
+        )
+        self.middleware(self.factory.get('/', HTTP_AUTHORIZATION='Token a'))
+        self.middleware(self.factory.get('/', HTTP_AUTHORIZATION='Token b'))
+
+        self.assertEqual(self.seen, [False, False, True])
+        self.assertIn('primary_pin', res.cookies)
@@ -0,0 +1,127 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from core import sharding
+from core.models import Drug, Tag, ShardAssignment
+from core.routers import ShardRouter
+
+SHARDS = ['default', 'shard_1']
+
+
+def sample_user(email='test@dummy.com', password='12341234'):
+    return get_user_model().objects.create_user(email, password)
+
+
+class ShardMapTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_single_shard(self):
+        """Test everything lives on the default database when unsharded"""
+        self.assertEqual(sharding.shard_for_user(7), 'default')
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_unassigned_users_stay_on_default(self):
+        """Test users from before sharding keep their catalog on default"""
+        self.assertEqual(sharding.shard_for_user(4), 'default')
+        self.assertEqual(sharding.shard_for_user(5), 'default')
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_new_users_assigned(self):
+        """Test new users are assigned a shard spread by id"""
+        users = [sample_user('user%d@dummy.com' % i) for i in range(2)]
+
+        for user in users:
+            alias = SHARDS[user.pk % 2]
+            self.assertEqual(sharding.shard_for_user(user.pk), alias)
+            self.assertTrue(ShardAssignment.objects.filter(
+                user=user, alias=alias
+            ).exists())
+
+    @override_settings(DATABASE_SHARDS=SHARDS, SHARD_ID_SPAN=1000)
+    def test_id_ranges_disjoint(self):
+        """Test each shard allocates ids from its own range"""
+        self.assertEqual(sharding.id_range('default'), (1, 1000))
+        self.assertEqual(sharding.id_range('shard_1'), (1001, 2000))
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_assignment_overrides_placement(self):
+        """Test an explicit assignment wins over the default placement"""
+        user = sample_user()
+        sharding.shard_for_user(user.pk)
+        target = 'shard_1' if user.pk % 2 == 0 else 'default'
+
+        sharding.assign(user.pk, target)
+
+        self.assertEqual(sharding.shard_for_user(user.pk), target)
+        self.assertTrue(
+            ShardAssignment.objects.filter(user=user, alias=target).exists()
+        )
+
+
+@override_settings(DATABASE_SHARDS=SHARDS)
+class ShardRouterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.router = ShardRouter()
+
+    def tearDown(self):
+        sharding.deactivate()
+
+    def test_active_shard_used_for_catalog(self):
+        """Test catalog queries follow the activated user's shard"""
+        user = sample_user()
+        sharding.assign(user.pk, 'shard_1')
+        sharding.activate(user.pk)
+
+        self.assertEqual(self.router.db_for_read(Drug), 'shard_1')
+        self.assertEqual(self.router.db_for_write(Tag), 'shard_1')
+        self.assertEqual(
+            self.router.db_for_read(Drug.tags.through), 'shard_1'
+        )
+
+    def test_non_catalog_models_fall_through(self):
+        """Test users and other models are left to the next router"""
+        sharding.activate(sample_user().pk)
+
+        self.assertIsNone(self.router.db_for_read(get_user_model()))
+
+    def test_instance_hint_wins(self):
+        """Test related lookups use the shard of the owning user"""
+        user = sample_user()
+        sharding.assign(user.pk, 'shard_1')
+
+        self.assertEqual(
+            self.router.db_for_read(Drug, instance=user), 'shard_1'
+        )
+        self.assertEqual(
+            self.router.db_for_write(Tag, instance=Tag(user_id=4)),
+            'default'
+        )
+
+
+class MoveUserShardCommandTests(TestCase):
+
+    def test_unknown_shard(self):
+        """Test moving to an unconfigured alias fails"""
+        user = sample_user()
+
+        with self.assertRaises(CommandError):
+            call_command('move_user_shard', user.pk, 'shard_9')
+
+    def test_already_on_target(self):
+        """Test moving a user to its current shard does nothing"""
+        user = sample_user()
+        out = StringIO()
+
+        call_command('move_user_shard', user.pk, 'default', stdout=out)
+
+        self.assertIn('already on default', out.getvalue())
+        self.assertFalse(ShardAssignment.objects.exists())
@@ -0,0 +1,98 @@
+import threading
+import time
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from core import singleflight
+
+
+class GroupTests(SimpleTestCase):
+
+    def test_concurrent_calls_share_result(self):
+        """Test callers arriving while a key is computed share the result"""
+        group = singleflight.Group()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(group.do('key', compute))
+        )
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(
+                target=lambda: results.append(group.do('key', compute))
+            )
+            for _ in range(3)
+        ]
+        for thread in followers:
+            thread.start()
+        # Let the leader finish once every follower waits on its call
+        waiters = group._calls['key'].done._cond._waiters
+        for _ in range(500):
+            if len(waiters) == 3:
+                break
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('result', False)] +
+                         [('result', True)] * 3)
+
+    def test_errors_are_not_remembered(self):
+        """Test a failed call raises and the next call runs again"""
+        group = singleflight.Group()
+
+        def fail():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            group.do('key', fail)
+
+        self.assertEqual(group.do('key', lambda: 1), (1, False))
+
+
+class GetOrFillTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def fill(self, func, wait=1):
+        return singleflight.get_or_fill(
+            'key', func, timeout=60, lock_timeout=10, wait=wait
+        )
+
+    def test_miss_then_hit(self):
+        """Test a miss fills the cache and the next read hits it"""
+        self.assertEqual(self.fill(lambda: [1]), ([1], 'miss'))
+        self.assertEqual(self.fill(lambda: [2]), ([1], 'hit'))
+        self.assertIsNone(cache.get('key:lock'))
+
+    @patch('core.singleflight.time.sleep')
+    def test_waits_for_lock_holder(self, sleep):
+        """Test a process without the lock waits for the filled value"""
+        cache.add('key:lock', 'other', 10)
+        sleep.side_effect = lambda seconds: cache.set('key', [1])
+
+        value = self.fill(lambda: self.fail('computed without the lock'))
+
+        self.assertEqual(value, ([1], 'waited'))
+
+    def test_computes_after_waiting_too_long(self):
+        """Test a stuck lock holder does not block readers forever"""
+        cache.add('key:lock', 'other', 10)
+
+        self.assertEqual(self.fill(lambda: [2], wait=0), ([2], 'miss'))
@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+TAGS_URL = reverse('drug:tag-list')
+
+
+@override_settings(THROTTLE_BURST=2, THROTTLE_RATE=0.5)
+class TokenBucketThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+
+    def test_burst_then_throttled(self):
+        """Test requests past the burst get 429 with Retry-After"""
+        self.client.force_authenticate(self.user)
+
+        codes = [self.client.get(TAGS_URL).status_code for _ in range(3)]
+
+        self.assertEqual(codes[:2], [status.HTTP_200_OK] * 2)
+        self.assertEqual(codes[2], status.HTTP_429_TOO_MANY_REQUESTS)
+        res = self.client.get(TAGS_URL)
+        self.assertIn(res['Retry-After'], ('1', '2'))
+
+    def test_buckets_are_per_user(self):
+        """Test a throttled user does not throttle others"""
+        other = get_user_model().objects.create_user(
+            'other@dummy.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        for _ in range(3):
+            self.client.get(TAGS_URL)
+
+        self.client.force_authenticate(other)
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,131 @@
+from unittest import skipUnless
+from unittest.mock import MagicMock
+
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, RequestFactory, \
+    override_settings
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory
+
+from core.exceptions import exception_handler
+from core.middleware import StatementTimeout, StatementTimeoutMiddleware
+
+
+class QueryCanceled(Exception):
+    pgcode = '57014'
+
+
+def sample_connection(vendor='postgresql', open=True):
+    """Create a mock database connection"""
+    conn = MagicMock(vendor=vendor, needs_rollback=False)
+    conn.connection = MagicMock() if open else None
+    return conn
+
+
+def executed(conn):
+    """Return the SQL run on the cursors of mock connection `conn`"""
+    if conn.connection is None:
+        return []
+    cursor = conn.connection.cursor.return_value.__enter__.return_value
+    return [c[0][0] for c in cursor.execute.call_args_list]
+
+
+class StatementTimeoutTests(SimpleTestCase):
+
+    def test_sets_and_resets_session_timeout(self):
+        """Test the timeout is set on the session, then reset"""
+        conn = sample_connection()
+        timeout = StatementTimeout(1500)
+
+        timeout.apply(conn)
+        timeout.apply(conn)
+        timeout.reset()
+
+        self.assertEqual(executed(conn), [
+            'SET statement_timeout = 1500',
+            'SET statement_timeout = 1500',
+            'RESET statement_timeout',
+        ])
+
+    def test_leaves_other_connections(self):
+        """Test other databases and closed connections are untouched"""
+        for conn, timeout in (
+                (sample_connection(), StatementTimeout()),
+                (sample_connection(vendor='sqlite'), StatementTimeout(10)),
+                (sample_connection(open=False), StatementTimeout(10))):
+            timeout.apply(conn)
+            timeout.reset()
+
+            self.assertEqual(executed(conn), [])
+
+    @override_settings(
+        STATEMENT_TIMEOUT_MS=30000,
+        STATEMENT_TIMEOUTS={
+            'drug:drug-list': 7000, 'drug:drug-list.list': 5000,
+        },
+    )
+    def test_timeout_by_route_and_action(self):
+        """Test the most specific configured timeout applies"""
+        seen = []
+        view = MagicMock(actions={'get': 'list', 'post': 'create'})
+
+        def handle(request):
+            middleware.process_view(request, view, (), {})
+            seen.append(request._statement_timeout.milliseconds)
+            return HttpResponse()
+        middleware = StatementTimeoutMiddleware(handle)
+        factory = RequestFactory()
+
+        for method, path in (('get', '/api/drug/drugs/'),
+                             ('post', '/api/drug/drugs/'),
+                             ('get', '/api/drug/tags/')):
+            request = getattr(factory, method)(path)
+            request.resolver_match = resolve(path)
+            middleware(request)
+
+        self.assertEqual(seen, [5000, 7000, 30000])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class SessionTimeoutTests(TestCase):
+
+    def show(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            return cursor.fetchone()[0]
+
+    def test_timeout_applies_to_session(self):
+        """Test the timeout holds until reset, then the default is back"""
+        default = self.show()
+        timeout = StatementTimeout()
+
+        timeout.set(1234)
+        self.assertEqual(self.show(), '1234ms')
+        timeout.reset()
+
+        self.assertEqual(self.show(), default)
+
+
+class ExceptionHandlerTests(SimpleTestCase):
+
+    def context(self):
+        request = APIRequestFactory().get('/api/drug/drugs/')
+        request.resolver_match = resolve('/api/drug/drugs/')
+        return {'request': request, 'view': MagicMock(action='list')}
+
+    def test_statement_timeout_is_503(self):
+        """Test cancelled queries are answered 503 with Retry-After"""
+        exc = OperationalError('canceling statement due to timeout')
+        exc.__cause__ = QueryCanceled()
+
+        res = exception_handler(exc, self.context())
+
+        self.assertEqual(res.status_code, 503)
+        self.assertIn('Retry-After', res)
+
+    def test_other_errors_unhandled(self):
+        """Test other database errors still propagate"""
+        exc = OperationalError('server closed the connection')
+
+        self.assertIsNone(exception_handler(exc, self.context()))
@@ -0,0 +1,45 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+
+from core import warmup
+from core.management.commands.profile_startup import parse_importtime
+
+
+class WarmupTests(TestCase):
+
+    def test_warm_runs_every_phase(self):
+        """Test warmup reports the time of each phase"""
+        warm_connections = MagicMock()
+        phases = (
+            ('urls', warmup.warm_urls),
+            ('serializers', warmup.warm_serializers),
+            ('connections', warm_connections),
+        )
+        with patch.object(warmup, 'PHASES', phases):
+            timings = warmup.warm()
+
+        self.assertEqual(
+            set(timings), {'urls', 'serializers', 'connections'}
+        )
+        warm_connections.assert_called_once_with()
+
+    def test_warm_without_connections(self):
+        """Test connections can be left out before workers fork"""
+        timings = warmup.warm(connect=False)
+
+        self.assertNotIn('connections', timings)
+
+    def test_parse_importtime(self):
+        """Test -X importtime output is parsed with nesting depth"""
+        output = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       120 |        120 |   json.decoder',
+            'import time:       300 |        420 | json',
+            'noise',
+        ])
+
+        self.assertEqual(parse_importtime(output), [
+            ('json.decoder', 120, 120, 1),
+            ('json', 300, 420, 0),
+        ])
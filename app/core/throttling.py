@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Per-user token bucket kept in the shared memcached cache
+
+    Buckets live in settings.CACHES rather than in process memory, so
+    all web workers draw from one bucket per user. Every user may burst
+    THROTTLE_BURST requests, refilled at THROTTLE_RATE per second, so a
+    heavy tenant is slowed down before it crowds out the others.
+    Anonymous requests are bucketed by client address. Like DRF's own
+    throttles, the bucket is read and written without a lock, so
+    concurrent requests may overshoot it slightly.
+    """
+    timer = time.time
+
+    def get_cache_key(self, request):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return 'throttle-bucket:%s' % ident
+
+    def allow_request(self, request, view):
+        burst = settings.THROTTLE_BURST
+        rate = settings.THROTTLE_RATE
+        if not rate:
+            return True
+
+        key = self.get_cache_key(request)
+        now = self.timer()
+        tokens, stamp = cache.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - stamp) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        else:
+            self.wait_seconds = (1 - tokens) / rate
+        # Once idle this long the bucket is full, which a miss gives too.
+        cache.set(key, (tokens, now), int((burst - tokens) / rate) + 1)
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
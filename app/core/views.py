@@ -0,0 +1,41 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import batch
+from core.authentication import TokenAuthentication
+from core.metrics import REGISTRY
+from core.serializers import BatchSerializer
+
+
+def metrics(request):
+    """Expose the metrics of every worker in Prometheus text format"""
+    token = settings.METRICS_TOKEN
+    auth = request.META.get('HTTP_AUTHORIZATION', '')
+    if not token or not hmac.compare_digest(auth, 'Bearer %s' % token):
+        raise Http404
+    return HttpResponse(
+        REGISTRY.exposition(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+class BatchView(APIView):
+    """Run several API calls in one round trip"""
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request):
+        """Dispatch the sub-requests and return their responses in order"""
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        responses = batch.execute(
+            request,
+            serializer.validated_data['requests'],
+            parallel=serializer.validated_data['parallel'],
+        )
+        return Response({'responses': responses})
@@ -0,0 +1,80 @@
+import logging
+import time
+
+from django.db import connections
+from django.urls import URLResolver, get_resolver
+from django.utils.module_loading import autodiscover_modules
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def warm_urls():
+    """Import every view and build the reverse lookup of each resolver"""
+    resolvers = [get_resolver()]
+    while resolvers:
+        resolver = resolvers.pop()
+        resolver.reverse_dict  # Populated on first access
+        resolvers.extend(
+            pattern for pattern in resolver.url_patterns
+            if isinstance(pattern, URLResolver)
+        )
+
+
+def warm_serializers():
+    """Import the apps' serializers and build their fields once"""
+    autodiscover_modules('serializers')
+    for cls in set(_subclasses(serializers.BaseSerializer)):
+        if cls.__module__.startswith('rest_framework.'):
+            continue
+        try:
+            cls().fields
+        except Exception:
+            logger.debug('Cannot warm %s', cls.__qualname__, exc_info=True)
+
+
+def warm_connections():
+    """Open a connection to every database, then hand it back
+
+    With the pooled backend the connection stays open in the pool;
+    otherwise this only gets DNS, TLS and authentication out of the way.
+    """
+    for conn in connections.all():
+        conn.ensure_connection()
+        conn.close()
+
+
+PHASES = (
+    ('urls', warm_urls),
+    ('serializers', warm_serializers),
+    ('connections', warm_connections),
+)
+
+
+def warm(connect=True):
+    """Do the work first requests would otherwise pay for
+
+    Returns the seconds spent per phase. Leave out connections when
+    running before workers fork, as forked workers must not share them.
+    """
+    timings = {}
+    for name, phase in PHASES:
+        if name == 'connections' and not connect:
+            continue
+        started = time.perf_counter()
+        try:
+            phase()
+        except Exception:
+            logger.exception('Warmup phase %s failed', name)
+        timings[name] = time.perf_counter() - started
+    logger.info('Warmed up: %s', ', '.join(
+        '%s %.0fms' % (name, seconds * 1000)
+        for name, seconds in timings.items()
+    ))
+    return timings
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class DrugConfig(AppConfig):
     name = 'drug'
+
+    def ready(self):
+        from drug import signals
+        signals.connect()
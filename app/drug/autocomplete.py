@@ -0,0 +1,132 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.functions import Upper
+
+
+def fold(name):
+    """Normalize a name for case-insensitive prefix matching"""
+    return name.casefold()
+
+
+class PrefixIndex:
+    """Names of one user's tags or ingredients sorted for prefix search
+
+    An incomplete index marks a user with too many rows to hold in
+    memory, whose lookups go to the database instead.
+    """
+
+    def __init__(self, rows, complete=True):
+        self.built_at = time.monotonic()
+        self.complete = complete
+        self._entries = sorted((fold(name), pk, name) for pk, name in rows)
+        self._by_pk = {entry[1]: entry for entry in self._entries}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def search(self, prefix, limit):
+        """Return up to `limit` (id, name) pairs starting with `prefix`"""
+        key = fold(prefix)
+        start = bisect.bisect_left(self._entries, (key,))
+        results = []
+        for folded, pk, name in self._entries[start:start + limit]:
+            if not folded.startswith(key):
+                break
+            results.append((pk, name))
+        return results
+
+    def put(self, pk, name):
+        if not self.complete:
+            return
+        self.discard(pk)
+        entry = (fold(name), pk, name)
+        bisect.insort(self._entries, entry)
+        self._by_pk[pk] = entry
+
+    def discard(self, pk):
+        entry = self._by_pk.pop(pk, None)
+        if entry is not None:
+            index = bisect.bisect_left(self._entries, entry)
+            del self._entries[index]
+
+
+class IndexCache:
+    """Per-process LRU of prefix indexes keyed by model and user"""
+
+    def __init__(self):
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model, user_id):
+        key = (model._meta.label_lower, user_id)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                return None
+            # Other workers' writes only reach this copy via expiry.
+            age = time.monotonic() - index.built_at
+            if age > settings.AUTOCOMPLETE_INDEX_TTL:
+                del self._indexes[key]
+                return None
+            self._indexes.move_to_end(key)
+            return index
+
+    def put(self, model, user_id, index):
+        key = (model._meta.label_lower, user_id)
+        with self._lock:
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > settings.AUTOCOMPLETE_INDEX_USERS:
+                self._indexes.popitem(last=False)
+
+    def update(self, model, user_id, pk, name=None):
+        """Apply a saved (name given) or deleted row to a cached index"""
+        key = (model._meta.label_lower, user_id)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                return
+            if name is None:
+                index.discard(pk)
+            else:
+                index.put(pk, name)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+indexes = IndexCache()
+
+
+def search(model, user_id, prefix, limit):
+    """Return up to `limit` (id, name) pairs of the user's rows
+
+    Served from the in-memory index, built on a miss from one query
+    over the user's names. Users with more rows than the index holds
+    are answered by a prefix LIKE query on the name index instead.
+    """
+    index = indexes.get(model, user_id)
+    if index is None:
+        max_rows = settings.AUTOCOMPLETE_INDEX_MAX_ROWS
+        rows = list(
+            model.objects.filter(user_id=user_id)
+            .values_list('id', 'name')[:max_rows + 1]
+        )
+        if len(rows) > max_rows:
+            index = PrefixIndex([], complete=False)
+        else:
+            index = PrefixIndex(rows)
+        indexes.put(model, user_id, index)
+
+    if index.complete:
+        return index.search(prefix, limit)
+    return list(
+        model.objects.filter(user_id=user_id, name__istartswith=prefix)
+        .order_by(Upper('name'), 'name')
+        .values_list('id', 'name')[:limit]
+    )
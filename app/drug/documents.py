@@ -0,0 +1,95 @@
+import json
+import threading
+from contextlib import contextmanager
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, router, transaction
+
+from core.models import Drug, DrugDocument
+
+_state = threading.local()
+
+
+def render(drug):
+    """Return the detail representation of a drug as a JSON string"""
+    from drug.serializers import DrugDetailSerializer
+    return json.dumps(DrugDetailSerializer(drug).data, cls=DjangoJSONEncoder)
+
+
+def rebuild(drug_ids, using):
+    """Recompute the documents of the given drugs on database `using`
+
+    Returns the new document bodies keyed by drug id.
+    """
+    drug_ids = set(drug_ids)
+    if not drug_ids:
+        return {}
+    drugs = Drug.objects.using(using).filter(pk__in=drug_ids) \
+        .prefetch_related('tags', 'ingredients')
+    with transaction.atomic(using=using):
+        documents = [
+            DrugDocument(drug_id=drug.pk, user_id=drug.user_id,
+                         body=render(drug))
+            for drug in drugs
+        ]
+        try:
+            _replace(documents, drug_ids, using)
+        except IntegrityError:
+            # A concurrent rebuild inserted the same documents first;
+            # they are committed now, so replacing them goes through.
+            _replace(documents, drug_ids, using)
+    return {document.drug_id: document.body for document in documents}
+
+
+def _replace(documents, drug_ids, using):
+    with transaction.atomic(using=using):
+        DrugDocument.objects.using(using).filter(pk__in=drug_ids).delete()
+        DrugDocument.objects.using(using).bulk_create(documents)
+
+
+def get_or_build(drug):
+    """Return the stored document of a drug, building it if missing
+
+    The drug may have been read from a replica; the document is built
+    and stored on the primary.
+    """
+    body = DrugDocument.objects.using(drug._state.db) \
+        .filter(pk=drug.pk).values_list('body', flat=True).first()
+    if body is None:
+        using = router.db_for_write(DrugDocument, instance=drug)
+        body = rebuild([drug.pk], using)[drug.pk]
+    return body
+
+
+def invalidate(drug_ids, using):
+    """Drop the documents of the given drugs"""
+    DrugDocument.objects.using(using).filter(pk__in=drug_ids).delete()
+
+
+def mark_dirty(drug_ids, using):
+    """Rebuild the documents now, or at the end of the deferred block"""
+    pending = getattr(_state, 'pending', None)
+    if pending is None:
+        rebuild(drug_ids, using)
+    else:
+        pending.setdefault(using, set()).update(drug_ids)
+
+
+@contextmanager
+def deferred():
+    """Collect rebuilds inside the block and run them once at the end
+
+    Use inside a transaction so the documents commit or roll back
+    together with the changes they reflect.
+    """
+    if getattr(_state, 'pending', None) is not None:
+        yield
+        return
+    _state.pending = {}
+    try:
+        yield
+        pending = _state.pending
+    finally:
+        _state.pending = None
+    for using, drug_ids in pending.items():
+        rebuild(drug_ids, using)
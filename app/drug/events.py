@@ -0,0 +1,196 @@
+import atexit
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+
+from core import routers, sharding
+from core.middleware import Limiter
+from drug import sync
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'catalog_changes'
+# How often the listener looks up from select() to see if it must stop
+POLL_SECONDS = 1
+
+
+def changed(user_id, using):
+    """Tell stream listeners the user's catalog changed
+
+    NOTIFY is transactional: listeners only hear of the change once it
+    commits, and repeats within a transaction are delivered once.
+    """
+    conn = connections[using]
+    if conn.vendor != 'postgresql':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, str(user_id)])
+
+
+class ChangeHub:
+    """Per-process LISTEN connection waking the streams of notified users
+
+    The listener thread starts with the first subscriber and runs until
+    stop(), which also closes its connections. Without PostgreSQL
+    nothing is ever notified and streams fall back to checking for
+    changes at every heartbeat.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = None
+
+    def subscribe(self, user_id):
+        """Return an event set whenever the user's catalog changes"""
+        event = threading.Event()
+        with self._lock:
+            self._subscribers[user_id].add(event)
+            if self._thread is None and self._aliases():
+                self._stopping = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._stopping,),
+                    name='change-hub', daemon=True
+                )
+                self._thread.start()
+        return event
+
+    def stop(self):
+        """Stop the listener thread and close its connections"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            stopping, self._stopping = self._stopping, None
+        if thread is not None:
+            stopping.set()
+            thread.join()
+
+    def unsubscribe(self, user_id, event):
+        with self._lock:
+            self._subscribers[user_id].discard(event)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id):
+        with self._lock:
+            for event in self._subscribers.get(user_id, ()):
+                event.set()
+
+    def _aliases(self):
+        return [
+            alias for alias in sharding.shards()
+            if connections[alias].vendor == 'postgresql'
+        ]
+
+    def _listen(self, alias):
+        # A dedicated connection outside the pool, held until stop().
+        wrapper = connections[alias]
+        conn = wrapper.Database.connect(**wrapper.get_connection_params())
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute('LISTEN %s' % CHANNEL)
+        return conn
+
+    def _run(self, stopping):
+        delay = 1
+        while not stopping.is_set():
+            conns = []
+            try:
+                for alias in self._aliases():
+                    conns.append(self._listen(alias))
+                delay = 1
+                while not stopping.is_set():
+                    ready, _, _ = select.select(conns, [], [], POLL_SECONDS)
+                    for conn in ready:
+                        conn.poll()
+                        while conn.notifies:
+                            notify = conn.notifies.pop(0)
+                            self.publish(int(notify.payload))
+            except Exception:
+                logger.exception('Change listener failed, reconnecting')
+            finally:
+                for conn in conns:
+                    conn.close()
+            stopping.wait(delay)
+            delay = min(delay * 2, 30)
+
+
+hub = ChangeHub()
+atexit.register(hub.stop)
+
+# Every open stream holds a request thread for up to SSE_MAX_SECONDS.
+streams = Limiter(settings.SSE_MAX_STREAMS, 0)
+
+
+class Slot:
+    """A place in `streams`, given back when the response is closed"""
+
+    def __init__(self, limiter):
+        self._limiter = limiter
+
+    def close(self):
+        limiter, self._limiter = self._limiter, None
+        if limiter is not None:
+            limiter.release()
+
+
+def format_event(data):
+    """Return a page of the change feed as a server-sent event"""
+    return 'id: %s\nevent: changes\ndata: %s\n\n' % (
+        data['cursor'], json.dumps(data, separators=(',', ':'))
+    )
+
+
+def has_changes(data):
+    return any(data[name] for name, model, serializer in sync.SYNCED) or \
+        any(data['deleted'].values())
+
+
+def stream(user, since):
+    """Yield change feed pages after `since` as they happen
+
+    Ends after SSE_MAX_SECONDS; the client reconnects with the last
+    event id and carries on from there. A notification is followed by
+    a wait of SYNC_SAFETY_LAG_SECONDS before reading, as the change
+    feed holds rows back for that long.
+    """
+    deadline = time.monotonic() + settings.SSE_MAX_SECONDS
+    event = hub.subscribe(user.pk)
+    yield 'retry: %d\n\n' % settings.SSE_RETRY_MS
+    try:
+        while True:
+            # The middleware has already undone this for the request.
+            sharding.activate(user.pk)
+            routers.use_replicas(False)
+            data = sync.changes(user, since, settings.SSE_BATCH_SIZE)
+            since = sync.from_cursor(data['cursor'])
+            _release_connection(user)
+            if has_changes(data):
+                yield format_event(data)
+                if data['has_more']:
+                    continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if event.wait(min(settings.SSE_HEARTBEAT_SECONDS, remaining)):
+                event.clear()
+                time.sleep(min(settings.SYNC_SAFETY_LAG_SECONDS, remaining))
+            else:
+                yield ': heartbeat\n\n'
+    finally:
+        hub.unsubscribe(user.pk, event)
+        sharding.deactivate()
+
+
+def _release_connection(user):
+    """Hand the catalog connection back between reads of a long stream"""
+    conn = connections[sharding.shard_for_user(user.pk)]
+    if not conn.in_atomic_block:
+        conn.close()
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import warnings
+
+from django.conf import settings
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+# Formats whose metadata the re-encode strips; GIF carries no EXIF
+REENCODE_FORMATS = ('JPEG', 'PNG')
+JPEG_QUALITY = 90
+
+
+def _check_header(image, size):
+    if size > settings.IMAGE_MAX_BYTES:
+        raise serializers.ValidationError(
+            'Image must be at most %d bytes.' % settings.IMAGE_MAX_BYTES
+        )
+    if image.format not in settings.IMAGE_FORMATS:
+        raise serializers.ValidationError(
+            'Image format must be one of %s.'
+            % ', '.join(settings.IMAGE_FORMATS)
+        )
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise serializers.ValidationError(
+            'Image must be at most %d pixels.' % settings.IMAGE_MAX_PIXELS
+        )
+
+
+def probe(file, size):
+    """Validate an image from its header and return (format, width, height)
+
+    Pillow only parses the header on open, so nothing is decoded and an
+    image declaring too many pixels is rejected before any memory is
+    spent on them. `file` is a path or a file object.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(file)
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise serializers.ValidationError(
+            'Image must be at most %d pixels.' % settings.IMAGE_MAX_PIXELS
+        )
+    except Exception:
+        raise serializers.ValidationError(
+            'Upload a valid image. The file you uploaded was either not an '
+            'image or a corrupted image.'
+        )
+    with image:
+        _check_header(image, size)
+        return image.format, image.width, image.height
+
+
+class ProbedImageField(serializers.FileField):
+    """Image field validating uploads without decoding them"""
+
+    def to_internal_value(self, data):
+        file = super().to_internal_value(data)
+        probe(file, file.size)
+        file.seek(0)
+        return file
+
+
+def reencode(path):
+    """Re-encode the image at `path` in place without its metadata
+
+    The EXIF orientation is applied first so the image still displays
+    the right way up. Returns whether the file was rewritten.
+    """
+    with Image.open(path) as image:
+        _check_header(image, os.path.getsize(path))
+        if image.format not in REENCODE_FORMATS:
+            return False
+        image_format = image.format
+        icc_profile = image.info.get('icc_profile')
+        clean = ImageOps.exif_transpose(image)
+    # Savers copy some metadata from info; keep only what renders.
+    clean.info = {
+        key: value for key, value in clean.info.items()
+        if key == 'transparency'
+    }
+
+    options = {}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    if image_format == 'JPEG':
+        options.update(quality=JPEG_QUALITY, optimize=True)
+    else:
+        options['optimize'] = True
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            clean.save(f, format=image_format, **options)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return True
@@ -0,0 +1,69 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import urlencode
+
+from core import metrics, singleflight
+
+group = singleflight.Group()
+
+
+def _version_key(user_id):
+    return 'catalog-version:%s' % user_id
+
+
+def version(user_id):
+    """Return the version of the user's catalog, part of cache keys"""
+    key = _version_key(user_id)
+    value = cache.get(key)
+    if value is None:
+        # Start from the clock so a lost version never revives old entries
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def _bump(user_id):
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def bump(user_id, using):
+    """Invalidate the user's cached lists now and once committed
+
+    The second bump keeps a read running between the write and its
+    commit from caching the old rows under the new version.
+    """
+    _bump(user_id)
+    transaction.on_commit(lambda: _bump(user_id), using=using)
+
+
+def drug_list(request, func):
+    """Return the drug list data for `request`, computing it once
+
+    Identical requests share the data: within a process while it is
+    computed, and across processes through the shared cache, which is
+    also where writes from other processes bump the catalog version.
+    """
+    user_id = request.user.pk
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    key = 'drug-list:%s:%s:%s' % (
+        user_id, version(user_id), hashlib.sha1(query.encode()).hexdigest()
+    )
+    (data, outcome), shared = group.do(key, lambda: singleflight.get_or_fill(
+        key,
+        func,
+        timeout=settings.DRUG_LIST_CACHE_SECONDS,
+        lock_timeout=settings.DRUG_LIST_CACHE_LOCK_SECONDS,
+        wait=settings.DRUG_LIST_CACHE_WAIT_SECONDS,
+    ))
+    metrics.READ_CACHE.inc(
+        cache='drug_list', outcome='coalesced' if shared else outcome
+    )
+    return data
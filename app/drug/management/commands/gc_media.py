@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from drug import media, tasks, uploads
+
+
+class Command(BaseCommand):
+    """Django command to delete drug images no drug refers to"""
+    help = 'Delete unreferenced files under MEDIA_ROOT/uploads/drug/, ' \
+           'checking the files against every shard a batch at a time, ' \
+           'and expire idle upload sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be deleted or moved'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=settings.GC_MEDIA_MIN_AGE_SECONDS,
+            help='Leave files younger than this many seconds alone'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Files checked against the database per query'
+        )
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Maximum files deleted or moved per second (0: no limit)'
+        )
+        parser.add_argument(
+            '--reshard', action='store_true',
+            help='Also move images from before the fan-out into their '
+                 'subdirectories'
+        )
+        parser.add_argument(
+            '--schedule', action='store_true',
+            help='Queue a background job collecting every '
+                 'GC_MEDIA_INTERVAL_SECONDS instead of collecting now'
+        )
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            job = tasks.schedule_gc_media()
+            if job is None:
+                self.stdout.write('Media collection already scheduled')
+            else:
+                self.stdout.write('Scheduled media collection %s' % job)
+            return
+
+        stats = media.collect(
+            min_age=options['min_age'],
+            batch_size=options['batch_size'],
+            rate=options['rate'],
+            dry_run=options['dry_run'],
+            move=options['reshard'],
+        )
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(
+            '%s %d of %d files, moved %d' % (
+                verb, stats['deleted'], stats['checked'], stats['moved']
+            )
+        )
+        if not options['dry_run']:
+            expired = uploads.expire()
+            self.stdout.write(
+                'Expired %(sessions)d upload sessions, %(files)d partial '
+                'files' % expired
+            )
@@ -0,0 +1,155 @@
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core import sharding
+from core.models import Drug
+
+IMAGE_DIR = 'uploads/drug'
+
+
+def _entries(path):
+    try:
+        it = os.scandir(path)
+    except FileNotFoundError:
+        return
+    with it:
+        yield from it
+
+
+def iter_images(min_age=0):
+    """Yield the paths of image files older than `min_age` seconds
+
+    Paths are relative to MEDIA_ROOT, as stored in Drug.image. Entries
+    are read lazily, so even the flat legacy directory is never held in
+    memory as a whole.
+    """
+    root = os.path.join(settings.MEDIA_ROOT, IMAGE_DIR)
+    cutoff = time.time() - min_age
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        for entry in _entries(directory):
+            if entry.is_dir(follow_symlinks=False):
+                pending.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if mtime > cutoff:
+                    continue
+                relative = os.path.relpath(entry.path, settings.MEDIA_ROOT)
+                yield relative.replace(os.sep, '/')
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def referenced(paths):
+    """Return which of `paths` a drug on any shard still points at"""
+    found = set()
+    for alias in sharding.shards():
+        found.update(
+            Drug.objects.using(alias).filter(image__in=paths)
+            .values_list('image', flat=True)
+        )
+    return found
+
+
+def delete(path):
+    try:
+        os.remove(os.path.join(settings.MEDIA_ROOT, path))
+    except FileNotFoundError:
+        pass
+
+
+def sharded_path(path):
+    """Return where an image from before the fan-out belongs, or None"""
+    directory, filename = path.rsplit('/', 1)
+    if directory != IMAGE_DIR:
+        return None
+    return '/'.join((IMAGE_DIR, filename[:2], filename[2:4], filename))
+
+
+def reshard(path):
+    """Move a flat image into its fan-out directory, keeping it readable
+
+    The file is hard linked at the new path, drugs are pointed at it and
+    only then is the old name removed, so readers always find it.
+    """
+    target = sharded_path(path)
+    if target is None:
+        return None
+    source_file = os.path.join(settings.MEDIA_ROOT, path)
+    target_file = os.path.join(settings.MEDIA_ROOT, target)
+    os.makedirs(os.path.dirname(target_file), exist_ok=True)
+    try:
+        os.link(source_file, target_file)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(source_file, target_file)
+    for alias in sharding.shards():
+        with transaction.atomic(using=alias):
+            Drug.objects.using(alias).filter(image=path) \
+                .update(image=target, updated_at=timezone.now())
+    os.remove(source_file)
+    return target
+
+
+class Pacer:
+    """Sleep as needed to stay under `rate` operations per second"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        delay = self.next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_at = max(self.next_at, time.monotonic()) + self.interval
+
+
+def collect(min_age, batch_size=500, rate=0, dry_run=False, move=False):
+    """Delete unreferenced images, optionally fanning out flat ones
+
+    Images younger than `min_age` seconds are left alone: their drug
+    may not be committed yet. Returns counts of what was done, or would
+    be done with `dry_run`.
+    """
+    stats = {'checked': 0, 'deleted': 0, 'moved': 0}
+    pacer = Pacer(rate)
+    for batch in batches(iter_images(min_age), batch_size):
+        stats['checked'] += len(batch)
+        in_use = referenced(batch)
+        for path in sorted(set(batch) - in_use):
+            pacer.wait()
+            if not dry_run:
+                delete(path)
+            stats['deleted'] += 1
+        if not move:
+            continue
+        for path in sorted(in_use):
+            if sharded_path(path) is None:
+                continue
+            pacer.wait()
+            if not dry_run:
+                reshard(path)
+            stats['moved'] += 1
+    return stats
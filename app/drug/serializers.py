@@ -1,9 +1,18 @@
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed
 from rest_framework import serializers
 
-from core.models import Tag, Ingredient, Drug
+from core.instrumentation import ProfiledSerializerMixin
+from core.models import Tag, Ingredient, Drug, Job, UploadSession
+from drug.images import ProbedImageField
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(ProfiledSerializerMixin,
+                    serializers.ModelSerializer):
     """Serializer for tag objects"""
 
     class Meta:
@@ -12,7 +21,8 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(ProfiledSerializerMixin,
+                           serializers.ModelSerializer):
     """Serializer for tag objects"""
 
     class Meta:
@@ -29,7 +39,8 @@ class DrugSerializer(serializers.ModelSerializer):
         fields = ('id', 'title')
         read_only_fields = ('id',)
 
-class DrugSerializer(serializers.ModelSerializer):
+class DrugSerializer(ProfiledSerializerMixin,
+                     serializers.ModelSerializer):
     """Serialize a recipe"""
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -48,15 +59,164 @@ class DrugSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('id',)
 
+    def update(self, instance, validated_data):
+        """Write only the fields and links that actually changed"""
+        links = {
+            name: validated_data.pop(name)
+            for name in ('tags', 'ingredients') if name in validated_data
+        }
+        changed = [
+            name for name, value in validated_data.items()
+            if getattr(instance, name) != value
+        ]
+        for name in changed:
+            setattr(instance, name, validated_data[name])
+        if changed:
+            instance.save(update_fields=changed + ['updated_at'])
+
+        for name, objs in links.items():
+            update_links(instance, name, objs)
+
+        return instance
+
+
+def update_links(instance, name, objs):
+    """Make the M2M relation `name` of `instance` hold exactly `objs`
+
+    Unlike RelatedManager.set() this diffs against the prefetched
+    current set and issues at most one delete and one bulk insert,
+    sending the same m2m_changed signals for the rows that changed.
+    """
+    manager = getattr(instance, name)
+    current = {obj.pk for obj in manager.all()}
+    wanted = {obj.pk for obj in objs}
+    removed = current - wanted
+    added = wanted - current
+    if not removed and not added:
+        return
+
+    through = manager.through
+    source = manager.source_field_name
+    target = manager.target_field_name
+    source_column = through._meta.get_field(source).attname
+    target_column = through._meta.get_field(target).attname
+    db = router.db_for_write(through, instance=instance)
+    signal_kwargs = {
+        'sender': through,
+        'instance': instance,
+        'reverse': False,
+        'model': manager.model,
+        'using': db,
+    }
+    with transaction.atomic(using=db, savepoint=False):
+        if removed:
+            m2m_changed.send(action='pre_remove', pk_set=removed,
+                             **signal_kwargs)
+            through.objects.using(db).filter(**{
+                source: instance.pk, '%s__in' % target: removed
+            }).delete()
+            m2m_changed.send(action='post_remove', pk_set=removed,
+                             **signal_kwargs)
+        if added:
+            m2m_changed.send(action='pre_add', pk_set=added,
+                             **signal_kwargs)
+            through.objects.using(db).bulk_create([
+                through(**{source_column: instance.pk, target_column: pk})
+                for pk in added
+            ])
+            m2m_changed.send(action='post_add', pk_set=added,
+                             **signal_kwargs)
+
+    # Drop the stale prefetched set so the response shows the new one.
+    getattr(instance, '_prefetched_objects_cache', {}).pop(
+        manager.prefetch_cache_name, None
+    )
+
+
 class DrugDetailSerializer(DrugSerializer):
     """Serialize a recipe detail"""
     ingredients = IngredientSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
 
-class DrugImageSerializer(serializers.ModelSerializer):
+class DrugImageSerializer(ProfiledSerializerMixin,
+                          serializers.ModelSerializer):
     """Serializer for uploading images to recipes"""
+    image = ProbedImageField(allow_null=True)
 
     class Meta:
         model = Drug
         fields = ('id', 'image')
-        read_only_fields = ('id',)
\ No newline at end of file
+        read_only_fields = ('id',)
+
+
+class DrugBulkDeleteSerializer(serializers.Serializer):
+    """Serializer for a batch of drugs to delete in the background"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=10000,
+    )
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    """Serializer for autocomplete query parameters"""
+    q = serializers.CharField(default='', allow_blank=True, max_length=255,
+                              trim_whitespace=False)
+    limit = serializers.IntegerField(default=10, min_value=1, max_value=50)
+
+
+class SimilarQuerySerializer(serializers.Serializer):
+    """Serializer for similar drug query parameters"""
+    limit = serializers.IntegerField(default=10, min_value=1, max_value=100)
+    min_score = serializers.FloatField(default=0.0, min_value=0.0,
+                                       max_value=1.0)
+
+
+# Largest change feed cursor, microseconds from the epoch to datetime.max
+MAX_CURSOR = (
+    datetime.max.replace(tzinfo=dt_timezone.utc) -
+    datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+) // timedelta(microseconds=1)
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    """Serializer for change feed query parameters"""
+    since = serializers.IntegerField(
+        required=False, min_value=0, max_value=MAX_CURSOR
+    )
+    limit = serializers.IntegerField(default=500, min_value=1,
+                                     max_value=5000)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer for resumable drug image uploads"""
+    drug = serializers.PrimaryKeyRelatedField(queryset=Drug.objects.all())
+    size = serializers.IntegerField(
+        min_value=1, max_value=settings.UPLOAD_MAX_BYTES
+    )
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'drug', 'filename', 'size', 'offset', 'created_at')
+        read_only_fields = ('id', 'offset', 'created_at')
+
+    def validate_drug(self, drug):
+        if drug.user_id != self.context['request'].user.pk:
+            raise serializers.ValidationError('Drug not found.')
+        return drug
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for background job status"""
+    result = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'name', 'queue', 'status', 'attempts', 'max_attempts',
+            'run_at', 'last_error', 'result', 'created_at', 'updated_at'
+        )
+        read_only_fields = fields
+
+    def get_result(self, obj):
+        return json.loads(obj.result) if obj.result else None
@@ -0,0 +1,153 @@
+from django.db.models.signals import post_save, m2m_changed
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from core.models import Tag, Ingredient, Drug, Tombstone, catalog_deleting
+from drug import autocomplete, documents, events, listcache, similarity
+
+
+def touch_drugs(drug_ids, using):
+    """Bump updated_at of drugs whose links changed, for sync clients"""
+    Drug.objects.using(using).filter(pk__in=drug_ids) \
+        .update(updated_at=timezone.now())
+
+
+def drug_saved(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        documents.mark_dirty([instance.pk], using)
+
+
+def drug_links_changed(sender, instance, action, reverse, pk_set, using,
+                       **kwargs):
+    if action == 'pre_clear' and reverse:
+        # The attribute is gone by post_clear, so remember the drugs now.
+        instance._cleared_drug_ids = list(
+            instance.drug_set.using(using).values_list('pk', flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        drug_ids = [instance.pk]
+    elif action == 'post_clear':
+        drug_ids = instance._cleared_drug_ids
+    else:
+        drug_ids = list(pk_set)
+    touch_drugs(drug_ids, using)
+    documents.mark_dirty(drug_ids, using)
+    events.changed(instance.user_id, using)
+    listcache.bump(instance.user_id, using)
+
+
+def attr_saved(sender, instance, created, using, raw=False,
+               update_fields=None, **kwargs):
+    # Documents only hold the name of tags and ingredients.
+    renamed = not created and not raw and instance.name_changed() and (
+        update_fields is None or 'name' in update_fields
+    )
+    instance._loaded_name = instance.name
+    if renamed:
+        drug_ids = instance.drug_set.using(using) \
+            .values_list('pk', flat=True)
+        documents.mark_dirty(list(drug_ids), using)
+
+
+def catalog_saved(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        events.changed(instance.user_id, using)
+    listcache.bump(instance.user_id, using)
+
+
+def catalog_deleting_rows(sender, queryset, using, **kwargs):
+    """Record catalog rows about to be deleted, a query per step"""
+    rows = list(queryset.values_list('pk', 'user_id'))
+    if not rows:
+        return
+    pks = [pk for pk, user_id in rows]
+    Tombstone.objects.using(using).bulk_create([
+        Tombstone(
+            model=sender._meta.model_name, object_id=pk, user_id=user_id
+        )
+        for pk, user_id in rows
+    ])
+    if sender is not Drug:
+        # The drugs may be deleted by the same cascade, so drop their
+        # documents and let the next read rebuild them instead.
+        links = Drug.tags.through if sender is Tag \
+            else Drug.ingredients.through
+        drug_ids = list(
+            links.objects.using(using)
+            .filter(**{'%s_id__in' % sender._meta.model_name: pks})
+            .values_list('drug_id', flat=True).distinct()
+        )
+        touch_drugs(drug_ids, using)
+        documents.invalidate(drug_ids, using)
+    for pk, user_id in rows:
+        if sender is Drug:
+            similarity.indexes.update(user_id, 'remove_drug', pk)
+            continue
+        autocomplete.indexes.update(sender, user_id, pk)
+        if sender is Ingredient:
+            similarity.indexes.update(user_id, 'remove_ingredient', pk)
+    for user_id in {user_id for pk, user_id in rows}:
+        events.changed(user_id, using)
+        listcache.bump(user_id, using)
+
+
+def user_created(sender, instance, created, using, raw=False, **kwargs):
+    # The cache outlives databases that are recreated and reuse ids.
+    if created and not raw:
+        listcache.bump(instance.pk, using)
+
+
+def attr_indexed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocomplete.indexes.update(
+            sender, instance.user_id, instance.pk, instance.name
+        )
+
+
+def drug_ingredients_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if action == 'pre_clear' and not reverse:
+        # Forward clears carry no pk_set, so note what is removed.
+        instance._cleared_ingredient_ids = list(
+            instance.ingredients.values_list('pk', flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    user_id = instance.user_id
+    if reverse:
+        if action == 'post_clear':
+            similarity.indexes.update(
+                user_id, 'remove_ingredient', instance.pk
+            )
+            return
+        method = 'add' if action == 'post_add' else 'remove'
+        for drug_id in pk_set:
+            similarity.indexes.update(user_id, method, drug_id, [instance.pk])
+    elif action == 'post_clear':
+        similarity.indexes.update(
+            user_id, 'remove', instance.pk, instance._cleared_ingredient_ids
+        )
+    else:
+        method = 'add' if action == 'post_add' else 'remove'
+        similarity.indexes.update(user_id, method, instance.pk, pk_set)
+
+
+def connect():
+    post_save.connect(user_created, sender=get_user_model())
+    for model in (Tag, Ingredient, Drug):
+        post_save.connect(catalog_saved, sender=model)
+        catalog_deleting.connect(catalog_deleting_rows, sender=model)
+    post_save.connect(drug_saved, sender=Drug)
+    m2m_changed.connect(
+        drug_ingredients_changed, sender=Drug.ingredients.through
+    )
+    for through in (Drug.tags.through, Drug.ingredients.through):
+        m2m_changed.connect(drug_links_changed, sender=through)
+    for model in (Tag, Ingredient):
+        post_save.connect(attr_saved, sender=model)
+        post_save.connect(attr_indexed, sender=model)
@@ -0,0 +1,130 @@
+import heapq
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+
+from core.models import Drug
+
+
+class IngredientIndex:
+    """Inverted index of one user's drugs by ingredient
+
+    Candidates for a drug are collected from the posting lists of its
+    ingredients only, so drugs sharing nothing with it are never
+    visited.
+    """
+
+    def __init__(self, rows):
+        self.built_at = time.monotonic()
+        self.drugs = defaultdict(set)
+        self.postings = defaultdict(set)
+        for drug_id, ingredient_id in rows:
+            self.add(drug_id, [ingredient_id])
+
+    def add(self, drug_id, ingredient_ids):
+        for ingredient_id in ingredient_ids:
+            self.drugs[drug_id].add(ingredient_id)
+            self.postings[ingredient_id].add(drug_id)
+
+    def remove(self, drug_id, ingredient_ids):
+        for ingredient_id in ingredient_ids:
+            self.drugs[drug_id].discard(ingredient_id)
+            self.postings[ingredient_id].discard(drug_id)
+            if not self.postings[ingredient_id]:
+                del self.postings[ingredient_id]
+        if not self.drugs[drug_id]:
+            del self.drugs[drug_id]
+
+    def remove_drug(self, drug_id):
+        self.remove(drug_id, list(self.drugs.get(drug_id, ())))
+
+    def remove_ingredient(self, ingredient_id):
+        for drug_id in list(self.postings.get(ingredient_id, ())):
+            self.remove(drug_id, [ingredient_id])
+
+    def similar(self, drug_id, limit, min_score=0.0):
+        """Return up to `limit` (drug id, Jaccard score) pairs, best first"""
+        ingredients = self.drugs.get(drug_id)
+        if not ingredients:
+            return []
+        shared = Counter()
+        for ingredient_id in ingredients:
+            shared.update(self.postings[ingredient_id])
+        del shared[drug_id]
+
+        size = len(ingredients)
+        scores = (
+            (count / (size + len(self.drugs[other]) - count), other)
+            for other, count in shared.items()
+        )
+        best = heapq.nsmallest(
+            limit,
+            ((-score, other) for score, other in scores
+             if score >= min_score),
+        )
+        return [(other, -score) for score, other in best]
+
+
+class IndexCache:
+    """Per-process LRU of ingredient indexes keyed by user
+
+    Indexes are only read or changed while holding `lock`.
+    """
+
+    def __init__(self):
+        self._indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                return None
+            # Other workers' writes only reach this copy via expiry.
+            age = time.monotonic() - index.built_at
+            if age > settings.SIMILARITY_INDEX_TTL:
+                del self._indexes[user_id]
+                return None
+            self._indexes.move_to_end(user_id)
+            return index
+
+    def put(self, user_id, index):
+        with self.lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > settings.SIMILARITY_INDEX_USERS:
+                self._indexes.popitem(last=False)
+
+    def update(self, user_id, method, *args):
+        """Call `method` of the user's cached index, if there is one"""
+        with self.lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                getattr(index, method)(*args)
+
+    def clear(self):
+        with self.lock:
+            self._indexes.clear()
+
+
+indexes = IndexCache()
+
+
+def build(user_id):
+    """Load the ingredient links of the user's drugs into a new index"""
+    rows = Drug.ingredients.through.objects \
+        .filter(drug__user_id=user_id) \
+        .values_list('drug_id', 'ingredient_id')
+    return IngredientIndex(rows.iterator())
+
+
+def similar(drug, limit, min_score=0.0):
+    """Return the user's drugs ranked by ingredient overlap with `drug`"""
+    index = indexes.get(drug.user_id)
+    if index is None:
+        index = build(drug.user_id)
+        indexes.put(drug.user_id, index)
+    with indexes.lock:
+        return index.similar(drug.pk, limit, min_score)
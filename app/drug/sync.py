@@ -0,0 +1,95 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import Tag, Ingredient, Drug, Tombstone
+from drug import serializers
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+SYNCED = (
+    ('drugs', Drug, serializers.DrugSerializer),
+    ('tags', Tag, serializers.TagSerializer),
+    ('ingredients', Ingredient, serializers.IngredientSerializer),
+)
+
+
+def to_cursor(moment):
+    """Encode a timestamp as an opaque cursor string"""
+    return str((moment - EPOCH) // timedelta(microseconds=1))
+
+
+def from_cursor(cursor):
+    """Decode a cursor, validated by ChangesQuerySerializer"""
+    return EPOCH + timedelta(microseconds=int(cursor))
+
+
+def is_expired(since):
+    """Return True if tombstones after `since` may have been pruned"""
+    retention = timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    return since < timezone.now() - retention
+
+
+def upper_bound():
+    """Return the newest moment the change feed reads up to"""
+    return timezone.now() - timedelta(
+        seconds=settings.SYNC_SAFETY_LAG_SECONDS
+    )
+
+
+def _window_end(queryset, field, since, until, limit):
+    """Move `until` back so at most about `limit` rows fall in the window
+
+    Rows sharing the timestamp at the cut are all kept, so the next
+    window can start strictly after it.
+    """
+    stamps = list(
+        queryset.filter(**{field + '__gt': since, field + '__lte': until})
+        .order_by(field).values_list(field, flat=True)[limit - 1:limit + 1]
+    )
+    if len(stamps) == 2:
+        return min(until, stamps[0])
+    return until
+
+
+def changes(user, since, limit):
+    """Return the user's catalog rows changed or deleted after `since`
+
+    Rows are only returned up to a moment SYNC_SAFETY_LAG_SECONDS in
+    the past: updated_at is set before commit, so a transaction still
+    running when a client syncs would otherwise commit rows older than
+    the cursor handed out.
+    """
+    upper = upper_bound()
+    tombstones = Tombstone.objects.filter(user=user)
+    until = upper
+    for name, model, serializer_class in SYNCED:
+        until = _window_end(
+            model.objects.filter(user=user), 'updated_at', since, until, limit
+        )
+    until = _window_end(tombstones, 'deleted_at', since, until, limit)
+
+    data = {}
+    for name, model, serializer_class in SYNCED:
+        queryset = model.objects.filter(
+            user=user, updated_at__gt=since, updated_at__lte=until
+        ).order_by('updated_at', 'pk')
+        if model is Drug:
+            queryset = queryset.prefetch_related('tags', 'ingredients')
+        data[name] = serializer_class(queryset, many=True).data
+
+    deleted = defaultdict(list)
+    rows = tombstones.filter(deleted_at__gt=since, deleted_at__lte=until) \
+        .order_by('deleted_at', 'pk').values_list('model', 'object_id')
+    for model_name, object_id in rows:
+        deleted[model_name].append(object_id)
+    data['deleted'] = {
+        name: deleted[model._meta.model_name]
+        for name, model, serializer_class in SYNCED
+    }
+
+    data['cursor'] = to_cursor(until)
+    data['has_more'] = until < upper
+    return data
@@ -0,0 +1,54 @@
+from django.conf import settings
+
+from core import jobs
+from core.models import Drug, Job
+from drug import images, media, uploads
+
+
+@jobs.task(name='drug.delete_drugs')
+def delete_drugs(user_id, drug_ids):
+    """Delete drugs of a user together with their links and documents"""
+    _, deleted = Drug.objects.filter(user_id=user_id, pk__in=drug_ids) \
+        .delete()
+    return {'deleted': deleted.get(Drug._meta.label, 0)}
+
+
+def schedule_reencode(drug):
+    """Queue stripping the metadata of the drug's image if enabled"""
+    if not settings.IMAGE_REENCODE or not drug.image:
+        return None
+    return reencode_image.delay(
+        user=drug.user, drug_id=drug.pk, name=drug.image.name
+    )
+
+
+@jobs.task(name='drug.reencode_image', queue='images')
+def reencode_image(drug_id, name):
+    """Re-encode a drug image unless it was replaced since queued"""
+    drug = Drug.objects.filter(pk=drug_id, image=name).first()
+    if drug is None:
+        return {'reencoded': False}
+    return {'reencoded': images.reencode(drug.image.path)}
+
+
+def schedule_gc_media(run_in=0):
+    """Queue the media collection job unless one is already queued"""
+    if Job.objects.filter(name='drug.gc_media', status=Job.QUEUED).exists():
+        return None
+    return gc_media.delay(run_in=run_in)
+
+
+@jobs.task(name='drug.gc_media', max_attempts=3)
+def gc_media():
+    """Delete unreferenced images and idle uploads, then queue the next run
+
+    A failed run is retried by the queue and the schedule resumes once
+    it succeeds.
+    """
+    stats = media.collect(
+        min_age=settings.GC_MEDIA_MIN_AGE_SECONDS,
+        rate=settings.GC_MEDIA_RATE,
+    )
+    stats['expired_uploads'] = uploads.expire()['sessions']
+    schedule_gc_media(run_in=settings.GC_MEDIA_INTERVAL_SECONDS)
+    return stats
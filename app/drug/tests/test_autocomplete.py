@@ -0,0 +1,132 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient
+from drug import autocomplete
+
+TAGS_AUTOCOMPLETE_URL = reverse('drug:tag-autocomplete')
+INGREDIENTS_AUTOCOMPLETE_URL = reverse('drug:ingredient-autocomplete')
+
+
+def names(res):
+    return [item['name'] for item in res.data]
+
+
+class PrefixIndexTests(TestCase):
+
+    def test_search_returns_sorted_prefix_matches(self):
+        """Test the index matches prefixes regardless of case"""
+        index = autocomplete.PrefixIndex(
+            [(1, 'Paracetamol'), (2, 'penicillin'), (3, 'Pantoprazole'),
+             (4, 'Zinc')]
+        )
+
+        self.assertEqual(
+            index.search('PA', 10), [(3, 'Pantoprazole'), (1, 'Paracetamol')]
+        )
+        self.assertEqual(index.search('p', 1), [(3, 'Pantoprazole')])
+        self.assertEqual(index.search('x', 10), [])
+
+    def test_put_and_discard(self):
+        """Test renamed and removed rows are reflected in the index"""
+        index = autocomplete.PrefixIndex([(1, 'Zinc'), (2, 'Iron')])
+
+        index.put(1, 'Zinc oxide')
+        index.put(3, 'Zeaxanthin')
+        index.discard(2)
+
+        self.assertEqual(
+            index.search('z', 10), [(3, 'Zeaxanthin'), (1, 'Zinc oxide')]
+        )
+        self.assertEqual(index.search('i', 10), [])
+
+
+class AutocompleteApiTests(TestCase):
+
+    def setUp(self):
+        autocomplete.indexes.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_login_required(self):
+        """Test that login is required for autocomplete"""
+        res = APIClient().get(TAGS_AUTOCOMPLETE_URL, {'q': 'a'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_autocomplete_tags(self):
+        """Test tags are matched by prefix and limited to the user"""
+        other = get_user_model().objects.create_user(
+            'other@dummy.com',
+            'testpass'
+        )
+        Tag.objects.create(user=self.user, name='Morning')
+        Tag.objects.create(user=self.user, name='midday')
+        Tag.objects.create(user=self.user, name='Evening')
+        Tag.objects.create(user=other, name='Monday')
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'm'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(names(res), ['midday', 'Morning'])
+
+    def test_autocomplete_limit(self):
+        """Test only the first `limit` matches are returned"""
+        for name in ('Zinc', 'Zeaxanthin', 'Zinc oxide'):
+            Ingredient.objects.create(user=self.user, name=name)
+
+        res = self.client.get(
+            INGREDIENTS_AUTOCOMPLETE_URL, {'q': 'z', 'limit': 2}
+        )
+
+        self.assertEqual(names(res), ['Zeaxanthin', 'Zinc'])
+
+    def test_autocomplete_served_from_index(self):
+        """Test repeated lookups do not query the catalog"""
+        Tag.objects.create(user=self.user, name='Morning')
+        self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'm'})
+
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'mo'})
+
+        self.assertEqual(names(res), ['Morning'])
+
+    def test_index_follows_writes(self):
+        """Test created, renamed and deleted tags update the index"""
+        tag = Tag.objects.create(user=self.user, name='Morning')
+        self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'm'})
+
+        Tag.objects.create(user=self.user, name='Midnight')
+        tag.name = 'Dawn'
+        tag.save()
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'm'})
+        self.assertEqual(names(res), ['Midnight'])
+
+        tag.delete()
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'd'})
+        self.assertEqual(names(res), [])
+
+    def test_invalid_limit(self):
+        """Test an out of range limit is rejected"""
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'm', 'limit': 0})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(AUTOCOMPLETE_INDEX_MAX_ROWS=1)
+    def test_large_catalog_queries_database(self):
+        """Test users over the index size are matched in the database"""
+        Ingredient.objects.create(user=self.user, name='Zinc')
+        Ingredient.objects.create(user=self.user, name='Iron')
+        self.client.get(INGREDIENTS_AUTOCOMPLETE_URL, {'q': 'z'})
+
+        with self.assertNumQueries(1):
+            res = self.client.get(INGREDIENTS_AUTOCOMPLETE_URL, {'q': 'ir'})
+
+        self.assertEqual(names(res), ['Iron'])
@@ -0,0 +1,250 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.middleware import Limiter
+from core.models import Drug, Tag, Ingredient, Tombstone
+from drug import events, sync
+
+CHANGES_URL = reverse('drug:changes-list')
+STREAM_URL = reverse('drug:changes-stream')
+
+
+def read_stream(res):
+    return b''.join(res.streaming_content).decode()
+
+
+def sample_drug(user, **params):
+    """Create and return a sample drug"""
+    defaults = {
+        'title': 'Sample drug',
+        'daily_frequency': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Drug.objects.create(user=user, **defaults)
+
+
+@override_settings(SYNC_SAFETY_LAG_SECONDS=0)
+class ChangesApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def sync(self, cursor=None, **params):
+        if cursor is not None:
+            params['since'] = cursor
+        res = self.client.get(CHANGES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_user_delete_leaves_no_tombstones(self):
+        """Test deleting a user removes its tombstones and adds none"""
+        drug = sample_drug(self.user)
+        drug.tags.add(Tag.objects.create(user=self.user, name='Morning'))
+        Ingredient.objects.create(user=self.user, name='Zinc').delete()
+
+        self.user.delete()
+
+        self.assertFalse(Tombstone.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(Drug.objects.exists())
+
+    def test_login_required(self):
+        """Test that login is required for the change feed"""
+        res = APIClient().get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_full_sync(self):
+        """Test syncing without a cursor returns all the user's rows"""
+        other = get_user_model().objects.create_user(
+            'other@dummy.com',
+            'testpass'
+        )
+        tag = Tag.objects.create(user=self.user, name='Morning')
+        Tag.objects.create(user=other, name='Other')
+        drug = sample_drug(self.user)
+        drug.tags.add(tag)
+
+        data = self.sync()
+
+        self.assertEqual([item['id'] for item in data['drugs']], [drug.id])
+        self.assertEqual(data['drugs'][0]['tags'], [tag.id])
+        self.assertEqual([item['name'] for item in data['tags']], ['Morning'])
+        self.assertFalse(data['has_more'])
+
+    def test_incremental_sync(self):
+        """Test only rows changed after the cursor are returned"""
+        tag = Tag.objects.create(user=self.user, name='Morning')
+        drug = sample_drug(self.user)
+        ingredient = Ingredient.objects.create(user=self.user, name='Zinc')
+        cursor = self.sync()['cursor']
+
+        tag.name = 'Evening'
+        tag.save()
+        drug.ingredients.add(ingredient)
+        deleted_id = ingredient.id
+        ingredient.delete()
+        data = self.sync(cursor)
+
+        self.assertEqual([item['name'] for item in data['tags']], ['Evening'])
+        self.assertEqual([item['id'] for item in data['drugs']], [drug.id])
+        self.assertEqual(data['ingredients'], [])
+        self.assertEqual(data['deleted']['ingredients'], [deleted_id])
+
+        data = self.sync(data['cursor'])
+        self.assertEqual(data['drugs'], [])
+        self.assertEqual(data['deleted']['ingredients'], [])
+
+    def test_paged_sync(self):
+        """Test large change sets are returned over several pages"""
+        for name in ('One', 'Two', 'Three'):
+            Tag.objects.create(user=self.user, name=name)
+
+        first = self.sync(limit=2)
+        second = self.sync(first['cursor'], limit=2)
+
+        self.assertTrue(first['has_more'])
+        self.assertFalse(second['has_more'])
+        names = [item['name'] for item in first['tags'] + second['tags']]
+        self.assertEqual(names, ['One', 'Two', 'Three'])
+
+    def test_expired_cursor(self):
+        """Test cursors older than the tombstone retention are refused"""
+        cursor = sync.to_cursor(timezone.now() - timedelta(days=365))
+
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+    def test_invalid_cursor(self):
+        """Test malformed cursors are rejected"""
+        for cursor in ('yesterday', '-1', '99999999999999999999'):
+            res = self.client.get(CHANGES_URL, {'since': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_delete_records_tombstone(self):
+        """Test deleting a drug leaves a tombstone for its owner"""
+        drug = sample_drug(self.user)
+
+        self.client.delete(reverse('drug:drug-detail', args=[drug.id]))
+
+        tombstone = Tombstone.objects.get()
+        self.assertEqual(
+            (tombstone.model, tombstone.object_id, tombstone.user),
+            ('drug', drug.id, self.user)
+        )
+
+
+@override_settings(SYNC_SAFETY_LAG_SECONDS=0, SSE_MAX_SECONDS=0)
+class ChangeStreamTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        # Leave no LISTEN session open on the test database.
+        self.addCleanup(events.hub.stop)
+
+    def test_login_required(self):
+        """Test that a valid token is required for the stream"""
+        res = self.client.get(STREAM_URL, {'token': 'invalid'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_stream_resumes_from_last_event(self):
+        """Test the stream sends changes after the Last-Event-ID"""
+        Tag.objects.create(user=self.user, name='Before')
+        cursor = sync.to_cursor(timezone.now())
+        Tag.objects.create(user=self.user, name='After')
+
+        res = self.client.get(
+            STREAM_URL, {'token': self.token.key},
+            HTTP_LAST_EVENT_ID=cursor, HTTP_ACCEPT='text/event-stream'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/event-stream')
+        body = read_stream(res)
+        self.assertIn('event: changes', body)
+        self.assertIn('"name":"After"', body)
+        self.assertNotIn('"name":"Before"', body)
+
+    def test_stream_rejects_out_of_range_cursor(self):
+        """Test a Last-Event-ID past the last representable time fails"""
+        res = self.client.get(
+            STREAM_URL, {'token': self.token.key},
+            HTTP_LAST_EVENT_ID='99999999999999999999',
+            HTTP_ACCEPT='text/event-stream'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream_without_changes(self):
+        """Test a stream without changes sends no events"""
+        Tag.objects.create(user=self.user, name='Old')
+
+        res = self.client.get(STREAM_URL, {'token': self.token.key})
+
+        self.assertNotIn('event: changes', read_stream(res))
+
+    def test_streams_limited(self):
+        """Test streams over the limit are refused until one closes"""
+        with patch.object(events, 'streams', Limiter(1, 0)):
+            res = self.client.get(STREAM_URL, {'token': self.token.key})
+            refused = self.client.get(STREAM_URL, {'token': self.token.key})
+            read_stream(res)
+            again = self.client.get(STREAM_URL, {'token': self.token.key})
+            read_stream(again)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            refused.status_code, status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        self.assertIn('Retry-After', refused)
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+
+    def test_hub_stop(self):
+        """Test stopping the hub ends its listener and it can restart"""
+        hub = events.ChangeHub()
+        event = hub.subscribe(1)
+        thread = hub._thread
+
+        hub.stop()
+
+        self.assertIsNone(hub._thread)
+        if thread is not None:
+            self.assertFalse(thread.is_alive())
+        hub.unsubscribe(1, event)
+
+    def test_hub_wakes_subscribers(self):
+        """Test notifications wake only the user's streams"""
+        hub = events.ChangeHub()
+        self.addCleanup(hub.stop)
+        mine = hub.subscribe(1)
+        other = hub.subscribe(2)
+
+        hub.publish(1)
+
+        self.assertTrue(mine.is_set())
+        self.assertFalse(other.is_set())
+        hub.unsubscribe(1, mine)
+        hub.unsubscribe(2, other)
@@ -2,14 +2,25 @@ import tempfile
 import os
 from PIL import Image
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
-from core.models import Drug, Tag, Ingredient
+from core import jobs
+from core.models import Drug, Tag, Ingredient, Job
+from drug import tasks
 from drug.serializers import DrugSerializer, DrugDetailSerializer
 
 DRUGS_URL = reverse('drug:drug-list')
+BULK_DELETE_URL = reverse('drug:drug-bulk-delete')
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def job_url(job_id):
+    """Return job status URL"""
+    return reverse('drug:job-detail', args=[job_id])
 
 def image_upload_url(drug_id):
     """Return URL for drug image upload"""
@@ -192,6 +203,58 @@ class PrivateDrugApiTests(TestCase):
         tags = drug.tags.all()
         self.assertEqual(len(tags), 0)
 
+    def test_update_unchanged_drug_skips_writes(self):
+        """Test re-sending a drug unchanged issues no writes"""
+        drug = sample_drug(user=self.user, link='')
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        drug.tags.add(tag)
+        drug.ingredients.add(ingredient)
+        payload = {
+            'title': drug.title,
+            'tags': [tag.id],
+            'ingredients': [ingredient.id],
+            'daily_frequency': drug.daily_frequency,
+            'price': '5.00',
+            'link': '',
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.put(detail_url(drug.id), payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        writes = [q['sql'] for q in queries
+                  if q['sql'].split()[0].upper() in WRITE_STATEMENTS]
+        self.assertEqual(writes, [])
+
+    def test_update_links_applies_diff(self):
+        """Test changing links deletes and inserts only the difference"""
+        drug = sample_drug(user=self.user)
+        keep = sample_tag(user=self.user, name='keep')
+        drop = sample_tag(user=self.user, name='drop')
+        new1 = sample_tag(user=self.user, name='new1')
+        new2 = sample_tag(user=self.user, name='new2')
+        drug.tags.add(keep, drop)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(
+                detail_url(drug.id),
+                {'tags': [keep.id, new1.id, new2.id]}
+            )
+
+        through = Drug.tags.through._meta.db_table
+        link_writes = [q['sql'] for q in queries
+                       if through in q['sql'] and
+                       q['sql'].split()[0].upper() in WRITE_STATEMENTS]
+        self.assertEqual(len(link_writes), 2)
+        self.assertEqual(
+            sorted(res.data['tags']), sorted([keep.id, new1.id, new2.id])
+        )
+        self.assertEqual(
+            set(drug.tags.values_list('id', flat=True)),
+            {keep.id, new1.id, new2.id}
+        )
+
 class DrugImageUploadTests(TestCase):
 
     def setUp(self):
@@ -227,6 +290,43 @@ class DrugImageUploadTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_upload_image_queues_reencode(self):
+        """Test an uploaded image is queued for re-encoding"""
+        url = image_upload_url(self.drug.id)
+        with tempfile.NamedTemporaryFile(suffix='.png') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='PNG')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.drug.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        job = Job.objects.get(name='drug.reencode_image')
+        self.assertEqual(job.queue, 'images')
+
+    @override_settings(IMAGE_MAX_PIXELS=99)
+    def test_upload_image_too_many_pixels(self):
+        """Test images over the pixel limit are rejected undecoded"""
+        url = image_upload_url(self.drug.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pixels', res.data['image'][0])
+
+    def test_upload_image_unsupported_format(self):
+        """Test images in formats other than the allowed ones fail"""
+        url = image_upload_url(self.drug.id)
+        with tempfile.NamedTemporaryFile(suffix='.bmp') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='BMP')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.drug.refresh_from_db()
+        self.assertFalse(self.drug.image)
+
 
 class DrugFilterTests(TestCase):
 
@@ -283,3 +383,74 @@ class DrugFilterTests(TestCase):
         self.assertIn(serializer1.data, res.data)
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
+
+    @override_settings(FILTER_MAX_IDS=3)
+    def test_filter_rejects_long_id_lists(self):
+        """Test filters with too many IDs are rejected before querying"""
+        res = self.client.get(DRUGS_URL, {'tags': '1,2,3,4'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_rejects_bad_ids(self):
+        """Test filters with non integer IDs are a bad request"""
+        res = self.client.get(DRUGS_URL, {'ingredients': '1,x'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DrugBulkDeleteTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@dummy.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_delete_runs_in_background(self):
+        """Test bulk deletes are queued and reported through jobs"""
+        drug1 = sample_drug(user=self.user)
+        drug2 = sample_drug(user=self.user)
+        keep = sample_drug(user=self.user)
+        other = sample_drug(user=get_user_model().objects.create_user(
+            'other@dummy.com',
+            'testpass'
+        ))
+
+        res = self.client.post(
+            BULK_DELETE_URL,
+            {'ids': [drug1.id, drug2.id, other.id]},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Drug.objects.count(), 4)
+        jobs.run(jobs.claim('default', 'test-worker'))
+
+        res = self.client.get(job_url(res.data['id']))
+        self.assertEqual(res.data['status'], 'succeeded')
+        self.assertEqual(res.data['result'], {'deleted': 2})
+        self.assertEqual(
+            set(Drug.objects.values_list('id', flat=True)),
+            {keep.id, other.id}
+        )
+
+    def test_bulk_delete_invalid(self):
+        """Test bulk delete requires a list of ids"""
+        res = self.client.post(BULK_DELETE_URL, {'ids': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_jobs_limited_to_user(self):
+        """Test users only see their own jobs"""
+        other = get_user_model().objects.create_user(
+            'other@dummy.com',
+            'testpass'
+        )
+        job = tasks.delete_drugs.delay(user=other, user_id=other.id,
+                                       drug_ids=[1])
+
+        res = self.client.get(job_url(job.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
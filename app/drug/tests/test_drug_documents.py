@@ -0,0 +1,190 @@
+import json
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection
+from django.db.models.query import QuerySet
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Drug, DrugDocument, Tag, Ingredient
+from drug import documents
+from drug.serializers import DrugDetailSerializer
+
+DRUGS_URL = reverse('drug:drug-list')
+
+
+def detail_url(drug_id):
+    """Return drug detail URL"""
+    return reverse('drug:drug-detail', args=[drug_id])
+
+
+def sample_drug(user, **params):
+    """Create and return a sample drug"""
+    defaults = {
+        'title': 'Sample drug',
+        'daily_frequency': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Drug.objects.create(user=user, **defaults)
+
+
+def stored_document(drug):
+    return json.loads(DrugDocument.objects.get(pk=drug.pk).body)
+
+
+class DrugDocumentTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Morning')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Zinc'
+        )
+
+    def test_document_created_with_drug(self):
+        """Test creating a drug stores its detail document"""
+        payload = {
+            'title': 'Vitamin',
+            'tags': [self.tag.id],
+            'ingredients': [self.ingredient.id],
+            'daily_frequency': 2,
+            'price': 3.00
+        }
+        res = self.client.post(DRUGS_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        drug = Drug.objects.get(id=res.data['id'])
+        self.assertEqual(
+            stored_document(drug),
+            json.loads(json.dumps(DrugDetailSerializer(drug).data))
+        )
+
+    def test_retrieve_single_query(self):
+        """Test retrieving a drug is a single lookup"""
+        drug = sample_drug(user=self.user)
+        drug.tags.add(self.tag)
+        drug.ingredients.add(self.ingredient)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(detail_url(drug.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], self.tag.name)
+
+    def test_update_rebuilds_document(self):
+        """Test updating a drug's tags updates its document"""
+        drug = sample_drug(user=self.user)
+        drug.tags.add(self.tag)
+        new_tag = Tag.objects.create(user=self.user, name='Evening')
+
+        self.client.patch(detail_url(drug.id), {'tags': [new_tag.id]})
+
+        tags = [tag['name'] for tag in stored_document(drug)['tags']]
+        self.assertEqual(tags, ['Evening'])
+
+    def test_tag_rename_rebuilds_document(self):
+        """Test renaming a tag updates the documents referencing it"""
+        drug = sample_drug(user=self.user)
+        drug.tags.add(self.tag)
+
+        self.tag.name = 'Night'
+        self.tag.save()
+
+        self.assertEqual(stored_document(drug)['tags'][0]['name'], 'Night')
+
+    def test_tag_save_without_rename_keeps_document(self):
+        """Test saving a tag under the same name rebuilds nothing"""
+        drug = sample_drug(user=self.user)
+        drug.tags.add(self.tag)
+        tag = Tag.objects.get(pk=self.tag.pk)
+
+        with patch('drug.signals.documents.mark_dirty') as mark_dirty:
+            tag.save()
+            tag.name = 'Night'
+            tag.save(update_fields=['updated_at'])
+
+        mark_dirty.assert_not_called()
+
+    def test_delete_queries_independent_of_rows(self):
+        """Test deleting many tags costs as many queries as one"""
+        def delete_tags(count):
+            drug = sample_drug(user=self.user)
+            drug.tags.add(*[
+                Tag.objects.create(user=self.user, name='Tag %d' % n)
+                for n in range(count)
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                Tag.objects.filter(drug=drug).delete()
+            return len(queries)
+
+        self.assertEqual(delete_tags(1), delete_tags(5))
+
+    def test_tag_delete_invalidates_document(self):
+        """Test deleting an ingredient drops it from the detail view"""
+        drug = sample_drug(user=self.user)
+        drug.ingredients.add(self.ingredient)
+
+        self.ingredient.delete()
+        res = self.client.get(detail_url(drug.id))
+
+        self.assertEqual(res.data['ingredients'], [])
+        self.assertEqual(stored_document(drug)['ingredients'], [])
+
+    def test_missing_document_built_on_read(self):
+        """Test drugs without a document still retrieve correctly"""
+        drug = sample_drug(user=self.user)
+        DrugDocument.objects.all().delete()
+
+        res = self.client.get(detail_url(drug.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], drug.title)
+        self.assertTrue(DrugDocument.objects.filter(pk=drug.pk).exists())
+
+    def test_other_users_document_not_found(self):
+        """Test documents are limited to their owner"""
+        other = get_user_model().objects.create_user(
+            'other@dummy.com',
+            'testpass'
+        )
+        drug = sample_drug(user=other)
+
+        res = self.client.get(detail_url(drug.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_malformed_id_not_found(self):
+        """Test a non numeric drug id is a 404"""
+        res = self.client.get('/api/drug/drugs/abc/')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rebuild_survives_concurrent_insert(self):
+        """Test a rebuild racing another one replaces its document"""
+        drug = sample_drug(user=self.user, title='Raced')
+        bulk_create = QuerySet.bulk_create
+        calls = []
+
+        def racing_bulk_create(queryset, objs, *args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise IntegrityError('duplicate key value')
+            return bulk_create(queryset, objs, *args, **kwargs)
+
+        with patch.object(QuerySet, 'bulk_create', racing_bulk_create):
+            bodies = documents.rebuild([drug.pk], 'default')
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(json.loads(bodies[drug.pk])['title'], 'Raced')
+        self.assertEqual(stored_document(drug)['title'], 'Raced')
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import time
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.models import Drug, Job
+from drug import media, tasks
+
+
+def sample_drug(user, **params):
+    """Create and return a sample drug"""
+    defaults = {
+        'title': 'Sample drug',
+        'daily_frequency': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Drug.objects.create(user=user, **defaults)
+
+
+class GcMediaTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+
+    def write(self, path, age=2 * 86400):
+        """Create an image file at `path` last modified `age` seconds ago"""
+        full = os.path.join(self.media_root.name, path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, 'wb') as f:
+            f.write(b'image')
+        stamp = time.time() - age
+        os.utime(full, (stamp, stamp))
+        return path
+
+    def exists(self, path):
+        return os.path.exists(os.path.join(self.media_root.name, path))
+
+    def gc(self, **options):
+        out = StringIO()
+        call_command('gc_media', stdout=out, **options)
+        return out.getvalue()
+
+    def test_deletes_only_old_orphans(self):
+        """Test unreferenced images past the minimum age are deleted"""
+        used = self.write('uploads/drug/ab/cd/abcd-used.jpg')
+        sample_drug(self.user, image=used)
+        orphan = self.write('uploads/drug/ab/ce/abce-orphan.jpg')
+        young = self.write('uploads/drug/ab/cf/abcf-young.jpg', age=60)
+
+        out = self.gc(batch_size=2)
+
+        self.assertIn('Deleted 1 of 2 files', out)
+        self.assertTrue(self.exists(used))
+        self.assertFalse(self.exists(orphan))
+        self.assertTrue(self.exists(young))
+
+    def test_dry_run(self):
+        """Test a dry run reports orphans without deleting them"""
+        orphan = self.write('uploads/drug/ab/cd/abcd-orphan.jpg')
+
+        out = self.gc(dry_run=True)
+
+        self.assertIn('Would delete 1 of 1 files', out)
+        self.assertTrue(self.exists(orphan))
+
+    def test_reshard_moves_flat_images(self):
+        """Test images from before the fan-out move with their drugs"""
+        flat = self.write('uploads/drug/abcd-flat.jpg')
+        drug = sample_drug(self.user, image=flat)
+
+        self.gc(reshard=True)
+
+        drug.refresh_from_db()
+        self.assertEqual(drug.image.name, 'uploads/drug/ab/cd/abcd-flat.jpg')
+        self.assertTrue(self.exists(drug.image.name))
+        self.assertFalse(self.exists(flat))
+
+    def test_schedule(self):
+        """Test scheduling queues a single recurring job"""
+        self.gc(schedule=True)
+        out = self.gc(schedule=True)
+
+        self.assertIn('already scheduled', out)
+        self.assertEqual(Job.objects.filter(name='drug.gc_media').count(), 1)
+
+    def test_task_queues_next_run(self):
+        """Test a collection run queues the following one"""
+        orphan = self.write('uploads/drug/ab/cd/abcd-orphan.jpg')
+
+        stats = tasks.gc_media()
+
+        self.assertEqual(stats['deleted'], 1)
+        self.assertFalse(self.exists(orphan))
+        job = Job.objects.get(name='drug.gc_media')
+        self.assertEqual(job.status, Job.QUEUED)
+
+    def test_pacer_limits_rate(self):
+        """Test the pacer spaces operations out"""
+        pacer = media.Pacer(rate=100)
+        started = time.monotonic()
+        for _ in range(4):
+            pacer.wait()
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.03)
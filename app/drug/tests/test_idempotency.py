@@ -0,0 +1,139 @@
+import threading
+import time
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import idempotency
+from core.middleware import StatementTimeout
+from core.models import Drug, IdempotencyKey, Tag
+
+DRUGS_URL = reverse('drug:drug-list')
+TAGS_URL = reverse('drug:tag-list')
+INGREDIENTS_URL = reverse('drug:ingredient-list')
+
+
+class IdempotencyKeyTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def post(self, url, payload, key='key-1'):
+        return self.client.post(
+            url, payload, format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_replays_response(self):
+        """Test a retried create returns the first response"""
+        payload = {
+            'title': 'Aspirin', 'daily_frequency': 2, 'price': '3.50',
+            'tags': [], 'ingredients': [],
+        }
+
+        first = self.post(DRUGS_URL, payload)
+        second = self.post(DRUGS_URL, payload)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Drug.objects.count(), 1)
+
+    def test_keys_are_per_user(self):
+        """Test another user's key does not replay their response"""
+        other = get_user_model().objects.create_user(
+            'other@dummy.com',
+            'testpass'
+        )
+        self.post(TAGS_URL, {'name': 'Morning'})
+        self.client.force_authenticate(other)
+
+        res = self.post(TAGS_URL, {'name': 'Morning'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(name='Morning').count(), 2)
+
+    def test_reused_key_rejected(self):
+        """Test a key sent with a different request is rejected"""
+        self.post(TAGS_URL, {'name': 'Morning'})
+
+        res = self.post(INGREDIENTS_URL, {'name': 'Zinc'})
+
+        self.assertEqual(
+            res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+
+    def test_failed_create_not_stored(self):
+        """Test an invalid create can be retried under the same key"""
+        res = self.post(TAGS_URL, {'name': ''})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        res = self.post(TAGS_URL, {'name': ''})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_key_runs_again(self):
+        """Test a key past its TTL creates again"""
+        self.post(TAGS_URL, {'name': 'Morning'})
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+
+        res = self.post(TAGS_URL, {'name': 'Morning'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class ConcurrentClaimTests(TransactionTestCase):
+
+    def test_duplicate_insert_inside_transaction(self):
+        """Test losing the insert race keeps the outer transaction usable"""
+        user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+        inserted = threading.Event()
+
+        def insert_first():
+            try:
+                with transaction.atomic():
+                    IdempotencyKey.objects.create(
+                        user=user, key='key-1', fingerprint='first'
+                    )
+                    inserted.set()
+                    # Commit while the other insert waits on the key.
+                    time.sleep(0.2)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=insert_first)
+        thread.start()
+        self.assertTrue(inserted.wait(5))
+        timeout = StatementTimeout()
+        timeout.set(5000)
+        self.addCleanup(timeout.reset)
+
+        with transaction.atomic():
+            record = idempotency._claim(user, 'key-1', 'second', 'default')
+            Tag.objects.create(user=user, name='Morning')
+        thread.join()
+
+        self.assertEqual(record.fingerprint, 'first')
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+        self.assertTrue(Tag.objects.filter(name='Morning').exists())
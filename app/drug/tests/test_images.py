@@ -0,0 +1,95 @@
+import os
+import tempfile
+import zlib
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework import serializers
+
+from core.models import Drug
+from drug import images, tasks
+
+ORIENTATION = 0x0112
+
+
+def sample_image(path, size=(20, 10), image_format='JPEG', **options):
+    """Write a sample image to `path` and return the path"""
+    Image.new('RGB', size, 'red').save(path, format=image_format, **options)
+    return path
+
+
+class ImageProbeTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_probe_reads_header(self):
+        """Test the format and dimensions come from the header"""
+        path = sample_image(self.path('a.jpg'))
+
+        self.assertEqual(
+            images.probe(path, os.path.getsize(path)), ('JPEG', 20, 10)
+        )
+
+    def test_probe_limits(self):
+        """Test byte and pixel limits are enforced"""
+        path = sample_image(self.path('a.png'), image_format='PNG')
+        size = os.path.getsize(path)
+
+        with override_settings(IMAGE_MAX_BYTES=size - 1), \
+                self.assertRaisesMessage(serializers.ValidationError,
+                                         'bytes'):
+            images.probe(path, size)
+        with override_settings(IMAGE_MAX_PIXELS=199), \
+                self.assertRaisesMessage(serializers.ValidationError,
+                                         'pixels'):
+            images.probe(path, size)
+
+    def test_probe_decompression_bomb(self):
+        """Test a header declaring a huge image is rejected"""
+        path = sample_image(self.path('a.png'), image_format='PNG')
+        with open(path, 'rb') as f:
+            data = bytearray(f.read())
+        # Declare a huge width in the IHDR chunk and fix up its CRC
+        data[16:20] = (2 ** 30).to_bytes(4, 'big')
+        data[29:33] = zlib.crc32(bytes(data[12:29])).to_bytes(4, 'big')
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        with self.assertRaisesMessage(serializers.ValidationError,
+                                      'pixels'):
+            images.probe(path, len(data))
+
+    def test_reencode_strips_metadata(self):
+        """Test re-encoding applies the orientation and drops EXIF"""
+        exif = Image.Exif()
+        exif[ORIENTATION] = 6
+        path = sample_image(self.path('a.jpg'), exif=exif.tobytes())
+
+        self.assertTrue(images.reencode(path))
+
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (10, 20))
+            self.assertNotIn('exif', image.info)
+
+    def test_reencode_task_skips_replaced_image(self):
+        """Test the task leaves images no longer used by the drug"""
+        user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+        drug = Drug.objects.create(
+            user=user, title='Sample', daily_frequency=1, price=1,
+            image='uploads/drug/sa/mp/new.jpg'
+        )
+
+        result = tasks.reencode_image(
+            drug_id=drug.pk, name='uploads/drug/sa/mp/old.jpg'
+        )
+
+        self.assertEqual(result, {'reencoded': False})
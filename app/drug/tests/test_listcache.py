@@ -0,0 +1,118 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Drug, Tag
+from drug import listcache
+
+DRUGS_URL = reverse('drug:drug-list')
+
+
+def sample_drug(user, **params):
+    """Create and return a sample drug"""
+    defaults = {
+        'title': 'Sample drug',
+        'daily_frequency': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Drug.objects.create(user=user, **defaults)
+
+
+class DrugListCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def list_drugs(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(DRUGS_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        drug_queries = [
+            q for q in queries if 'core_drug' in q['sql']
+        ]
+        return res.data, len(drug_queries)
+
+    def test_identical_reads_share_result(self):
+        """Test a repeated list is served without querying drugs"""
+        sample_drug(self.user)
+
+        first, first_queries = self.list_drugs()
+        second, second_queries = self.list_drugs()
+
+        self.assertEqual(second, first)
+        self.assertGreater(first_queries, 0)
+        self.assertEqual(second_queries, 0)
+
+    def test_params_are_part_of_key(self):
+        """Test lists filtered differently are cached apart"""
+        tag = Tag.objects.create(user=self.user, name='Morning')
+        tagged = sample_drug(self.user, title='Tagged')
+        tagged.tags.add(tag)
+        sample_drug(self.user, title='Untagged')
+
+        everything, _ = self.list_drugs()
+        filtered, _ = self.list_drugs(tags=str(tag.id))
+
+        self.assertEqual(len(everything), 2)
+        self.assertEqual([d['title'] for d in filtered], ['Tagged'])
+
+    def test_changes_invalidate(self):
+        """Test catalog writes are visible to the next list"""
+        drug = sample_drug(self.user)
+        self.list_drugs()
+
+        Drug.objects.filter(pk=drug.pk).update(title='Stale')
+        listcache.bump(self.user.pk, 'default')
+        data, _ = self.list_drugs()
+        self.assertEqual(data[0]['title'], 'Stale')
+
+        tag = Tag.objects.create(user=self.user, name='Evening')
+        drug.tags.add(tag)
+        data, _ = self.list_drugs()
+        self.assertEqual(data[0]['tags'], [tag.id])
+
+    def test_other_users_not_shared(self):
+        """Test cached lists are per user"""
+        sample_drug(self.user)
+        self.list_drugs()
+        other = get_user_model().objects.create_user(
+            'other@dummy.com',
+            'testpass'
+        )
+        self.client.force_authenticate(other)
+
+        data, _ = self.list_drugs()
+
+        self.assertEqual(data, [])
+
+    def test_new_user_gets_new_version(self):
+        """Test lists cached for a reused user id are not served"""
+        before = listcache.version(self.user.pk + 1)
+
+        get_user_model().objects.create_user('new@dummy.com', 'testpass')
+
+        self.assertNotEqual(listcache.version(self.user.pk + 1), before)
+
+    @override_settings(DRUG_LIST_CACHE_SECONDS=0)
+    def test_disabled(self):
+        """Test lists are computed every time when caching is off"""
+        sample_drug(self.user)
+        self.list_drugs()
+
+        _, queries = self.list_drugs()
+
+        self.assertGreater(queries, 0)
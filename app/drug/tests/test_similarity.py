@@ -0,0 +1,106 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Drug, Ingredient
+from drug import similarity
+
+
+def similar_url(drug_id):
+    """Return similar drugs URL"""
+    return reverse('drug:drug-similar', args=[drug_id])
+
+
+def sample_drug(user, ingredients=(), **params):
+    """Create and return a sample drug with the given ingredients"""
+    defaults = {
+        'title': 'Sample drug',
+        'daily_frequency': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    drug = Drug.objects.create(user=user, **defaults)
+    drug.ingredients.add(*ingredients)
+    return drug
+
+
+class IngredientIndexTests(TestCase):
+
+    def test_ranked_by_jaccard(self):
+        """Test drugs are ranked by shared over combined ingredients"""
+        index = similarity.IngredientIndex(
+            [(1, 10), (1, 11), (2, 10), (2, 11), (2, 12), (3, 10), (4, 13)]
+        )
+
+        self.assertEqual(index.similar(1, 10), [(2, 2 / 3), (3, 0.5)])
+        self.assertEqual(index.similar(1, 1), [(2, 2 / 3)])
+        self.assertEqual(index.similar(1, 10, min_score=0.6), [(2, 2 / 3)])
+        self.assertEqual(index.similar(5, 10), [])
+
+    def test_remove(self):
+        """Test removed links and drugs are no longer candidates"""
+        index = similarity.IngredientIndex([(1, 10), (2, 10), (3, 10)])
+
+        index.remove_drug(2)
+        index.remove(3, [10])
+
+        self.assertEqual(index.similar(1, 10), [])
+        self.assertNotIn(3, index.drugs)
+
+
+class SimilarApiTests(TestCase):
+
+    def setUp(self):
+        similarity.indexes.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.zinc = Ingredient.objects.create(user=self.user, name='Zinc')
+        self.iron = Ingredient.objects.create(user=self.user, name='Iron')
+
+    def test_similar_drugs(self):
+        """Test drugs sharing ingredients are listed best first"""
+        drug = sample_drug(self.user, [self.zinc, self.iron], title='Multi')
+        same = sample_drug(self.user, [self.zinc, self.iron], title='Copy')
+        partial = sample_drug(self.user, [self.zinc], title='Zinc only')
+        sample_drug(self.user, title='Nothing shared')
+
+        res = self.client.get(similar_url(drug.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': same.id, 'title': 'Copy', 'score': 1.0},
+            {'id': partial.id, 'title': 'Zinc only', 'score': 0.5},
+        ])
+
+    def test_index_follows_ingredient_changes(self):
+        """Test ingredient updates after the index is built are applied"""
+        drug = sample_drug(self.user, [self.zinc])
+        other = sample_drug(self.user, [self.iron], title='Iron tablet')
+        self.client.get(similar_url(drug.id))
+
+        other.ingredients.add(self.zinc)
+        res = self.client.get(similar_url(drug.id))
+        self.assertEqual([item['id'] for item in res.data], [other.id])
+
+        self.zinc.delete()
+        res = self.client.get(similar_url(drug.id))
+        self.assertEqual(res.data, [])
+
+    def test_other_users_drug_not_found(self):
+        """Test similar drugs are limited to the owner's drugs"""
+        other = get_user_model().objects.create_user(
+            'other@dummy.com',
+            'testpass'
+        )
+        drug = sample_drug(other)
+
+        res = self.client.get(similar_url(drug.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,176 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Drug, UploadSession
+from drug import uploads
+
+UPLOADS_URL = reverse('drug:uploadsession-list')
+
+
+def upload_url(session_id):
+    """Return upload session URL"""
+    return reverse('drug:uploadsession-detail', args=[session_id])
+
+
+def finalize_url(session_id):
+    """Return upload session finalize URL"""
+    return reverse('drug:uploadsession-finalize', args=[session_id])
+
+
+def sample_drug(user, **params):
+    """Create and return a sample drug"""
+    defaults = {
+        'title': 'Sample drug',
+        'daily_frequency': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Drug.objects.create(user=user, **defaults)
+
+
+def sample_image():
+    """Return the bytes of a small JPEG image"""
+    buffer = BytesIO()
+    Image.new('RGB', (10, 10)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class UploadSessionApiTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@dummy.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.drug = sample_drug(self.user)
+        self.image = sample_image()
+
+    def start(self, size=None, drug=None):
+        res = self.client.post(UPLOADS_URL, {
+            'drug': (drug or self.drug).id,
+            'filename': 'photo.jpg',
+            'size': size or len(self.image),
+        })
+        return res
+
+    def put(self, session_id, data, offset):
+        return self.client.put(
+            upload_url(session_id), data,
+            content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_chunked_upload(self):
+        """Test an image sent in chunks becomes the drug's image"""
+        session_id = self.start().data['id']
+        half = len(self.image) // 2
+
+        res = self.put(session_id, self.image[:half], 0)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Upload-Offset'], str(half))
+        self.put(session_id, self.image[half:], half)
+        res = self.client.post(finalize_url(session_id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.drug.refresh_from_db()
+        with open(self.drug.image.path, 'rb') as f:
+            self.assertEqual(f.read(), self.image)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_resume_after_conflict(self):
+        """Test a chunk at the wrong offset is refused with the offset"""
+        session_id = self.start().data['id']
+        self.put(session_id, self.image[:100], 0)
+
+        res = self.put(session_id, self.image[200:], 200)
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+        res = self.client.get(upload_url(session_id))
+        self.assertEqual(res.data['offset'], 100)
+        res = self.put(session_id, self.image[100:], 100)
+        self.assertEqual(res.data['offset'], len(self.image))
+
+    def test_non_image_rejected(self):
+        """Test uploads not starting like an image are refused early"""
+        session_id = self.start(size=1000).data['id']
+
+        res = self.put(session_id, b'not an image at all', 0)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UploadSession.objects.get().offset, 0)
+
+    def test_chunk_past_declared_size(self):
+        """Test chunks cannot exceed the declared size"""
+        session_id = self.start(size=10).data['id']
+
+        res = self.put(session_id, self.image[:20], 0)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_finalize_incomplete(self):
+        """Test an incomplete upload cannot be finalized"""
+        session_id = self.start().data['id']
+        self.put(session_id, self.image[:100], 0)
+
+        res = self.client.post(finalize_url(session_id))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.drug.refresh_from_db()
+        self.assertFalse(self.drug.image)
+
+    def test_other_users_drug(self):
+        """Test sessions can only be created for the user's drugs"""
+        other = get_user_model().objects.create_user(
+            'other@dummy.com',
+            'testpass'
+        )
+
+        res = self.start(drug=sample_drug(other))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_malformed_session_id(self):
+        """Test a chunk for a malformed session id is not found"""
+        res = self.client.put(
+            '/api/drug/uploads/not-a-uuid/', b'data',
+            content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET='0'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_abandon_and_expire(self):
+        """Test sessions can be deleted and idle ones expire"""
+        kept = self.start().data['id']
+        dropped = self.start().data['id']
+        self.put(dropped, self.image[:100], 0)
+
+        res = self.client.delete(upload_url(dropped))
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(os.path.exists(uploads.partial_path(
+            UploadSession(pk=dropped)
+        )))
+
+        UploadSession.objects.filter(pk=kept).update(
+            updated_at=timezone.now() - timedelta(days=2)
+        )
+        self.assertEqual(uploads.expire()['sessions'], 1)
+        self.assertFalse(UploadSession.objects.exists())
@@ -0,0 +1,138 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+from rest_framework import exceptions, status
+
+from core import sharding
+from core.models import UploadSession, drug_image_file_path
+from drug import images
+
+PARTIAL_DIR = 'uploads/partial'
+READ_SIZE = 64 * 1024
+
+# Leading bytes of the image formats accepted for drugs
+SIGNATURES = (
+    b'\xff\xd8\xff',
+    b'\x89PNG\r\n\x1a\n',
+    b'GIF87a',
+    b'GIF89a',
+)
+SIGNATURE_BYTES = max(len(signature) for signature in SIGNATURES)
+
+
+class OffsetConflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Upload-Offset does not match the received bytes.'
+    default_code = 'offset_conflict'
+
+
+def partial_path(session):
+    """Return the file the chunks of `session` are appended to"""
+    return os.path.join(
+        settings.MEDIA_ROOT, PARTIAL_DIR, '%s.part' % session.pk
+    )
+
+
+def append(session, stream, length):
+    """Append `length` bytes read from `stream` to the session's file
+
+    The bytes go to disk as they arrive. Anything past the recorded
+    offset, left by an interrupted chunk, is dropped first, and a chunk
+    that fails to arrive or validate is dropped again.
+    """
+    if session.offset + length > session.size:
+        raise exceptions.ValidationError(
+            {'detail': 'Chunk exceeds the declared upload size.'}
+        )
+    path = partial_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'ab') as f:
+        if f.tell() < session.offset:
+            raise exceptions.ValidationError(
+                {'detail': 'Received data was lost, start a new upload.'}
+            )
+        if f.tell() > session.offset:
+            f.truncate(session.offset)
+        remaining = length
+        while remaining:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            f.write(data)
+            remaining -= len(data)
+        if remaining:
+            f.truncate(session.offset)
+            raise exceptions.ParseError('Chunk ended before Content-Length.')
+
+    received = session.offset + length
+    if session.offset < SIGNATURE_BYTES and (
+            received >= SIGNATURE_BYTES or received == session.size):
+        with open(path, 'rb+') as f:
+            head = f.read(SIGNATURE_BYTES)
+            if not head.startswith(SIGNATURES):
+                f.truncate(session.offset)
+                raise exceptions.ValidationError(
+                    {'detail': 'Upload is not a supported image.'}
+                )
+    return received
+
+
+def finalize(session, drug):
+    """Check the complete upload's header and make it the drug's image"""
+    if session.offset != session.size:
+        raise exceptions.ValidationError(
+            {'detail': 'Upload is incomplete.'}
+        )
+    path = partial_path(session)
+    try:
+        images.probe(path, session.size)
+    except exceptions.ValidationError as exc:
+        raise exceptions.ValidationError({'detail': exc.detail[0]})
+
+    name = drug_image_file_path(drug, session.filename)
+    target = os.path.join(settings.MEDIA_ROOT, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+    # If saving fails the file is unreferenced and gc_media removes it.
+    db = router.db_for_write(type(drug), instance=drug)
+    with transaction.atomic(using=db):
+        drug.image.name = name
+        drug.save(update_fields=['image', 'updated_at'])
+        session.delete()
+    return drug
+
+
+def discard(session):
+    """Delete an upload session and what it received"""
+    path = partial_path(session)
+    session.delete()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def expire():
+    """Delete sessions and partial files idle past the session TTL"""
+    seconds = settings.UPLOAD_SESSION_TTL_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=seconds)
+    sessions = 0
+    for alias in sharding.shards():
+        sessions += UploadSession.objects.using(alias) \
+            .filter(updated_at__lt=cutoff).delete()[0]
+
+    files = 0
+    directory = os.path.join(settings.MEDIA_ROOT, PARTIAL_DIR)
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        entries = []
+    for entry in entries:
+        if entry.stat().st_mtime < time.time() - seconds:
+            os.remove(entry.path)
+            files += 1
+    return {'sessions': sessions, 'files': files}
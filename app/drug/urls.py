@@ -9,6 +9,9 @@ router = DefaultRouter()
 router.register('tags', views.TagViewSet)
 router.register('ingredients', views.IngredientViewSet)
 router.register('drugs', views.DrugViewSet)
+router.register('jobs', views.JobViewSet)
+router.register('uploads', views.UploadSessionViewSet)
+router.register('changes', views.ChangesViewSet, basename='changes')
 
 
 app_name = 'drug'
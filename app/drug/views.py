@@ -1,14 +1,31 @@
+import json
+import uuid
+
+from django.conf import settings
+from django.db import router, transaction
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework import viewsets, mixins, status, exceptions
 from rest_framework.permissions import IsAuthenticated
 
-from core.models import Tag, Ingredient, Drug
+from core import metrics, routers
+from core.idempotency import IdempotentCreateMixin
+from core.authentication import QueryTokenAuthentication, \
+    TokenAuthentication
+from core.models import Tag, Ingredient, Drug, DrugDocument, Job, \
+    UploadSession
+from core.renderers import EventStreamRenderer, JSONRenderer
+
+from drug import (
+    autocomplete, documents, events, listcache, serializers, similarity,
+    sync, tasks, uploads,
+)
 
-from drug import serializers
 
-class BaseDrugAttrViewSet(viewsets.GenericViewSet,
+class BaseDrugAttrViewSet(IdempotentCreateMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """Base viewset for user owned drug attributes"""
@@ -32,6 +49,21 @@ class BaseDrugAttrViewSet(viewsets.GenericViewSet,
         """Create a new object"""
         serializer.save(user=self.request.user)
 
+    @action(methods=['GET'], detail=False)
+    def autocomplete(self, request):
+        """Return the user's objects whose name starts with `q`"""
+        query = serializers.AutocompleteQuerySerializer(
+            data=request.query_params
+        )
+        query.is_valid(raise_exception=True)
+        matches = autocomplete.search(
+            self.queryset.model,
+            request.user.pk,
+            query.validated_data['q'],
+            query.validated_data['limit'],
+        )
+        return Response([{'id': pk, 'name': name} for pk, name in matches])
+
 
 class TagViewSet(BaseDrugAttrViewSet):
     """Manage tags in the database"""
@@ -45,7 +77,7 @@ class IngredientViewSet(BaseDrugAttrViewSet):
     serializer_class = serializers.IngredientSerializer
 
 
-class DrugViewSet(viewsets.ModelViewSet):
+class DrugViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     """Manage drugs in the database"""
     serializer_class = serializers.DrugSerializer
     queryset = Drug.objects.all()
@@ -54,7 +86,18 @@ class DrugViewSet(viewsets.ModelViewSet):
 
     def _params_to_ints(self, qs):
         """Convert a list of string IDs to a list of integers"""
-        return [int(str_id) for str_id in qs.split(',')]
+        str_ids = qs.split(',', settings.FILTER_MAX_IDS)
+        if len(str_ids) > settings.FILTER_MAX_IDS:
+            raise exceptions.ValidationError({
+                'detail': 'Filter by at most %d IDs.'
+                % settings.FILTER_MAX_IDS
+            })
+        try:
+            return [int(str_id) for str_id in str_ids]
+        except ValueError:
+            raise exceptions.ValidationError({
+                'detail': 'IDs must be comma separated integers.'
+            })
 
     def get_queryset(self):
         """Retrieve the drugs for the authenticated user"""
@@ -67,6 +110,9 @@ class DrugViewSet(viewsets.ModelViewSet):
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
             queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+        if self.action in ('update', 'partial_update'):
+            # The serializer diffs new links against the current ones.
+            queryset = queryset.prefetch_related('tags', 'ingredients')
 
         return queryset.filter(user=self.request.user)
 
@@ -76,12 +122,47 @@ class DrugViewSet(viewsets.ModelViewSet):
             return serializers.DrugDetailSerializer
         elif self.action == 'upload_image':
             return serializers.DrugImageSerializer
+        elif self.action == 'bulk_delete':
+            return serializers.DrugBulkDeleteSerializer
 
         return self.serializer_class
 
+    def list(self, request, *args, **kwargs):
+        """List the drugs, sharing the work between identical requests"""
+        if not settings.DRUG_LIST_CACHE_SECONDS:
+            return super().list(request, *args, **kwargs)
+
+        def compute():
+            data = super(DrugViewSet, self).list(
+                request, *args, **kwargs
+            ).data
+            # Drop the serializer ReturnList references before caching
+            return json.loads(json.dumps(data, cls=JSONEncoder))
+        return Response(listcache.drug_list(request, compute))
+
+    def retrieve(self, request, pk=None):
+        """Return the precomputed detail document of a drug"""
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise exceptions.NotFound()
+        body = DrugDocument.objects.filter(pk=pk, user=request.user) \
+            .values_list('body', flat=True).first()
+        if body is None:
+            body = documents.get_or_build(self.get_object())
+        return Response(json.loads(body))
+
     def perform_create(self, serializer):
         """Create a new drug"""
-        serializer.save(user=self.request.user)
+        with transaction.atomic(using=router.db_for_write(Drug)), \
+                documents.deferred():
+            serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        """Update a drug and its detail document together"""
+        with transaction.atomic(using=router.db_for_write(Drug)), \
+                documents.deferred():
+            serializer.save()
 
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
@@ -93,7 +174,7 @@ class DrugViewSet(viewsets.ModelViewSet):
         )
 
         if serializer.is_valid():
-            serializer.save()
+            tasks.schedule_reencode(serializer.save())
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -102,4 +183,206 @@ class DrugViewSet(viewsets.ModelViewSet):
         return Response(
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
-        )
\ No newline at end of file
+        )
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """Return the user's drugs sharing the most ingredients"""
+        drug = self.get_object()
+        query = serializers.SimilarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        ranked = similarity.similar(
+            drug,
+            query.validated_data['limit'],
+            query.validated_data['min_score'],
+        )
+        titles = dict(
+            Drug.objects.filter(
+                user=request.user,
+                pk__in=[drug_id for drug_id, score in ranked]
+            ).values_list('pk', 'title')
+        )
+        return Response([
+            {'id': drug_id, 'title': titles[drug_id], 'score': round(score, 4)}
+            for drug_id, score in ranked if drug_id in titles
+        ])
+
+    @action(methods=['POST'], detail=False, url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Delete many drugs in a background job"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = tasks.delete_drugs.delay(
+            user=request.user,
+            user_id=request.user.pk,
+            drug_ids=serializer.validated_data['ids'],
+        )
+
+        return Response(
+            serializers.JobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Report the status of the user's background jobs"""
+    serializer_class = serializers.JobSerializer
+    queryset = Job.objects.all()
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        """Retrieve the jobs of the authenticated user"""
+        return self.queryset.filter(user=self.request.user).order_by('-id')
+
+
+class UploadSessionViewSet(viewsets.GenericViewSet,
+                           mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin):
+    """Upload drug images in resumable chunks
+
+    Create a session for a drug and the image size, PUT the bytes in
+    order with an Upload-Offset header, then finalize. After a failure,
+    GET the session to learn the offset to resume from.
+    """
+    serializer_class = serializers.UploadSessionSerializer
+    queryset = UploadSession.objects.all()
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        """Retrieve the upload sessions of the authenticated user"""
+        return self.queryset.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if isinstance(response.data, dict) and 'offset' in response.data:
+            response['Upload-Offset'] = str(response.data['offset'])
+        return response
+
+    def update(self, request, pk=None):
+        """Append the request body to the upload at Upload-Offset"""
+        try:
+            pk = uuid.UUID(pk)
+        except ValueError:
+            raise exceptions.NotFound()
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            raise exceptions.ValidationError({
+                'detail': 'Upload-Offset and Content-Length are required.'
+            })
+        if not 0 < length <= settings.UPLOAD_CHUNK_MAX_BYTES:
+            raise exceptions.ValidationError({
+                'detail': 'Chunks must be 1 to %d bytes.'
+                % settings.UPLOAD_CHUNK_MAX_BYTES
+            })
+
+        # The row lock serializes chunks sent in parallel.
+        with transaction.atomic(using=router.db_for_write(UploadSession)):
+            session = self.get_queryset().select_for_update() \
+                .filter(pk=pk).first()
+            if session is None:
+                raise exceptions.NotFound()
+            if offset != session.offset:
+                raise uploads.OffsetConflict()
+            session.offset = uploads.append(session, request.stream, length)
+            session.save(update_fields=['offset', 'updated_at'])
+        return Response(self.get_serializer(session).data)
+
+    def destroy(self, request, pk=None):
+        """Abandon an upload"""
+        uploads.discard(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(methods=['POST'], detail=True)
+    def finalize(self, request, pk=None):
+        """Make the completed upload the drug's image"""
+        session = self.get_object()
+        drug = uploads.finalize(session, session.drug)
+        tasks.schedule_reencode(drug)
+        return Response(serializers.DrugImageSerializer(
+            drug, context=self.get_serializer_context()
+        ).data)
+
+
+class ChangesViewSet(viewsets.ViewSet):
+    """Feed of the user's catalog changes for syncing clients"""
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def initial(self, request, *args, **kwargs):
+        # A replica lagging behind the cursor would skip changes.
+        routers.use_replicas(False)
+        super().initial(request, *args, **kwargs)
+
+    def _since(self, cursor):
+        since = sync.from_cursor(cursor)
+        if sync.is_expired(since):
+            return None
+        return since
+
+    def _expired(self):
+        return Response(
+            {'detail': 'Cursor expired, sync from the start.'},
+            status=status.HTTP_410_GONE
+        )
+
+    def list(self, request):
+        """Return rows changed after the `since` cursor and the next one"""
+        query = serializers.ChangesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        since = sync.EPOCH
+        if 'since' in query.validated_data:
+            since = self._since(query.validated_data['since'])
+            if since is None:
+                return self._expired()
+        return Response(
+            sync.changes(request.user, since, query.validated_data['limit'])
+        )
+
+    @action(methods=['GET'], detail=False,
+            authentication_classes=(QueryTokenAuthentication,),
+            renderer_classes=(EventStreamRenderer, JSONRenderer))
+    def stream(self, request):
+        """Push change feed pages as server-sent events
+
+        Resumes after the Last-Event-ID header or `since` parameter,
+        otherwise starts from now.
+        """
+        cursor = request.META.get('HTTP_LAST_EVENT_ID') or \
+            request.query_params.get('since')
+        query = serializers.ChangesQuerySerializer(
+            data={} if cursor is None else {'since': cursor}
+        )
+        query.is_valid(raise_exception=True)
+        since = sync.upper_bound()
+        if 'since' in query.validated_data:
+            since = self._since(query.validated_data['since'])
+            if since is None:
+                return self._expired()
+        if not events.streams.acquire(0):
+            metrics.REQUESTS_SHED.inc(route=request.resolver_match.view_name)
+            response = Response(
+                {'detail': 'Too many open streams, retry later.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+            response['Retry-After'] = str(
+                settings.ADMISSION_RETRY_AFTER_SECONDS
+            )
+            return response
+        response = StreamingHttpResponse(
+            events.stream(request.user, since),
+            content_type='text/event-stream'
+        )
+        # The slot is held until the server closes the response.
+        response._closable_objects.append(events.Slot(events.streams))
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -3,8 +3,11 @@ from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import serializers
 
+from core.instrumentation import ProfiledSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(ProfiledSerializerMixin,
+                     serializers.ModelSerializer):
     """Serializer for the user object"""
 
     class Meta: